@@ -0,0 +1,253 @@
+"""
+Multi-mode analysis pipeline
+Runs any subset of the 8 analysis modes on one shared ImageContext and
+builds their responses. Used by the multi-mode and batch routers; the
+single-mode routers run their detector through detect_mode, so detections
+are mapped back to the uploaded image in one place.
+"""
+import asyncio
+import numpy as np
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from api.schemas import (
+    SpotsAnalysisResponse, WrinklesAnalysisResponse, TextureAnalysisResponse,
+    PoresAnalysisResponse, AnalysisStatistics, SeverityLevel
+)
+from api.core.model_loader import DETECTORS
+from api.utils.image_context import ImageContext
+from api.utils.frame_transform import FrameTransform
+
+logger = logging.getLogger(__name__)
+
+# All analysis modes, in response order (declared in the detector registry)
+ANALYSIS_MODES = tuple(DETECTORS)
+
+# Detection-box modes: (detection type, severity points per detection,
+# detector field reported as melanin_density, scale of that field to 0-1)
+_DETECTION_MODES = {
+    'spots': ('spot', 1.5, 'melanin_density', 1.0),
+    'pores': ('pore', 0.5, None, 1.0),
+    'uv_spots': ('uv_spot', 2.0, 'depth_score', 1.0),
+    'brown_spots': ('brown_spot', 1.8, 'melanin_intensity', 0.1),  # Detector reports 0-10
+    'red_areas': ('red_area', 4.0, 'redness_intensity', 1.0),
+    'porphyrins': ('porphyrin', 3.0, 'fluorescence_intensity', 1.0),
+}
+
+# Points per detected wrinkle
+_WRINKLE_SEVERITY = 3.0
+
+
+def parse_modes(modes: Optional[str]) -> List[str]:
+    """
+    Parse a comma-separated mode list (None or empty = all modes)
+    
+    Raises:
+        ValueError: On unknown mode names, or a list naming no mode (",")
+    """
+    if not modes or not modes.strip():
+        return list(ANALYSIS_MODES)
+    
+    requested = [m.strip().lower().replace('-', '_') for m in modes.split(',') if m.strip()]
+    if not requested:
+        raise ValueError(f"No mode given. Valid modes: {', '.join(ANALYSIS_MODES)}")
+    unknown = [m for m in requested if m not in ANALYSIS_MODES]
+    if unknown:
+        raise ValueError(
+            f"Unknown mode(s): {', '.join(unknown)}. Valid modes: {', '.join(ANALYSIS_MODES)}"
+        )
+    # Keep canonical order, drop duplicates
+    return [m for m in ANALYSIS_MODES if m in requested]
+
+
+async def run_detectors(
+    model_loader,
+    context: ImageContext,
+    modes: Sequence[str] = ANALYSIS_MODES,
+    confidence_threshold: float = 0.5,
+    transform: Optional[FrameTransform] = None
+) -> Dict[str, Any]:
+    """
+    Run the requested detectors in parallel on a shared image context
+    
+    Args:
+        transform: Maps detection boxes from the analysis frame back to the
+            uploaded image (None = keep frame coordinates)
+    
+    Returns:
+        Raw detector output per mode (texture: (metrics dict, roughness
+        heatmap in frame coordinates),
+        red_areas: (detections, heatmap in frame coordinates),
+        others: detection list)
+    """
+    tasks = [_detect(model_loader, context, mode, confidence_threshold, transform) for mode in modes]
+    results = await asyncio.gather(*tasks)
+    return dict(results)
+
+
+async def iter_detectors(
+    model_loader,
+    context: ImageContext,
+    modes: Sequence[str] = ANALYSIS_MODES,
+    confidence_threshold: float = 0.5,
+    transform: Optional[FrameTransform] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Run the requested detectors in parallel, yielding (mode, raw output)
+    as each one finishes (fastest first)
+    
+    Detectors still running when the consumer stops iterating are cancelled.
+    """
+    tasks = [
+        asyncio.ensure_future(_detect(model_loader, context, mode, confidence_threshold, transform))
+        for mode in modes
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def detect_mode(
+    model_loader,
+    context,
+    mode: str,
+    confidence_threshold: float = 0.5,
+    transform: Optional[FrameTransform] = None
+) -> Any:
+    """
+    Run one detector and map its detections to the uploaded image
+    
+    Args:
+        context: ImageContext (or uint8 RGB analysis frame)
+        transform: Frame -> original mapping from prepare_image
+            (None = keep frame coordinates)
+    
+    Returns:
+        Raw detector output (see run_detectors); heatmaps stay in frame
+        coordinates (FrameTransform.warp_to_original)
+    """
+    model = await model_loader.get(mode)
+    if mode == 'texture':
+        return await model.analyze(context)
+    
+    result = await model.detect(context, confidence_threshold)
+    if transform is None:
+        return result
+    if isinstance(result, tuple):
+        detections, heatmap = result
+        return transform.map_detections(detections), heatmap
+    return transform.map_detections(result)
+
+
+async def _detect(
+    model_loader,
+    context: ImageContext,
+    mode: str,
+    confidence_threshold: float,
+    transform: Optional[FrameTransform]
+) -> Tuple[str, Any]:
+    return mode, await detect_mode(model_loader, context, mode, confidence_threshold, transform)
+
+
+def _severity_level(score: float) -> SeverityLevel:
+    if score >= 60:
+        return SeverityLevel.SEVERE
+    if score >= 30:
+        return SeverityLevel.MODERATE
+    return SeverityLevel.MILD
+
+
+def _statistics(detections: List[Dict[str, Any]], severity: float) -> AnalysisStatistics:
+    avg_conf = float(np.mean([d['confidence'] for d in detections])) if detections else 0.0
+    return AnalysisStatistics(
+        total_count=len(detections),
+        average_confidence=round(avg_conf, 3),
+        severity_score=round(severity, 1),
+        severity_level=_severity_level(severity)
+    )
+
+
+def texture_response(metrics: Dict[str, Any], dimensions: Dict[str, int], **fields) -> TextureAnalysisResponse:
+    """TextureAnalysisResponse from TextureAnalyzer metrics (zone scores are a separate field)"""
+    return TextureAnalysisResponse(
+        success=True,
+        metrics={k: v for k, v in metrics.items() if k != 'zone_scores'},
+        smoothness_score=round(metrics['smoothness_score'], 1),
+        roughness_score=round(metrics['roughness_score'], 1),
+        zone_scores=metrics.get('zone_scores'),
+        image_dimensions=dimensions,
+        **fields
+    )
+
+
+def build_mode_response(mode: str, raw: Any, dimensions: Dict[str, int]) -> Tuple[Any, float]:
+    """
+    Build the response model for one mode from its raw detector output
+    
+    Returns:
+        (response, health score 0-100 where higher = healthier skin)
+    """
+    if mode == 'texture':
+        # Roughness heatmap is not part of this response
+        metrics, _ = raw
+        response = texture_response(metrics, dimensions)
+        return response, metrics['overall_score']
+    
+    # Red areas detector also returns a heatmap (not part of this response)
+    detections = raw[0] if isinstance(raw, tuple) else raw
+    
+    if mode == 'wrinkles':
+        severity = min(100, len(detections) * _WRINKLE_SEVERITY) if detections else 0.0
+        response = WrinklesAnalysisResponse(
+            success=True,
+            detections=detections,
+            statistics=_statistics(detections, severity),
+            image_dimensions=dimensions
+        )
+        return response, max(0, 100 - severity)
+    
+    detection_type, points, density_field, density_scale = _DETECTION_MODES[mode]
+    severity = min(100, len(detections) * points) if detections else 0.0
+    boxes = [
+        {
+            "id": i,
+            "type": detection_type,
+            "bbox": d['bbox'],
+            "confidence": d['confidence'],
+            "size_mm": d.get('size_mm', 0),
+            "melanin_density": min(1.0, d.get(density_field, 0) * density_scale) if density_field else 0
+        }
+        for i, d in enumerate(detections)
+    ]
+    
+    response_class = PoresAnalysisResponse if mode == 'pores' else SpotsAnalysisResponse
+    response = response_class(
+        success=True,
+        detections=boxes,
+        statistics=_statistics(detections, severity),
+        image_dimensions=dimensions
+    )
+    return response, max(0, 100 - severity)
+
+
+def build_mode_responses(
+    raw_results: Dict[str, Any],
+    dimensions: Dict[str, int]
+) -> Tuple[Dict[str, Any], float]:
+    """
+    Build responses for every mode that ran
+    
+    Returns:
+        (response per mode, overall score weighting all modes that ran equally)
+    """
+    responses = {}
+    health_scores = []
+    for mode, raw in raw_results.items():
+        responses[mode], health = build_mode_response(mode, raw, dimensions)
+        health_scores.append(health)
+    
+    overall_score = float(np.mean(health_scores)) if health_scores else 0.0
+    return responses, overall_score
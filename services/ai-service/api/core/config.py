@@ -1,6 +1,9 @@
 """
 Configuration settings for AI Analysis Service
 """
+import os
+import sys
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 from typing import List
 
@@ -25,11 +28,84 @@ class Settings(BaseSettings):
     WRINKLE_MODEL_PATH: str = "wrinkle_detector.pth"
     TEXTURE_MODEL_PATH: str = "texture_analyzer.pth"
     PORES_MODEL_PATH: str = "pores_detector.pth"
+    UV_SPOTS_MODEL_PATH: str = "uv_spots_model.pth"
+    BROWN_SPOTS_MODEL_PATH: str = "brown_spots_model.pth"
+    RED_AREAS_MODEL_PATH: str = "red_areas_model.pth"
+    PORPHYRINS_MODEL_PATH: str = "porphyrins_model.pth"
+    FACE_DETECTOR_MODEL_PATH: str = "face_detection_yunet_2023mar.onnx"  # YuNet (optional)
+    
+    # Modes whose detector is loaded at startup: "all", "none" or a
+    # comma-separated list (e.g. "spots,pores"); the rest load on first use
+    PRELOAD_MODES: str = "all"
+    
+    # Precomputed lookup tables (memory-mapped, shared across processes)
+    COLOR_LUT_DIR: str = "./ml_models/cache"
     
     # Processing
-    MAX_IMAGE_SIZE: int = 2048
-    MIN_IMAGE_SIZE: int = 512
+    MAX_IMAGE_SIZE: int = 2048  # Longest side images are decoded to (larger uploads are downscaled)
+    MIN_IMAGE_SIZE: int = 512  # Shortest side accepted
+    MAX_IMAGE_PIXELS: int = 100_000_000  # Larger uploads are refused (decompression bombs)
     CONFIDENCE_THRESHOLD: float = 0.5
+    SKIN_ROI_ENABLED: bool = True  # Restrict detectors to the skin region of the frame
+    FACE_ALIGNMENT_ENABLED: bool = True  # Crop/level the face before analysis
+    PAD_TO_SQUARE: bool = False  # Letterbox the analysis frame (False = native aspect ratio)
+    
+    # Visualization output (overridable per request)
+    VISUALIZATION_FORMAT: str = "png"  # png, jpeg or webp
+    VISUALIZATION_QUALITY: int = 85  # JPEG/WebP quality (1-100)
+    VISUALIZATION_PNG_COMPRESSION: int = 3  # PNG compression level (0-9)
+    VISUALIZATION_MAX_DIMENSION: int = 0  # Longest side of the output (0 = image size)
+    
+    # Concurrency (0 = this process's share of the CPU cores: all of them,
+    # or cores / WEB_CONCURRENCY under gunicorn)
+    ANALYSIS_WORKERS: int = 0
+    
+    # Network inference: concurrent requests per mode are micro-batched
+    INFERENCE_MAX_BATCH_SIZE: int = 8
+    INFERENCE_MAX_WAIT_MS: float = 5.0  # How long a batch waits to fill
+    INFERENCE_THREADS: int = 0  # torch / ONNX Runtime intra-op threads (0 = share of the cores, as above)
+    INFERENCE_BACKEND: str = "onnx"  # onnx, onnx-int8 (files from export_onnx.py) or torch (requirements-export.txt)
+    INFERENCE_BACKENDS: str = ""  # Per-mode overrides, e.g. "spots=onnx-int8,pores=onnx"
+    WEIGHTS_MMAP: bool = True  # Memory-map .pth weights (shared page cache, lazy paging)
+    
+    @field_validator('ANALYSIS_WORKERS', 'INFERENCE_THREADS')
+    @classmethod
+    def _default_thread_count(cls, value: int) -> int:
+        """0 = split the cores between the gunicorn workers (WEB_CONCURRENCY)"""
+        if value > 0:
+            return value
+        cores = os.cpu_count() or 1
+        processes = int(os.environ.get('WEB_CONCURRENCY') or 0)
+        if not processes:
+            # gunicorn.conf.py starts one worker per core by default
+            processes = cores if 'gunicorn' in sys.modules else 1
+        return max(1, cores // processes)
+    
+    def inference_backend(self, mode: str) -> str:
+        """Inference backend of a mode (INFERENCE_BACKENDS override or INFERENCE_BACKEND)"""
+        for entry in self.INFERENCE_BACKENDS.split(','):
+            key, _, backend = entry.partition('=')
+            if key.strip() == mode and backend.strip():
+                return backend.strip().lower()
+        return self.INFERENCE_BACKEND.strip().lower()
+    
+    # Startup warmup: synthetic uploads of these sizes (longest side, px)
+    # run through every preloaded mode before /ready reports ready
+    WARMUP_ENABLED: bool = True
+    WARMUP_SIZES: str = "512,1024,2048"
+    
+    @property
+    def warmup_sizes_list(self) -> List[int]:
+        """Parse WARMUP_SIZES string to list"""
+        return [int(size) for size in self.WARMUP_SIZES.split(',') if size.strip()]
+    
+    # Result cache (keyed by a hash of the uploaded bytes; 0 MB disables)
+    RESULT_CACHE_MAX_MB: int = 256
+    RESULT_CACHE_TTL_SECONDS: int = 3600
+    
+    # Batch analysis
+    BATCH_MAX_IMAGES: int = 20
+    BATCH_MAX_IN_FLIGHT: int = 4  # Images decoded/analyzed concurrently
     
     # GPU
     USE_GPU: bool = False
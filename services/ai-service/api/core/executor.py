@@ -0,0 +1,62 @@
+"""
+Worker pool for CPU-bound analysis work
+Detectors are pure OpenCV/NumPy code, so awaiting them directly would run
+them one after another on the event loop. Everything heavy is dispatched
+to a bounded thread pool instead (OpenCV releases the GIL while it works).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from api.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_worker_count() -> int:
+    """Number of analysis threads (ANALYSIS_WORKERS, this process's share of the cores by default)"""
+    if settings.ANALYSIS_WORKERS > 0:
+        return settings.ANALYSIS_WORKERS
+    return os.cpu_count() or 1
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get (and lazily create) the shared analysis thread pool"""
+    global _executor
+    if _executor is None:
+        workers = get_worker_count()
+        _executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="analysis"
+        )
+        logger.info(f"🧵 Analysis worker pool started with {workers} threads")
+    return _executor
+
+
+async def run_in_worker(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking function on the analysis pool without blocking the event loop
+    
+    The caller's context variables are carried into the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(),
+        partial(context.run, func, *args, **kwargs)
+    )
+
+
+def shutdown_executor(wait: bool = True):
+    """Stop the analysis pool (called on application shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+        logger.info("🧵 Analysis worker pool stopped")
@@ -0,0 +1,388 @@
+"""
+Micro-batched model inference
+Learned detectors run their network through an InferenceEngine. Concurrent
+requests for the same mode are queued and run as one micro-batch (up to
+INFERENCE_MAX_BATCH_SIZE inputs, waiting at most INFERENCE_MAX_WAIT_MS for
+the batch to fill) instead of one batch-size-1 forward pass per request.
+Each caller gets its own slice of the output back.
+
+A detector loads an engine (load_inference_engine) only once its detect
+path consumes the network output; until then its weights stay on disk
+(ModelLoader logs a warning when they exist).
+
+Each mode runs on PyTorch or ONNX Runtime (INFERENCE_BACKEND, with
+per-mode INFERENCE_BACKENDS overrides); the ONNX backends never import
+torch. Both runtimes are optional: without the runtime or the weights file
+in MODELS_DIR, load_inference_engine returns None and the detector keeps
+its OpenCV pipeline.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from api.core.config import settings
+from api.core.executor import run_in_worker
+from api.core.metrics import registry
+from api.core.timing import stage
+
+logger = logging.getLogger(__name__)
+
+# Inputs per executed micro-batch
+BATCH_SIZE = registry.histogram(
+    'ai_service_inference_batch_size',
+    'Inputs per inference micro-batch',
+    ['mode'],
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+_batchers: List['MicroBatcher'] = []
+_torch_configured = False
+_torch_lock = threading.Lock()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent calls into batches for a function that takes a list
+    of inputs and returns one output per input, in order
+    
+    Example:
+        batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=5, name='spots')
+        output = await batcher.submit(frame)  # this caller's slice of the batch
+    
+    A batch is dispatched when it is full or max_wait_ms after its first
+    input arrived. Batches run one at a time on the analysis worker pool;
+    requests arriving meanwhile form the next batch.
+    """
+    
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        name: str
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        _batchers.append(self)
+    
+    async def submit(self, item: Any) -> Any:
+        """Queue one input and wait for its output (recorded as the "infer.<name>" stage)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # First use (or a new event loop, e.g. in tests). The dispatch
+            # task outlives this request, so it must not inherit its
+            # context (stage timer)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = contextvars.Context().run(loop.create_task, self._serve())
+        
+        future = loop.create_future()
+        with stage(f"infer.{self.name}"):
+            self._queue.put_nowait((item, future))
+            return await future
+    
+    async def _next_batch(self) -> List[Tuple[Any, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                # Take whatever is already waiting, without blocking
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Callers that gave up (e.g. a cancelled multi-mode stream) are skipped
+        return [(item, future) for item, future in batch if not future.done()]
+    
+    async def _serve(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            
+            BATCH_SIZE.observe(len(batch), mode=self.name)
+            try:
+                outputs = await run_in_worker(self.run_batch, [item for item, _ in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f"{self.name}: {len(outputs)} outputs for a batch of {len(batch)}")
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+    
+    async def close(self):
+        """Stop the dispatch task (queued callers are cancelled)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+        self._task = None
+
+
+async def close_batchers():
+    """Stop every micro-batcher (called on application shutdown)"""
+    for batcher in list(_batchers):
+        await batcher.close()
+
+
+def _configure_torch(torch):
+    """Intra-op threads for inference (once per process)"""
+    global _torch_configured
+    with _torch_lock:
+        if _torch_configured:
+            return
+        threads = settings.INFERENCE_THREADS or os.cpu_count() or 1
+        torch.set_num_threads(threads)
+        try:
+            # Batches already run one at a time per mode; extra inter-op
+            # threads would only oversubscribe the cores
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already fixed once inter-op work has started
+        _torch_configured = True
+        logger.info(f"🔥 torch inference: {threads} intra-op threads")
+
+
+def network_input(frame: np.ndarray) -> np.ndarray:
+    """Analysis frame (uint8 RGB, HWC) -> network input (float32 CHW in [0, 1])"""
+    return np.ascontiguousarray(frame.transpose(2, 0, 1), dtype=np.float32) / 255.0
+
+
+def _split_output(output: Any, count: int) -> List[Any]:
+    """Split a batched output (array, tuple/list or dict of arrays) per input"""
+    if isinstance(output, (tuple, list)):
+        parts = [_split_output(value, count) for value in output]
+        return [type(output)(part[i] for part in parts) for i in range(count)]
+    if isinstance(output, dict):
+        parts = {key: _split_output(value, count) for key, value in output.items()}
+        return [{key: part[i] for key, part in parts.items()} for i in range(count)]
+    return [output[i] for i in range(count)]
+
+
+class InferenceEngine:
+    """
+    Micro-batched inference for one mode's network (backend-independent part)
+    
+    Inputs are float32 CHW arrays (see network_input); inputs of the same
+    shape are stacked into one forward pass. Subclasses implement _forward
+    for their runtime.
+    """
+    
+    backend = ''
+    
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Mode name (batch metrics, stage names)
+        """
+        self.name = name
+        self.batcher = MicroBatcher(
+            self.run_batch,
+            max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+            name=name
+        )
+    
+    async def infer(self, array: np.ndarray) -> Any:
+        """Run the network on one input (batched with concurrent callers)"""
+        return await self.batcher.submit(array)
+    
+    def _forward(self, batch: np.ndarray) -> Any:
+        """Run the network on an (N, C, H, W) batch; outputs as NumPy arrays"""
+        raise NotImplementedError
+    
+    def run_batch(self, inputs: List[np.ndarray]) -> List[Any]:
+        """Forward pass over a list of inputs, one output per input (in order)"""
+        # Analysis frames keep their aspect ratio, so shapes can differ
+        groups: "OrderedDict[tuple, List[int]]" = OrderedDict()
+        for index, array in enumerate(inputs):
+            groups.setdefault((array.shape, array.dtype.str), []).append(index)
+        
+        outputs: List[Any] = [None] * len(inputs)
+        for indices in groups.values():
+            batch = np.stack([inputs[i] for i in indices])
+            for index, output in zip(indices, _split_output(self._forward(batch), len(indices))):
+                outputs[index] = output
+        return outputs
+
+
+def _torch_to_numpy(output: Any) -> Any:
+    if isinstance(output, (tuple, list)):
+        return type(output)(_torch_to_numpy(value) for value in output)
+    if isinstance(output, dict):
+        return {key: _torch_to_numpy(value) for key, value in output.items()}
+    return output.detach().cpu().numpy()
+
+
+class TorchInferenceEngine(InferenceEngine):
+    """Eager PyTorch / TorchScript network, run under torch.inference_mode"""
+    
+    backend = 'torch'
+    
+    def __init__(self, module, device: str, name: str):
+        """
+        Args:
+            module: torch.nn.Module / TorchScript module in eval mode
+            device: torch device string ('cpu', 'cuda:0', ...)
+        """
+        super().__init__(name)
+        self.module = module
+        self.device = device
+    
+    def _forward(self, batch: np.ndarray) -> Any:
+        import torch
+        with torch.inference_mode():
+            return _torch_to_numpy(self.module(torch.from_numpy(batch).to(self.device)))
+
+
+class OnnxInferenceEngine(InferenceEngine):
+    """ONNX Runtime session (FP32 or INT8-quantized export, see export_onnx.py)"""
+    
+    backend = 'onnx'
+    
+    def __init__(self, session, name: str):
+        """
+        Args:
+            session: onnxruntime.InferenceSession with one input
+        """
+        super().__init__(name)
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+    
+    def _forward(self, batch: np.ndarray) -> Any:
+        outputs = self.session.run(None, {self.input_name: batch})
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+
+def load_torch_module(path: Path, device: str = 'cpu'):
+    """
+    Load a TorchScript archive or pickled nn.Module (eval mode; None if the
+    file only holds a state_dict)
+    
+    Pickled modules are memory-mapped on CPU (WEIGHTS_MMAP): weights are
+    paged in from the page cache on first use instead of being copied into
+    each process's heap, so processes on one node (and restarts) share them.
+    This needs the zip format of torch.save; older files are loaded fully
+    (convert them with convert_weights.py).
+    """
+    import torch
+    
+    try:
+        module = torch.jit.load(str(path), map_location=device)
+    except RuntimeError:
+        # Not a TorchScript archive
+        mmap = settings.WEIGHTS_MMAP and device == 'cpu'
+        try:
+            module = torch.load(str(path), map_location=device, weights_only=False, mmap=mmap)
+        except RuntimeError:
+            if not mmap:
+                raise
+            logger.warning(f"⚠️ {path.name} cannot be memory-mapped (legacy format?) - loading it into memory")
+            module = torch.load(str(path), map_location=device, weights_only=False)
+    
+    if not isinstance(module, torch.nn.Module):
+        return None
+    return module.eval()
+
+
+def _load_torch(path: Path, device: str, name: str) -> Optional[InferenceEngine]:
+    try:
+        import torch
+    except ImportError:
+        logger.warning(f"⚠️ {path.name} found but PyTorch is not installed - {name} stays CV-based")
+        return None
+    
+    _configure_torch(torch)
+    module = load_torch_module(path, device)
+    if module is None:
+        logger.warning(f"⚠️ {path.name} is not a model (state_dict only?) - {name} stays CV-based")
+        return None
+    return TorchInferenceEngine(module, device, name)
+
+
+def _load_onnx(path: Path, device: str, name: str) -> Optional[InferenceEngine]:
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        logger.warning(f"⚠️ {path.name} found but onnxruntime is not installed - {name} stays CV-based")
+        return None
+    
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = settings.INFERENCE_THREADS or os.cpu_count() or 1
+    options.inter_op_num_threads = 1
+    
+    providers = ['CPUExecutionProvider']
+    if device.startswith('cuda') and 'CUDAExecutionProvider' in ort.get_available_providers():
+        device_id = int(device.partition(':')[2] or 0)
+        providers.insert(0, ('CUDAExecutionProvider', {'device_id': device_id}))
+    
+    session = ort.InferenceSession(str(path), sess_options=options, providers=providers)
+    return OnnxInferenceEngine(session, name)
+
+
+# Weights file per backend, derived from the mode's .pth path
+BACKEND_SUFFIXES = {
+    'torch': '.pth',
+    'onnx': '.onnx',
+    'onnx-int8': '.int8.onnx',
+}
+
+
+def backend_path(model_path: str, backend: str) -> Path:
+    """Weights file of a backend (spot_detector.pth -> spot_detector.int8.onnx, ...)"""
+    path = Path(model_path)
+    return path.with_name(path.stem + BACKEND_SUFFIXES[backend])
+
+
+def load_inference_engine(model_path: str, device: str, name: str) -> Optional[InferenceEngine]:
+    """
+    Load a detector network for batched inference on the mode's backend
+    (INFERENCE_BACKEND / INFERENCE_BACKENDS)
+    
+    torch accepts TorchScript archives and pickled nn.Module files; onnx
+    and onnx-int8 load the files written by export_onnx.py and never
+    import torch. Returns None (detector stays on its OpenCV pipeline) when
+    the file does not exist, the runtime is not installed, or a .pth only
+    holds a state_dict.
+    """
+    backend = settings.inference_backend(name)
+    if backend not in BACKEND_SUFFIXES:
+        raise ValueError(f"Unknown inference backend for {name}: {backend} (valid: {', '.join(BACKEND_SUFFIXES)})")
+    
+    path = backend_path(model_path, backend)
+    if not path.is_file():
+        return None
+    
+    loader = _load_torch if backend == 'torch' else _load_onnx
+    engine = loader(path, device, name)
+    if engine is not None:
+        logger.info(f"✅ {name} network loaded from {path.name} ({backend}, {device})")
+    return engine
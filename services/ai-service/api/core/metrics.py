@@ -0,0 +1,116 @@
+"""
+Prometheus metrics
+Minimal in-process histograms rendered in the Prometheus text exposition
+format at /metrics (no client library needed).
+"""
+import bisect
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Histogram:
+    """Labeled histogram with fixed buckets (thread-safe)"""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        """Record one observation (value in seconds)"""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            counts, total = series
+            counts[index] += 1
+            total[0] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total[0]) for key, (counts, total) in sorted(self._series.items())]
+        
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Histograms plus callbacks for values owned elsewhere (e.g. cache counters)"""
+    
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+        self._lock = threading.Lock()
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str],
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, documentation, labelnames, buckets)
+            return self._histograms[name]
+    
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """Add a callable returning extra exposition lines at scrape time"""
+        with self._lock:
+            self._collectors.append(collector)
+    
+    def render(self) -> str:
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+        for histogram in list(self._histograms.values()):
+            lines += histogram.render()
+        for collector in list(self._collectors):
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# Time spent in each stage of a request (decode, preprocess, detect, encode, ...)
+STAGE_DURATION = registry.histogram(
+    'ai_service_stage_duration_seconds',
+    'Duration of one request stage',
+    ['endpoint', 'stage', 'mode']
+)
+
+# End-to-end request duration
+REQUEST_DURATION = registry.histogram(
+    'ai_service_request_duration_seconds',
+    'Duration of HTTP requests',
+    ['endpoint', 'method', 'status']
+)
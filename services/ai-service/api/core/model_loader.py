@@ -1,13 +1,17 @@
 """
 ML Model Loader - Manages all detection models
+Every analysis mode is declared once in DETECTORS. Detectors are loaded on
+first use; PRELOAD_MODES picks the ones loaded at startup, so a deployment
+that only serves some modes never pays for (or holds) the others.
 """
+import asyncio
 import logging
-from typing import Optional
+from typing import Any, Dict, Iterable, List, NamedTuple
 
 from api.models import (
-    SpotDetector, 
-    WrinkleDetector, 
-    TextureAnalyzer, 
+    SpotDetector,
+    WrinkleDetector,
+    TextureAnalyzer,
     PoresDetector,
     UVSpotDetector,
     BrownSpotDetector,
@@ -15,157 +19,124 @@ from api.models import (
     PorphyrinDetector
 )
 from api.core.config import settings
+from api.core.inference import BACKEND_SUFFIXES, backend_path
 
 logger = logging.getLogger(__name__)
 
+
+class DetectorSpec(NamedTuple):
+    """How to build one mode's detector"""
+    detector_class: type
+    weights_setting: str  # settings attribute holding the weights file name (in MODELS_DIR)
+    label: str
+
+
+# All analysis modes, in response order
+DETECTORS: Dict[str, DetectorSpec] = {
+    'spots': DetectorSpec(SpotDetector, 'SPOT_MODEL_PATH', 'Spots Detection'),
+    'wrinkles': DetectorSpec(WrinkleDetector, 'WRINKLE_MODEL_PATH', 'Wrinkles Detection'),
+    'texture': DetectorSpec(TextureAnalyzer, 'TEXTURE_MODEL_PATH', 'Texture Analysis'),
+    'pores': DetectorSpec(PoresDetector, 'PORES_MODEL_PATH', 'Pores Detection'),
+    'uv_spots': DetectorSpec(UVSpotDetector, 'UV_SPOTS_MODEL_PATH', 'UV Spots Detection'),
+    'brown_spots': DetectorSpec(BrownSpotDetector, 'BROWN_SPOTS_MODEL_PATH', 'Brown Spots Detection'),
+    'red_areas': DetectorSpec(RedAreaDetector, 'RED_AREAS_MODEL_PATH', 'Red Areas Detection'),
+    'porphyrins': DetectorSpec(PorphyrinDetector, 'PORPHYRINS_MODEL_PATH', 'Porphyrins Detection'),
+}
+
+
 class ModelLoader:
-    """Load and manage all ML models"""
+    """Load and manage all ML models (one detector per mode, loaded on demand)"""
     
     def __init__(self):
         self.device = 'cpu'  # Will be updated based on GPU availability
-        
-        # Original 4 models
-        self.spots_model: Optional[SpotDetector] = None
-        self.wrinkles_model: Optional[WrinkleDetector] = None
-        self.texture_model: Optional[TextureAnalyzer] = None
-        self.pores_model: Optional[PoresDetector] = None
-        
-        # New 4 models for complete 8-mode analysis
-        self.uv_spots_model: Optional[UVSpotDetector] = None
-        self.brown_spots_model: Optional[BrownSpotDetector] = None
-        self.red_areas_model: Optional[RedAreaDetector] = None
-        self.porphyrins_model: Optional[PorphyrinDetector] = None
-        
+        self.models: Dict[str, Any] = {}  # mode -> loaded detector
+        self._locks = {mode: asyncio.Lock() for mode in DETECTORS}
         self.is_loaded = False
     
+    def _select_device(self):
+        if settings.USE_GPU:
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    self.device = f'cuda:{settings.GPU_DEVICE}'
+                    logger.info(f"🎮 Using GPU: {torch.cuda.get_device_name(0)}")
+                else:
+                    self.device = 'cpu'
+                    logger.info("🖥️ GPU requested but not available, using CPU")
+            except ImportError:
+                self.device = 'cpu'
+                logger.info("🖥️ PyTorch not installed, using CPU")
+        else:
+            logger.info("🖥️ Using CPU (GPU disabled in settings)")
+    
     async def load_all_models(self):
-        """Load all models on startup"""
+        """Pick the device and preload the modes in PRELOAD_MODES (on startup)"""
         try:
-            logger.info("📦 Loading AI models...")
+            self._select_device()
             
-            # Determine device
-            if settings.USE_GPU:
-                try:
-                    import torch
-                    if torch.cuda.is_available():
-                        self.device = f'cuda:{settings.GPU_DEVICE}'
-                        logger.info(f"🎮 Using GPU: {torch.cuda.get_device_name(0)}")
-                    else:
-                        self.device = 'cpu'
-                        logger.info("🖥️ GPU requested but not available, using CPU")
-                except ImportError:
-                    self.device = 'cpu'
-                    logger.info("🖥️ PyTorch not installed, using CPU")
-            else:
-                logger.info("🖥️ Using CPU (GPU disabled in settings)")
-            
-            # Load Spots Detection model
-            logger.info("📦 Loading Spots Detection model...")
-            self.spots_model = SpotDetector(self.device)
-            await self.spots_model.load_model(
-                f"{settings.MODELS_DIR}/{settings.SPOT_MODEL_PATH}"
-            )
-            
-            # Load Wrinkles Detection model
-            logger.info("📦 Loading Wrinkles Detection model...")
-            self.wrinkles_model = WrinkleDetector(self.device)
-            await self.wrinkles_model.load_model(
-                f"{settings.MODELS_DIR}/{settings.WRINKLE_MODEL_PATH}"
-            )
-            
-            # Load Texture Analysis model
-            logger.info("📦 Loading Texture Analysis model...")
-            self.texture_model = TextureAnalyzer(self.device)
-            await self.texture_model.load_model(
-                f"{settings.MODELS_DIR}/{settings.TEXTURE_MODEL_PATH}"
-            )
-            
-            # Load Pores Detection model
-            logger.info("📦 Loading Pores Detection model...")
-            self.pores_model = PoresDetector(self.device)
-            await self.pores_model.load_model(
-                f"{settings.MODELS_DIR}/{settings.PORES_MODEL_PATH}"
-            )
-            
-            # Load UV Spots Detection model
-            logger.info("📦 Loading UV Spots Detection model...")
-            self.uv_spots_model = UVSpotDetector(self.device)
-            await self.uv_spots_model.load_model(
-                f"{settings.MODELS_DIR}/uv_spots_model.pth"
-            )
-            
-            # Load Brown Spots Detection model
-            logger.info("📦 Loading Brown Spots Detection model...")
-            self.brown_spots_model = BrownSpotDetector(self.device)
-            await self.brown_spots_model.load_model(
-                f"{settings.MODELS_DIR}/brown_spots_model.pth"
-            )
-            
-            # Load Red Areas Detection model
-            logger.info("📦 Loading Red Areas Detection model...")
-            self.red_areas_model = RedAreaDetector(self.device)
-            await self.red_areas_model.load_model(
-                f"{settings.MODELS_DIR}/red_areas_model.pth"
-            )
-            
-            # Load Porphyrins Detection model
-            logger.info("📦 Loading Porphyrins Detection model...")
-            self.porphyrins_model = PorphyrinDetector(self.device)
-            await self.porphyrins_model.load_model(
-                f"{settings.MODELS_DIR}/porphyrins_model.pth"
-            )
+            modes = self._preload_modes()
+            logger.info(f"📦 Preloading AI models: {', '.join(modes) or 'none (all load on first use)'}")
+            await self.load_models(modes)
             
             self.is_loaded = True
-            logger.info("✅ All 8 models loaded successfully!")
-            
+            logger.info(f"✅ {len(self.models)}/{len(DETECTORS)} models loaded")
+        
         except Exception as e:
             logger.error(f"❌ Error loading models: {e}")
             raise
     
-    def get_spot_model(self) -> SpotDetector:
-        """Get spots detection model"""
-        if not self.spots_model:
-            raise RuntimeError("Spots model not loaded")
-        return self.spots_model
-    
-    def get_wrinkle_model(self) -> WrinkleDetector:
-        """Get wrinkles detection model"""
-        if not self.wrinkles_model:
-            raise RuntimeError("Wrinkles model not loaded")
-        return self.wrinkles_model
-    
-    def get_texture_model(self) -> TextureAnalyzer:
-        """Get texture analysis model"""
-        if not self.texture_model:
-            raise RuntimeError("Texture model not loaded")
-        return self.texture_model
+    @staticmethod
+    def _preload_modes() -> List[str]:
+        value = settings.PRELOAD_MODES.strip().lower()
+        if value == 'all':
+            return list(DETECTORS)
+        if value in ('', 'none'):
+            return []
+        return [mode.strip().replace('-', '_') for mode in value.split(',') if mode.strip()]
     
-    def get_pores_model(self) -> PoresDetector:
-        """Get pores detection model"""
-        if not self.pores_model:
-            raise RuntimeError("Pores model not loaded")
-        return self.pores_model
+    async def load_models(self, modes: Iterable[str]):
+        """Load the given modes' detectors (already loaded ones are skipped)"""
+        for mode in modes:
+            await self.get(mode)
     
-    def get_uv_spots_model(self) -> UVSpotDetector:
-        """Get UV spots detection model"""
-        if not self.uv_spots_model:
-            raise RuntimeError("UV spots model not loaded")
-        return self.uv_spots_model
-    
-    def get_brown_spots_model(self) -> BrownSpotDetector:
-        """Get brown spots detection model"""
-        if not self.brown_spots_model:
-            raise RuntimeError("Brown spots model not loaded")
-        return self.brown_spots_model
+    async def get(self, mode: str) -> Any:
+        """
+        Get a mode's detector, loading it on first use
+        
+        Raises:
+            ValueError: On unknown mode names
+        """
+        model = self.models.get(mode)
+        if model is not None:
+            return model
+        if mode not in DETECTORS:
+            raise ValueError(f"Unknown mode: {mode}. Valid modes: {', '.join(DETECTORS)}")
+        
+        async with self._locks[mode]:
+            model = self.models.get(mode)
+            if model is None:
+                spec = DETECTORS[mode]
+                logger.info(f"📦 Loading {spec.label} model...")
+                model = spec.detector_class(self.device)
+                model_path = f"{settings.MODELS_DIR}/{getattr(settings, spec.weights_setting)}"
+                await model.load_model(model_path)
+                self._warn_unused_weights(mode, model, model_path)
+                self.models[mode] = model
+            return model
     
-    def get_red_areas_model(self) -> RedAreaDetector:
-        """Get red areas detection model"""
-        if not self.red_areas_model:
-            raise RuntimeError("Red areas model not loaded")
-        return self.red_areas_model
+    @staticmethod
+    def _warn_unused_weights(mode: str, model: Any, model_path: str):
+        """Network weights are only loaded by detectors that use them (none yet)"""
+        if getattr(model, 'model', None) is not None:
+            return
+        paths = [backend_path(model_path, backend) for backend in BACKEND_SUFFIXES]
+        found = [path.name for path in paths if path.is_file()]
+        if found:
+            logger.warning(
+                f"⚠️ {', '.join(found)} found, but the {mode} detector has no network inference "
+                "path yet - not loaded, using its OpenCV pipeline"
+            )
     
-    def get_porphyrins_model(self) -> PorphyrinDetector:
-        """Get porphyrins detection model"""
-        if not self.porphyrins_model:
-            raise RuntimeError("Porphyrins model not loaded")
-        return self.porphyrins_model
+    def loaded_modes(self) -> List[str]:
+        """Modes whose detector is in memory, in response order"""
+        return [mode for mode in DETECTORS if mode in self.models]
@@ -0,0 +1,212 @@
+"""
+Content-addressed result cache
+The frontend often re-submits the same photo (re-renders, retries,
+switching between single-mode tabs). Results are cached in-process under
+a hash of the uploaded bytes plus the endpoint and its parameters, so a
+repeat upload skips decoding and analysis entirely.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from pydantic import BaseModel
+
+from api.core.config import settings
+from api.core.executor import run_in_worker
+from api.core.metrics import registry
+from api.core.timing import stage
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(contents: bytes, namespace: str, **params) -> str:
+    """
+    Cache key for an upload: BLAKE2b of the bytes + endpoint + parameters
+    
+    Args:
+        contents: Raw uploaded file bytes
+        namespace: Endpoint / mode name (e.g. "spots", "visualize/multi-mode")
+        **params: Parameters that change the result (confidence_threshold, ...)
+    """
+    digest = hashlib.blake2b(contents, digest_size=32).hexdigest()
+    return f"{namespace}:{digest}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+def _estimate_size(value: Any) -> int:
+    """Approximate memory held by a cached value (serialized size)"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, BaseModel):
+        return len(value.model_dump_json())
+    if isinstance(value, (tuple, list)):
+        return sum(_estimate_size(v) for v in value)
+    return len(json.dumps(value, default=str))
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a byte budget and per-entry TTL
+    
+    Cached values are shared between requests and must be treated as
+    read-only (copy pydantic models with model_copy before changing them).
+    """
+    
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        """
+        Args:
+            max_bytes: Total size budget (0 disables the cache)
+            ttl_seconds: Entry lifetime (0 = no expiry)
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None on a miss (or expired entry)"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            value, size, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    async def lookup(self, contents: bytes, namespace: str, **params) -> Tuple[str, Optional[Any]]:
+        """
+        Hash an upload on the worker pool and look it up
+        
+        Returns:
+            (cache key for a later put(), cached value or None)
+        """
+        if not self.enabled:
+            return "", None
+        with stage("cache"):
+            key = await run_in_worker(content_key, contents, namespace, **params)
+            return key, self.get(key)
+    
+    async def store(self, key: str, value: Any):
+        """put() on the worker pool (sizing serializes the value)"""
+        if self.enabled:
+            await run_in_worker(self.put, key, value)
+    
+    def put(self, key: str, value: Any, size: Optional[int] = None):
+        """
+        Store a value, evicting least recently used entries to fit the budget
+        
+        Args:
+            key: Key from content_key()
+            value: Result to cache (response model, bytes, ...)
+            size: Size in bytes (estimated from the serialized value if omitted)
+        """
+        if not self.enabled:
+            return
+        
+        if size is None:
+            size = _estimate_size(value)
+        if size > self.max_bytes:
+            logger.debug(f"Result too large to cache ({size} bytes)")
+            return
+        
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0
+        
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            
+            while self._entries and self._bytes + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+    
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+    
+    def clear(self):
+        """Drop all entries (metrics are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss metrics and current usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """Get the shared result cache (created from settings on first use)"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            max_bytes=settings.RESULT_CACHE_MAX_MB * 1024 * 1024,
+            ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS
+        )
+    return _result_cache
+
+
+def _prometheus_lines():
+    """Result cache counters for /metrics"""
+    if _result_cache is None:
+        return []
+    stats = _result_cache.stats()
+    lines = []
+    for name, kind, value, help_text in (
+        ('hits_total', 'counter', stats['hits'], 'Result cache hits'),
+        ('misses_total', 'counter', stats['misses'], 'Result cache misses'),
+        ('evictions_total', 'counter', stats['evictions'], 'Entries evicted to stay within the byte budget'),
+        ('expirations_total', 'counter', stats['expirations'], 'Entries dropped after their TTL'),
+        ('entries', 'gauge', stats['entries'], 'Cached results'),
+        ('bytes', 'gauge', stats['bytes'], 'Approximate bytes held by cached results'),
+    ):
+        metric = f"ai_service_result_cache_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {value}"]
+    return lines
+
+
+registry.register_collector(_prometheus_lines)
@@ -0,0 +1,208 @@
+"""
+Per-request stage timing
+Records how long each phase of a request takes (upload, decode,
+preprocess, each detector, response build, encoding, ...). The breakdown
+is sent back as a Server-Timing header, can be included in JSON
+responses, and is aggregated into the /metrics histograms.
+
+Stages recorded on the analysis worker pool land in the right request
+because run_in_worker carries the request's context into the worker.
+"""
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from api.core.metrics import STAGE_DURATION, REQUEST_DURATION
+
+
+class StageTimer:
+    """Stage durations of one request (thread-safe)"""
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []  # (name, seconds), in completion order
+        self.last_stage_end: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.stages.append((name, seconds))
+            self.last_stage_end = time.perf_counter()
+    
+    def totals_ms(self) -> Dict[str, float]:
+        """Total milliseconds per stage name (repeated stages, e.g. in a batch, are summed)"""
+        totals: Dict[str, float] = OrderedDict()
+        with self._lock:
+            for name, seconds in self.stages:
+                totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return {name: round(ms, 2) for name, ms in totals.items()}
+    
+    def server_timing(self, total_seconds: float) -> str:
+        """Server-Timing header value (https://www.w3.org/TR/server-timing/)"""
+        entries = [f"{name};dur={ms:.2f}" for name, ms in self.totals_ms().items()]
+        entries.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ', '.join(entries)
+
+
+_current_timer: contextvars.ContextVar[Optional[StageTimer]] = contextvars.ContextVar(
+    'stage_timer', default=None
+)
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    """Stage totals (ms) of the current request so far, or None outside a request"""
+    timer = _current_timer.get()
+    return timer.totals_ms() if timer is not None else None
+
+
+def record_stage(name: str, seconds: float):
+    """Record an already measured stage on the current request (no-op outside requests)"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a block as a request stage
+    
+    Example:
+        with stage("encode"):
+            success, buffer = cv2.imencode('.png', image)
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.record(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_stages():
+    """
+    Record stages outside an HTTP request (e.g. the startup warmup)
+    
+    Example:
+        with collect_stages() as timer:
+            await run_detectors(...)
+        timer.totals_ms()
+    """
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def timed_stage(name: str) -> Callable:
+    """Decorator recording every call of a function as a request stage"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _route_template(scope) -> Optional[str]:
+    """
+    Full path template of the matched route (e.g. '/api/visualize/single-mode/{mode}')
+    
+    Routes of included routers may only know their path relative to the
+    router prefix, so the prefix is recovered from the concrete request path.
+    """
+    route = scope.get('route')
+    template = getattr(route, 'path', None)
+    if not template:
+        return None
+    
+    try:
+        concrete = template.format(**scope.get('path_params', {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    
+    path = scope.get('path', '')
+    if concrete and path.endswith(concrete):
+        return path[:len(path) - len(concrete)] + template
+    return template
+
+
+def _split_stage(name: str) -> Tuple[str, str]:
+    """'detect.spots' -> ('detect', 'spots'); 'decode' -> ('decode', '')"""
+    stage_name, _, mode = name.partition('.')
+    return stage_name, mode
+
+
+class StageTimingMiddleware:
+    """
+    ASGI middleware that times every HTTP request
+    
+    - "upload" is the time until the request body has been received
+    - "respond" is the time from the last recorded stage to the response
+      start (FastAPI response validation and serialization)
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        timer = StageTimer()
+        token = _current_timer.set(timer)
+        status = {'code': 500}
+        
+        async def timed_receive():
+            message = await receive()
+            if message['type'] == 'http.request' and not message.get('more_body', False):
+                timer.record('upload', time.perf_counter() - timer.start)
+            return message
+        
+        async def timed_send(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                now = time.perf_counter()
+                if timer.last_stage_end is not None and timer.stages[-1][0] != 'upload':
+                    timer.record('respond', now - timer.last_stage_end)
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', timer.server_timing(now - timer.start))
+            await send(message)
+        
+        try:
+            await self.app(scope, timed_receive, timed_send)
+        finally:
+            _current_timer.reset(token)
+            self._observe(scope, timer, status['code'])
+    
+    @staticmethod
+    def _observe(scope, timer: StageTimer, status_code: int):
+        endpoint = _route_template(scope) or 'unmatched'
+        if endpoint in ('/metrics', '/health', '/ready'):
+            return
+        
+        for name, seconds in list(timer.stages):
+            stage_name, mode = _split_stage(name)
+            if not mode:
+                mode = scope.get('path_params', {}).get('mode', '')
+            STAGE_DURATION.observe(seconds, endpoint=endpoint, stage=stage_name, mode=mode)
+        
+        REQUEST_DURATION.observe(
+            time.perf_counter() - timer.start,
+            endpoint=endpoint, method=scope.get('method', ''), status=str(status_code)
+        )
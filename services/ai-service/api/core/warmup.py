@@ -0,0 +1,122 @@
+"""
+Startup warmup
+Without it, the first requests after a deploy pay for OpenCV's lazy
+initialization, worker thread spin-up and each detector's first run. The
+warmup pushes a synthetic face of every WARMUP_SIZES size through the same
+pipeline a request takes (decode, face crop, preprocess, every loaded
+detector, encode). /ready reports the service as ready only once it has
+finished, together with the per-stage warmup timings. A size that fails is
+retried with backoff; if it keeps failing the service becomes ready anyway
+(serving cold beats never serving) and /ready reports the error.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+import logging
+
+from api.core.analysis import run_detectors
+from api.core.config import settings
+from api.core.executor import run_in_worker
+from api.core.timing import collect_stages
+from api.utils import decode_upload, encode_image, prepare_image, make_synthetic_face, ImageContext
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ATTEMPTS = 3  # Per size
+RETRY_DELAY_SECONDS = 1.0  # Doubles after every failed attempt
+
+
+class WarmupState:
+    """Progress of the startup warmup (read by /ready)"""
+    
+    def __init__(self):
+        self.status = 'pending'  # pending, running, complete, failed, disabled
+        self.modes = []
+        self.sizes: Dict[str, Dict[str, float]] = {}  # "1024px" -> stage totals (ms)
+        self.total_ms: Optional[float] = None
+        self.error: Optional[str] = None
+    
+    @property
+    def ready(self) -> bool:
+        # A failed warmup (after its retries) leaves the service cold, not down
+        return self.status in ('complete', 'failed', 'disabled')
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "modes": self.modes,
+            "total_ms": self.total_ms,
+            "sizes": self.sizes,
+            "error": self.error,
+        }
+
+
+_state = WarmupState()
+
+
+def get_warmup_state() -> WarmupState:
+    """Shared warmup state"""
+    return _state
+
+
+async def _warm_size(model_loader, size: int, modes) -> Dict[str, float]:
+    """Run one synthetic upload through the request pipeline; returns stage totals (ms)"""
+    image = await run_in_worker(make_synthetic_face, size)
+    contents, _ = await run_in_worker(encode_image, image, 'jpeg', 92)
+    
+    start = time.perf_counter()
+    with collect_stages() as timer:
+        decoded, original_size = await run_in_worker(decode_upload, contents, 1024)
+        processed, transform = await run_in_worker(
+            prepare_image, decoded, target_size=1024, original_size=original_size
+        )
+        await run_detectors(model_loader, ImageContext(processed), modes, 0.5, transform)
+        await run_in_worker(encode_image, processed)
+    
+    timings = timer.totals_ms()
+    timings['total'] = round((time.perf_counter() - start) * 1000, 2)
+    return timings
+
+
+async def run_warmup(model_loader) -> WarmupState:
+    """
+    Warm every loaded mode at every WARMUP_SIZES size (sizes run one after
+    another; the detectors of one size run in parallel, as in multi-mode)
+    
+    Modes that are not preloaded (PRELOAD_MODES) are not loaded here and
+    warm up on their first request.
+    """
+    global _state
+    state = _state = WarmupState()
+    if not settings.WARMUP_ENABLED:
+        state.status = 'disabled'
+        return state
+    
+    state.status = 'running'
+    state.modes = model_loader.loaded_modes()
+    start = time.perf_counter()
+    logger.info(f"🔥 Warming up {len(state.modes)} modes at {settings.warmup_sizes_list} px...")
+    
+    for size in settings.warmup_sizes_list:
+        delay = RETRY_DELAY_SECONDS
+        for attempt in range(1, WARMUP_ATTEMPTS + 1):
+            try:
+                state.sizes[f"{size}px"] = await _warm_size(model_loader, size, state.modes)
+                break
+            except Exception as e:
+                if attempt == WARMUP_ATTEMPTS:
+                    state.status = 'failed'
+                    state.error = f"{size}px: {e}"
+                    logger.error(f"❌ Warmup at {size}px failed {attempt} times: {e}", exc_info=True)
+                else:
+                    logger.warning(f"⚠️ Warmup at {size}px failed ({e}), retrying in {delay:.0f}s")
+                    await asyncio.sleep(delay)
+                    delay *= 2
+    
+    state.total_ms = round((time.perf_counter() - start) * 1000, 2)
+    if state.status == 'failed':
+        logger.warning(f"⚠️ Warmup incomplete after {state.total_ms:.0f}ms - service ready, but cold")
+    else:
+        state.status = 'complete'
+        logger.info(f"✅ Warmup complete in {state.total_ms:.0f}ms - service ready")
+    return state
@@ -3,9 +3,13 @@ Pores Detection Model (Mock Implementation)
 """
 import numpy as np
 import cv2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import logging
 
+from api.core.executor import run_in_worker
+from api.core.timing import timed_stage
+from api.utils.image_context import ImageContext
+
 logger = logging.getLogger(__name__)
 
 class PoresDetector:
@@ -18,7 +22,7 @@ class PoresDetector:
         self.device = device
         self.model = None
         self.is_loaded = False
-        
+    
     async def load_model(self, model_path: str):
         """Load pre-trained model weights"""
         try:
@@ -30,20 +34,25 @@ class PoresDetector:
     
     async def detect(
         self, 
-        image: np.ndarray, 
+        image: Union[np.ndarray, ImageContext], 
+        confidence_threshold: float = 0.5
+    ) -> List[Dict[str, Any]]:
+        """Detect pores on the analysis worker pool (see detect_sync)"""
+        return await run_in_worker(self.detect_sync, image, confidence_threshold)
+    
+    @timed_stage("detect.pores")
+    def detect_sync(
+        self, 
+        image: Union[np.ndarray, ImageContext], 
         confidence_threshold: float = 0.5
     ) -> List[Dict[str, Any]]:
         """Detect pores in image"""
         try:
-            # Denormalize
-            if image.dtype in [np.float32, np.float64]:
-                mean = np.array([0.485, 0.456, 0.406])
-                std = np.array([0.229, 0.224, 0.225])
-                image = image * std + mean
-                image = (image * 255).astype(np.uint8)
+            # Work on the skin region only (computed once per request)
+            ctx = ImageContext.ensure(image).roi
             
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            # Grayscale plane
+            gray = ctx.gray
             
             # Enhance contrast
             clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
@@ -62,12 +71,18 @@ class PoresDetector:
             detector = cv2.SimpleBlobDetector_create(params)
             keypoints = detector.detect(enhanced)
             
+            offset_x, offset_y = ctx.offset
             detections = []
             
             for kp in keypoints:
                 x, y = kp.pt
                 size = kp.size
                 
+                # Blobs outside the skin region (hair, background)
+                if not ctx.in_region(x, y):
+                    continue
+                x, y = x + offset_x, y + offset_y
+                
                 # Calculate confidence based on response
                 confidence = min(kp.response / 50.0, 1.0)
                 
@@ -98,7 +113,7 @@ class PoresDetector:
             logger.info(f"Detected {len(detections)} pores")
             
             return detections
-            
+        
         except Exception as e:
             logger.error(f"Error in pore detection: {e}")
             raise
@@ -4,9 +4,15 @@ Detects P. acnes bacteria using fluorescence analysis
 """
 import numpy as np
 import cv2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import logging
 
+from api.core.executor import run_in_worker
+from api.core.timing import timed_stage
+from api.utils.image_context import ImageContext
+from api.utils.color_lut import ColorClass, fluorescence_index
+from api.utils.region_stats import RegionStats
+
 logger = logging.getLogger(__name__)
 
 class PorphyrinDetector:
@@ -19,7 +25,7 @@ class PorphyrinDetector:
         self.device = device
         self.model = None
         self.is_loaded = False
-        
+    
     async def load_model(self, model_path: str):
         """Load pre-trained model weights"""
         try:
@@ -29,33 +35,31 @@ class PorphyrinDetector:
             logger.error(f"Failed to load porphyrins model: {e}")
             raise
     
-    def _simulate_fluorescence(self, image: np.ndarray) -> np.ndarray:
+    def _simulate_fluorescence(self, ctx: ImageContext) -> np.ndarray:
         """
         Simulate UV fluorescence response
         Porphyrins fluoresce orange-red (590-635nm) under UV (365-405nm)
         """
-        # Convert to HSV for better color analysis
-        hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-        h, s, v = cv2.split(hsv)
-        
         # Porphyrins appear as orange-red fluorescence
         # Target: Orange (10-25 hue) with high intensity
         
         # Create fluorescence probability map
         # High red channel + moderate green = orange fluorescence
-        r_channel = image[:, :, 0].astype(np.float32)
-        g_channel = image[:, :, 1].astype(np.float32)
-        b_channel = image[:, :, 2].astype(np.float32)
-        
-        # Fluorescence index: high R, moderate G, low B
-        fluor_index = (r_channel / 255.0) * (1.0 - b_channel / 255.0)
-        fluor_index = np.clip(fluor_index, 0, 1)
-        
-        return fluor_index
+        r, g, b = ctx.rgb_channels
+        return fluorescence_index(r, b)
     
     async def detect(
         self, 
-        image: np.ndarray, 
+        image: Union[np.ndarray, ImageContext], 
+        confidence_threshold: float = 0.5
+    ) -> List[Dict[str, Any]]:
+        """Detect porphyrins on the analysis worker pool (see detect_sync)"""
+        return await run_in_worker(self.detect_sync, image, confidence_threshold)
+    
+    @timed_stage("detect.porphyrins")
+    def detect_sync(
+        self, 
+        image: Union[np.ndarray, ImageContext], 
         confidence_threshold: float = 0.5
     ) -> List[Dict[str, Any]]:
         """
@@ -66,22 +70,14 @@ class PorphyrinDetector:
         that could indicate bacterial presence
         """
         try:
-            # Denormalize if needed
-            if image.dtype in [np.float32, np.float64]:
-                mean = np.array([0.485, 0.456, 0.406])
-                std = np.array([0.229, 0.224, 0.225])
-                image = image * std + mean
-                image = (image * 255).astype(np.uint8)
+            # Work on the skin region only (computed once per request)
+            ctx = ImageContext.ensure(image).roi
             
             # Simulate fluorescence response
-            fluor_map = self._simulate_fluorescence(image)
+            fluor_map = self._simulate_fluorescence(ctx)
             
-            # Convert to multiple color spaces
-            hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-            lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
-            
-            h_channel, s_channel, v_channel = cv2.split(hsv)
-            l_channel, a_channel, b_channel = cv2.split(lab)
+            # Shared color planes
+            h_channel, s_channel, v_channel = ctx.hsv_channels
             
             # Porphyrins characteristics under UV:
             # 1. Orange-red hue (10-25 in OpenCV HSV)
@@ -89,133 +85,100 @@ class PorphyrinDetector:
             # 3. Bright (high value)
             # 4. Often near pores/follicles
             
-            # Create orange-red mask (porphyrin fluorescence color)
-            lower_orange = np.array([5, 50, 50])    # Orange start
-            upper_orange = np.array([25, 255, 255]) # Red end
-            orange_mask = cv2.inRange(hsv, lower_orange, upper_orange)
-            
-            # Apply fluorescence probability
-            fluor_threshold = 0.4
-            _, fluor_mask = cv2.threshold(
-                (fluor_map * 255).astype(np.uint8), 
-                int(fluor_threshold * 255), 
-                255, 
-                cv2.THRESH_BINARY
-            )
-            
-            # Combine masks
-            combined_mask = cv2.bitwise_and(orange_mask, fluor_mask)
+            # Orange-red fluorescence color with fluorescence above threshold,
+            # from the color LUT (see COLOR_RULES in api/utils/color_lut.py)
+            combined_mask = ctx.color_mask(ColorClass.PORPHYRIN)
             
             # Remove noise
             kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
             combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
             combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
+            combined_mask = ctx.restrict(combined_mask)
+            
+            # Per-region statistics in a few vectorized passes
+            # Filter by size (porphyrin clusters: 1-8mm diameter)
+            # Smaller than spots because it's bacterial colonies
+            min_area = 10    # ~1mm diameter
+            max_area = 500   # ~8mm diameter
+            regions = RegionStats(combined_mask, ctx.offset).filter_area(min_area, max_area)
+            area = regions.contour_area
+            
+            # Fluorescence intensity
+            mean_fluor = regions.mean(fluor_map)
+            max_fluor = regions.max(fluor_map)
+            
+            # Color analysis
+            mean_h = regions.mean(h_channel)
+            mean_s = regions.mean(s_channel)
+            mean_v = regions.mean(v_channel)
+            
+            # Orange-red hue score (15 is ideal porphyrin color)
+            hue_score = 1.0 - np.minimum(np.abs(mean_h - 15) / 15.0, 1.0)
+            
+            # Saturation score (porphyrin fluorescence is vivid)
+            saturation_score = np.minimum(mean_s / 180.0, 1.0)
+            
+            # Brightness score (fluorescence is bright)
+            brightness_score = np.minimum(mean_v / 200.0, 1.0)
             
-            # Find contours
-            contours, _ = cv2.findContours(
-                combined_mask, 
-                cv2.RETR_EXTERNAL, 
-                cv2.CHAIN_APPROX_SIMPLE
+            # Circularity (bacterial colonies are usually round)
+            circularity = regions.circularity
+            
+            # Combined confidence
+            confidence = (
+                mean_fluor * 0.35 + 
+                hue_score * 0.25 + 
+                saturation_score * 0.20 + 
+                brightness_score * 0.15 + 
+                circularity * 0.05
             )
             
+            # Size estimation
+            diameter_px = np.sqrt(area / np.pi) * 2
+            size_mm = diameter_px / 10.0
+            
+            # Bacterial load estimation (0-10 scale)
+            bacterial_load = mean_fluor * 10.0
+            
+            bboxes = regions.bboxes
             detections = []
-            h, w = image.shape[:2]
             
-            for contour in contours:
-                x, y, bw, bh = cv2.boundingRect(contour)
-                area = cv2.contourArea(contour)
-                
-                # Filter by size (porphyrin clusters: 1-8mm diameter)
-                # Smaller than spots because it's bacterial colonies
-                min_area = 10    # ~1mm diameter
-                max_area = 500   # ~8mm diameter
-                
-                if area < min_area or area > max_area:
-                    continue
-                
-                # Analyze ROI
-                roi_fluor = fluor_map[y:y+bh, x:x+bw]
-                roi_h = h_channel[y:y+bh, x:x+bw]
-                roi_s = s_channel[y:y+bh, x:x+bw]
-                roi_v = v_channel[y:y+bh, x:x+bw]
-                roi_a = a_channel[y:y+bh, x:x+bw]
-                
-                # Fluorescence intensity
-                mean_fluor = np.mean(roi_fluor)
-                max_fluor = np.max(roi_fluor)
-                
-                # Color analysis
-                mean_h = np.mean(roi_h)
-                mean_s = np.mean(roi_s)
-                mean_v = np.mean(roi_v)
-                
-                # Orange-red hue score (15 is ideal porphyrin color)
-                hue_score = 1.0 - min(abs(mean_h - 15) / 15.0, 1.0)
-                
-                # Saturation score (porphyrin fluorescence is vivid)
-                saturation_score = min(mean_s / 180.0, 1.0)
-                
-                # Brightness score (fluorescence is bright)
-                brightness_score = min(mean_v / 200.0, 1.0)
-                
-                # Calculate circularity (bacterial colonies are usually round)
-                perimeter = cv2.arcLength(contour, True)
-                if perimeter == 0:
-                    continue
-                circularity = 4 * np.pi * area / (perimeter * perimeter)
-                
-                # Combined confidence
-                confidence = (
-                    mean_fluor * 0.35 + 
-                    hue_score * 0.25 + 
-                    saturation_score * 0.20 + 
-                    brightness_score * 0.15 + 
-                    circularity * 0.05
-                )
-                
-                if confidence < confidence_threshold:
-                    continue
-                
-                # Size estimation
-                diameter_px = np.sqrt(area / np.pi) * 2
-                size_mm = diameter_px / 10.0
-                
-                # Bacterial load estimation (0-10 scale)
-                bacterial_load = mean_fluor * 10.0
+            for i in np.flatnonzero(confidence >= confidence_threshold):
+                fluor = mean_fluor[i]
                 
                 # Activity level
-                if mean_fluor > 0.75:
+                if fluor > 0.75:
                     activity = 'high'
-                    activity_score = 8.0 + (mean_fluor - 0.75) * 8.0
-                elif mean_fluor > 0.55:
+                    activity_score = 8.0 + (fluor - 0.75) * 8.0
+                elif fluor > 0.55:
                     activity = 'moderate'
-                    activity_score = 5.0 + (mean_fluor - 0.55) * 15.0
+                    activity_score = 5.0 + (fluor - 0.55) * 15.0
                 else:
                     activity = 'low'
-                    activity_score = mean_fluor * 10.0
+                    activity_score = fluor * 10.0
                 
                 # Location type (useful for treatment targeting)
                 # Check if near existing pore detection (would need pore locations as input)
                 # For now, classify by size
-                if area < 50:
+                if area[i] < 50:
                     location_type = 'follicle'  # In hair follicle
-                elif area < 200:
+                elif area[i] < 200:
                     location_type = 'pore'  # In pore
                 else:
                     location_type = 'surface'  # Surface colony
                 
                 detections.append({
-                    'bbox': [int(x), int(y), int(bw), int(bh)],
-                    'confidence': float(min(confidence, 1.0)),
-                    'size_mm': float(size_mm),
-                    'fluorescence_intensity': float(mean_fluor),
-                    'bacterial_load': float(bacterial_load),
+                    'bbox': bboxes[i],
+                    'confidence': float(min(confidence[i], 1.0)),
+                    'size_mm': float(size_mm[i]),
+                    'fluorescence_intensity': float(fluor),
+                    'bacterial_load': float(bacterial_load[i]),
                     'activity': activity,
                     'activity_score': float(activity_score),
                     'location_type': location_type,
-                    'hue': float(mean_h),
-                    'circularity': float(circularity),
-                    'area_px': float(area)
+                    'hue': float(mean_h[i]),
+                    'circularity': float(circularity[i]),
+                    'area_px': float(area[i])
                 })
             
             # Sort by fluorescence intensity
@@ -229,7 +192,7 @@ class PorphyrinDetector:
                 logger.info(f"✅ No significant porphyrin detected (good skin health)")
             
             return detections
-            
+        
         except Exception as e:
             logger.error(f"Error in porphyrin detection: {e}")
             raise
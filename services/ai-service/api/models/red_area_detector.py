@@ -4,9 +4,15 @@ Detects rosacea, inflammation, blood vessel visibility
 """
 import numpy as np
 import cv2
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Union
 import logging
 
+from api.core.executor import run_in_worker
+from api.core.timing import timed_stage
+from api.utils.image_context import ImageContext
+from api.utils.color_lut import ColorClass
+from api.utils.region_stats import RegionStats
+
 logger = logging.getLogger(__name__)
 
 class RedAreaDetector:
@@ -19,7 +25,7 @@ class RedAreaDetector:
         self.device = device
         self.model = None
         self.is_loaded = False
-        
+    
     async def load_model(self, model_path: str):
         """Load pre-trained model weights"""
         try:
@@ -29,13 +35,14 @@ class RedAreaDetector:
             logger.error(f"Failed to load red areas model: {e}")
             raise
     
-    def _calculate_redness_index(self, image: np.ndarray) -> np.ndarray:
+    def _calculate_redness_index(self, ctx: ImageContext) -> np.ndarray:
         """
         Calculate redness index for each pixel
         Uses erythema index: EI = (R - G) / sqrt(G)
         """
-        r = image[:, :, 0].astype(np.float32)
-        g = image[:, :, 1].astype(np.float32)
+        r_channel, g_channel, _ = ctx.rgb_channels
+        r = r_channel.astype(np.float32)
+        g = g_channel.astype(np.float32)
         
         # Avoid division by zero
         g_safe = np.where(g < 1, 1, g)
@@ -43,10 +50,11 @@ class RedAreaDetector:
         # Erythema Index
         ei = (r - g) / np.sqrt(g_safe)
         
-        # Normalize to 0-1 range
-        ei_min, ei_max = np.min(ei), np.max(ei)
+        # Normalize to 0-1 range over the skin region (background pixels
+        # must not stretch the scale)
+        ei_min, ei_max, _, _ = cv2.minMaxLoc(ei, ctx.mask)
         if ei_max > ei_min:
-            ei_norm = (ei - ei_min) / (ei_max - ei_min)
+            ei_norm = np.clip((ei - ei_min) / (ei_max - ei_min), 0, 1)
         else:
             ei_norm = np.zeros_like(ei)
         
@@ -54,7 +62,16 @@ class RedAreaDetector:
     
     async def detect(
         self, 
-        image: np.ndarray, 
+        image: Union[np.ndarray, ImageContext], 
+        confidence_threshold: float = 0.5
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """Detect red areas on the analysis worker pool (see detect_sync)"""
+        return await run_in_worker(self.detect_sync, image, confidence_threshold)
+    
+    @timed_stage("detect.red_areas")
+    def detect_sync(
+        self, 
+        image: Union[np.ndarray, ImageContext], 
         confidence_threshold: float = 0.5
     ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
         """
@@ -64,37 +81,22 @@ class RedAreaDetector:
             (detections, heatmap): List of red area boxes and redness heatmap
         """
         try:
-            # Denormalize if needed
-            if image.dtype in [np.float32, np.float64]:
-                mean = np.array([0.485, 0.456, 0.406])
-                std = np.array([0.229, 0.224, 0.225])
-                image = image * std + mean
-                image = (image * 255).astype(np.uint8)
+            # Work on the skin region only (computed once per request)
+            ctx = ImageContext.ensure(image).roi
             
             # Calculate redness index
-            redness_map = self._calculate_redness_index(image)
+            redness_map = self._calculate_redness_index(ctx)
             
-            # Convert to multiple color spaces
-            hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-            lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
+            # Shared color planes
+            h_channel, s_channel, v_channel = ctx.hsv_channels
+            l_channel, a_channel, b_channel = ctx.lab_channels
             
-            h_channel, s_channel, v_channel = cv2.split(hsv)
-            l_channel, a_channel, b_channel = cv2.split(lab)
-            
-            # Red detection in HSV space
-            # Red hue: 0-10 and 160-180 in OpenCV HSV (0-180 range)
-            lower_red1 = np.array([0, 40, 40])
-            upper_red1 = np.array([10, 255, 255])
-            mask_red1 = cv2.inRange(hsv, lower_red1, upper_red1)
-            
-            lower_red2 = np.array([160, 40, 40])
-            upper_red2 = np.array([180, 255, 255])
-            mask_red2 = cv2.inRange(hsv, lower_red2, upper_red2)
-            
-            red_mask = cv2.bitwise_or(mask_red1, mask_red2)
+            # Red detection in HSV space (hue 0-10 and 160-180), from the
+            # color LUT (see COLOR_RULES in api/utils/color_lut.py)
+            red_mask = ctx.color_mask(ColorClass.RED)
             
             # Also use a* channel in LAB (positive a* = redness)
-            a_norm = cv2.normalize(a_channel, None, 0, 255, cv2.NORM_MINMAX)
+            a_norm = ctx.masked_normalize(a_channel)
             _, a_mask = cv2.threshold(a_norm, 140, 255, cv2.THRESH_BINARY)
             
             # Combine redness from different methods
@@ -117,6 +119,7 @@ class RedAreaDetector:
             kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
             combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
             combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+            combined_mask = ctx.restrict(combined_mask)
             
             # Generate smooth heatmap
             redness_heatmap = cv2.GaussianBlur(
@@ -125,119 +128,100 @@ class RedAreaDetector:
                 0
             )
             
-            # Apply colormap for visualization (like VISIA)
-            heatmap_colored = cv2.applyColorMap(redness_heatmap, cv2.COLORMAP_JET)
+            # Apply colormap for visualization (like VISIA), on the full frame
+            heatmap_colored = cv2.applyColorMap(ctx.to_frame(redness_heatmap), cv2.COLORMAP_JET)
+            
+            # Per-region statistics for discrete areas
+            # Filter by size (red areas: 5-50mm diameter)
+            min_area = 250   # ~5mm diameter
+            max_area = 20000  # ~50mm diameter (large patches)
+            regions = RegionStats(combined_mask, ctx.offset).filter_area(min_area, max_area)
+            area = regions.contour_area
+            
+            # Calculate redness intensity
+            mean_redness = regions.mean(redness_map)
+            max_redness = regions.max(redness_map)
+            
+            # Calculate red color purity
+            mean_h = regions.mean(h_channel)
+            mean_s = regions.mean(s_channel)
+            mean_a = regions.mean(a_channel)
+            
+            # Red hue score (0-10 or 170-180 is red)
+            hue_score = np.where(
+                mean_h <= 10,
+                1.0 - (mean_h / 10.0),
+                np.where(mean_h >= 170, (mean_h - 170) / 10.0, 0.0)
+            )
             
-            # Find contours for discrete areas
-            contours, _ = cv2.findContours(
-                combined_mask, 
-                cv2.RETR_EXTERNAL, 
-                cv2.CHAIN_APPROX_SIMPLE
+            # Saturation score
+            saturation_score = np.minimum(mean_s / 150.0, 1.0)
+            
+            # a* score (redness in LAB)
+            a_score = (mean_a - 128) / 127.0  # Normalize to 0-1
+            a_score = np.clip(a_score, 0, 1)
+            
+            # Combined confidence
+            confidence = (
+                mean_redness * 0.40 + 
+                hue_score * 0.25 + 
+                saturation_score * 0.20 + 
+                a_score * 0.15
             )
             
+            # Size estimation
+            diameter_px = np.sqrt(area / np.pi) * 2
+            size_mm = diameter_px / 10.0
+            
+            bboxes = regions.bboxes
             detections = []
-            h, w = image.shape[:2]
             
-            for contour in contours:
-                x, y, bw, bh = cv2.boundingRect(contour)
-                area = cv2.contourArea(contour)
-                
-                # Filter by size (red areas: 5-50mm diameter)
-                min_area = 250   # ~5mm diameter
-                max_area = 20000  # ~50mm diameter (large patches)
-                
-                if area < min_area or area > max_area:
-                    continue
-                
-                # Analyze ROI
-                roi_redness = redness_map[y:y+bh, x:x+bw]
-                roi_h = h_channel[y:y+bh, x:x+bw]
-                roi_s = s_channel[y:y+bh, x:x+bw]
-                roi_a = a_channel[y:y+bh, x:x+bw]
-                
-                # Calculate redness intensity
-                mean_redness = np.mean(roi_redness)
-                max_redness = np.max(roi_redness)
-                
-                # Calculate red color purity
-                mean_h = np.mean(roi_h)
-                mean_s = np.mean(roi_s)
-                mean_a = np.mean(roi_a)
-                
-                # Red hue score (0-10 or 170-180 is red)
-                if mean_h <= 10:
-                    hue_score = 1.0 - (mean_h / 10.0)
-                elif mean_h >= 170:
-                    hue_score = (mean_h - 170) / 10.0
-                else:
-                    hue_score = 0.0
-                
-                # Saturation score
-                saturation_score = min(mean_s / 150.0, 1.0)
-                
-                # a* score (redness in LAB)
-                a_score = (mean_a - 128) / 127.0  # Normalize to 0-1
-                a_score = max(0, min(1, a_score))
-                
-                # Combined confidence
-                confidence = (
-                    mean_redness * 0.40 + 
-                    hue_score * 0.25 + 
-                    saturation_score * 0.20 + 
-                    a_score * 0.15
-                )
-                
-                if confidence < confidence_threshold:
-                    continue
-                
-                # Size estimation
-                diameter_px = np.sqrt(area / np.pi) * 2
-                size_mm = diameter_px / 10.0
+            for i in np.flatnonzero(confidence >= confidence_threshold):
+                redness = mean_redness[i]
                 
                 # Severity classification
-                if mean_redness > 0.7:
+                if redness > 0.7:
                     severity = 'severe'
-                    severity_score = 8.0 + (mean_redness - 0.7) * 6.67
-                elif mean_redness > 0.5:
+                    severity_score = 8.0 + (redness - 0.7) * 6.67
+                elif redness > 0.5:
                     severity = 'moderate'
-                    severity_score = 5.0 + (mean_redness - 0.5) * 15.0
+                    severity_score = 5.0 + (redness - 0.5) * 15.0
                 else:
                     severity = 'mild'
-                    severity_score = mean_redness * 10.0
+                    severity_score = redness * 10.0
                 
                 # Type classification
-                if area > 5000:
+                if area[i] > 5000:
                     area_type = 'rosacea'  # Large diffuse area
-                elif saturation_score > 0.6:
+                elif saturation_score[i] > 0.6:
                     area_type = 'inflammation'  # Intense red
                 else:
                     area_type = 'capillary'  # Blood vessels
                 
                 detections.append({
-                    'bbox': [int(x), int(y), int(bw), int(bh)],
-                    'confidence': float(min(confidence, 1.0)),
-                    'size_mm': float(size_mm),
-                    'redness_intensity': float(mean_redness),
-                    'max_redness': float(max_redness),
+                    'bbox': bboxes[i],
+                    'confidence': float(min(confidence[i], 1.0)),
+                    'size_mm': float(size_mm[i]),
+                    'redness_intensity': float(redness),
+                    'max_redness': float(max_redness[i]),
                     'severity': severity,
                     'severity_score': float(severity_score),
                     'area_type': area_type,
-                    'area_px': float(area)
+                    'area_px': float(area[i])
                 })
             
             # Sort by redness intensity
             detections.sort(key=lambda x: x['redness_intensity'], reverse=True)
             
             # Calculate overall redness statistics
-            total_red_pixels = np.sum(combined_mask > 0)
-            total_pixels = w * h
-            coverage_percentage = (total_red_pixels / total_pixels) * 100
+            # Share of the analyzed (skin) region covered by red areas
+            coverage_percentage = ctx.masked_mean(combined_mask) / 255.0 * 100
             
             logger.info(f"✅ Detected {len(detections)} red areas, {coverage_percentage:.1f}% coverage")
             
             # Return detections and heatmap
             return detections, heatmap_colored
-            
+        
         except Exception as e:
             logger.error(f"Error in red area detection: {e}")
             raise
@@ -4,10 +4,15 @@ Real implementation would use trained PyTorch/TensorFlow model
 """
 import numpy as np
 import cv2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import logging
 from pathlib import Path
 
+from api.core.executor import run_in_worker
+from api.core.timing import timed_stage
+from api.utils.image_context import ImageContext
+from api.utils.region_stats import RegionStats
+
 logger = logging.getLogger(__name__)
 
 class SpotDetector:
@@ -20,7 +25,7 @@ class SpotDetector:
         self.device = device
         self.model = None
         self.is_loaded = False
-        
+    
     async def load_model(self, model_path: str):
         """Load pre-trained model weights"""
         try:
@@ -30,42 +35,45 @@ class SpotDetector:
             
             logger.info(f"✅ Spots detection model loaded (mock)")
             self.is_loaded = True
-            
+        
         except Exception as e:
             logger.error(f"Failed to load spots model: {e}")
             raise
     
     async def detect(
         self, 
-        image: np.ndarray, 
+        image: Union[np.ndarray, ImageContext], 
+        confidence_threshold: float = 0.5
+    ) -> List[Dict[str, Any]]:
+        """Detect spots on the analysis worker pool (see detect_sync)"""
+        return await run_in_worker(self.detect_sync, image, confidence_threshold)
+    
+    @timed_stage("detect.spots")
+    def detect_sync(
+        self, 
+        image: Union[np.ndarray, ImageContext], 
         confidence_threshold: float = 0.5
     ) -> List[Dict[str, Any]]:
         """
         Detect spots in image
         
         Args:
-            image: Preprocessed image (RGB, normalized)
+            image: Preprocessed image (RGB) or shared ImageContext
             confidence_threshold: Minimum confidence score
-            
+        
         Returns:
             List of detections with bbox, confidence, etc.
         """
         try:
-            # Convert back to uint8 for processing
-            if image.dtype == np.float32 or image.dtype == np.float64:
-                # Denormalize from ImageNet
-                mean = np.array([0.485, 0.456, 0.406])
-                std = np.array([0.229, 0.224, 0.225])
-                image = image * std + mean
-                image = (image * 255).astype(np.uint8)
+            # Work on the skin region only (computed once per request)
+            ctx = ImageContext.ensure(image).roi
             
-            # Convert to LAB color space for better spot detection
-            lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
-            l_channel = lab[:, :, 0]
+            # LAB color space for better spot detection
+            l_channel = ctx.lab_channels[0]
             
             # Threshold dark regions (potential spots)
             # Lower L* values = darker = potential spots
-            mean_l = np.mean(l_channel)
+            mean_l = ctx.masked_mean(l_channel)
             threshold = mean_l - 20  # Adjust sensitivity
             
             _, binary = cv2.threshold(l_channel, threshold, 255, cv2.THRESH_BINARY_INV)
@@ -74,60 +82,43 @@ class SpotDetector:
             kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
             binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
             binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+            binary = ctx.restrict(binary)
+            
+            # Per-region statistics in a few vectorized passes
+            # Filter by size (spots are typically 2-10mm diameter)
+            # Assuming image is ~1024px and represents ~10cm face
+            # 1mm ≈ 10px
+            min_area = 40  # ~2mm diameter
+            max_area = 800  # ~10mm diameter
+            regions = RegionStats(binary, ctx.offset).filter_area(min_area, max_area)
+            
+            # Calculate confidence based on darkness and shape
+            area = regions.contour_area
+            darkness = 1.0 - (regions.mean(l_channel) / 255.0)
+            
+            # Circularity (spots are usually round)
+            circularity = regions.circularity
             
-            # Find contours
-            contours, _ = cv2.findContours(
-                binary, 
-                cv2.RETR_EXTERNAL, 
-                cv2.CHAIN_APPROX_SIMPLE
-            )
+            # Combined confidence score
+            confidence = (darkness * 0.6 + circularity * 0.4)
             
+            # Estimate melanin density
+            melanin_density = darkness
+            
+            # Estimate size in mm (rough approximation)
+            diameter_px = np.sqrt(area / np.pi) * 2
+            size_mm = diameter_px / 10.0  # Assuming 10px = 1mm
+            
+            bboxes = regions.bboxes
             detections = []
-            h, w = image.shape[:2]
             
-            for i, contour in enumerate(contours):
-                # Calculate bounding box
-                x, y, bw, bh = cv2.boundingRect(contour)
-                area = cv2.contourArea(contour)
-                
-                # Filter by size (spots are typically 2-10mm diameter)
-                # Assuming image is ~1024px and represents ~10cm face
-                # 1mm ≈ 10px
-                min_area = 40  # ~2mm diameter
-                max_area = 800  # ~10mm diameter
-                
-                if area < min_area or area > max_area:
-                    continue
-                
-                # Calculate confidence based on darkness and shape
-                roi = l_channel[y:y+bh, x:x+bw]
-                darkness = 1.0 - (np.mean(roi) / 255.0)
-                
-                # Calculate circularity (spots are usually round)
-                perimeter = cv2.arcLength(contour, True)
-                if perimeter == 0:
-                    continue
-                circularity = 4 * np.pi * area / (perimeter * perimeter)
-                
-                # Combined confidence score
-                confidence = (darkness * 0.6 + circularity * 0.4)
-                
-                if confidence < confidence_threshold:
-                    continue
-                
-                # Estimate melanin density
-                melanin_density = darkness
-                
-                # Estimate size in mm (rough approximation)
-                diameter_px = np.sqrt(area / np.pi) * 2
-                size_mm = diameter_px / 10.0  # Assuming 10px = 1mm
-                
+            for i in np.flatnonzero(confidence >= confidence_threshold):
                 detections.append({
-                    'bbox': [int(x), int(y), int(bw), int(bh)],
-                    'confidence': float(min(confidence, 1.0)),
-                    'size_mm': float(size_mm),
-                    'melanin_density': float(melanin_density),
-                    'area_px': float(area)
+                    'bbox': bboxes[i],
+                    'confidence': float(min(confidence[i], 1.0)),
+                    'size_mm': float(size_mm[i]),
+                    'melanin_density': float(melanin_density[i]),
+                    'area_px': float(area[i])
                 })
             
             # Sort by confidence
@@ -135,7 +126,7 @@ class SpotDetector:
             
             logger.info(f"✅ Detected {len(detections)} spots")
             return detections
-            
+        
         except Exception as e:
             logger.error(f"Error in spot detection: {e}")
             raise
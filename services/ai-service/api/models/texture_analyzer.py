@@ -3,11 +3,56 @@ Texture Analysis Model (Mock Implementation)
 """
 import numpy as np
 import cv2
-from typing import Dict, Any
+from typing import Dict, Any, Tuple, Union
 import logging
 
+from api.core.executor import run_in_worker
+from api.core.timing import timed_stage
+from api.utils.image_context import ImageContext
+from api.utils.image_processing import SKIN_ROI_MARGIN
+
 logger = logging.getLogger(__name__)
 
+# Side length (px) of the tiles local texture is measured on
+TILE_SIZE = 32
+
+# Tiles with less skin than this fraction are left out of the map and zones
+MIN_TILE_SKIN = 0.5
+
+# Extra pixels (beyond the skin ROI margin) left out of tile stats at the
+# edge of the skin mask
+EDGE_MARGIN = 2
+
+# Tile roughness (100 - texture score) shown at full heatmap intensity
+HEATMAP_FULL_SCALE = 50.0
+
+# Gray levels are quantized to this many bins for per-tile entropy
+ENTROPY_BINS = 16
+
+# Face zones as (top, bottom, left, right) fractions of the analysis frame
+# (the face crop when face alignment is on); left/right are image sides
+FACE_ZONES = {
+    'forehead': (0.0, 0.3, 0.2, 0.8),
+    'nose': (0.35, 0.7, 0.4, 0.6),
+    'cheek_left': (0.4, 0.75, 0.05, 0.4),
+    'cheek_right': (0.4, 0.75, 0.6, 0.95),
+    'chin': (0.78, 1.0, 0.3, 0.7),
+}
+
+
+def _tile_sums(integral: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+    """Per-tile sums from an integral image (tile edges ys x xs, 4 lookups per tile)"""
+    corners = integral[np.ix_(ys, xs)]
+    return np.diff(np.diff(corners, axis=0), axis=1)
+
+
+def _texture_score(std: np.ndarray, laplacian_var: np.ndarray) -> np.ndarray:
+    """Texture score (0-100, higher = smoother) from std dev and Laplacian variance"""
+    smoothness = np.maximum(0, 100 - std * 2)
+    roughness = np.minimum(100, laplacian_var / 10)
+    return (smoothness + (100 - roughness)) / 2
+
+
 class TextureAnalyzer:
     """
     Skin texture analysis using frequency domain and statistical methods
@@ -18,7 +63,7 @@ class TextureAnalyzer:
         self.device = device
         self.model = None
         self.is_loaded = False
-        
+    
     async def load_model(self, model_path: str):
         """Load pre-trained model weights"""
         try:
@@ -28,31 +73,111 @@ class TextureAnalyzer:
             logger.error(f"Failed to load texture model: {e}")
             raise
     
-    async def analyze(self, image: np.ndarray) -> Dict[str, Any]:
-        """Analyze skin texture"""
+    async def analyze(self, image: Union[np.ndarray, ImageContext]) -> Tuple[Dict[str, Any], np.ndarray]:
+        """Analyze texture on the analysis worker pool (see analyze_sync)"""
+        return await run_in_worker(self.analyze_sync, image)
+    
+    def _tile_map(self, ctx: ImageContext, gray: np.ndarray, laplacian: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Local std dev, Laplacian variance and entropy per TILE_SIZE tile
+        
+        Sums come from integral images (and one histogram pass for entropy),
+        so the cost is O(pixels) whatever the tile size.
+        
+        Returns:
+            Tile grids: 'std', 'laplacian_var', 'entropy', 'skin' (skin fraction)
+        """
+        h, w = gray.shape
+        ys = np.append(np.arange(0, h, TILE_SIZE), h)
+        xs = np.append(np.arange(0, w, TILE_SIZE), w)
+        tiles_y, tiles_x = len(ys) - 1, len(xs) - 1
+        area = np.diff(ys)[:, None] * np.diff(xs)[None, :]
+        
+        # Pixels outside the skin mask are zeroed so they drop out of every
+        # sum. The mask is eroded by the margin compute_skin_roi added around
+        # the skin, so the skin/background edge does not read as roughness.
+        energy = cv2.multiply(laplacian, laplacian)
+        if ctx.mask is not None:
+            margin = round(SKIN_ROI_MARGIN * max(ctx.frame_shape[:2])) + EDGE_MARGIN
+            interior = cv2.erode(ctx.mask, np.ones((2 * margin + 1, 2 * margin + 1), np.uint8))
+            outside = interior == 0
+            gray = cv2.bitwise_and(gray, interior)
+            energy[outside] = 0
+            count = _tile_sums(cv2.integral(interior // 255), ys, xs)
+        else:
+            count = area
+        n = np.maximum(count, 1)
+        
+        # First/second moments of skin pixels
+        total, squares = cv2.integral2(gray)
+        mean = _tile_sums(total, ys, xs) / n
+        std = np.sqrt(np.maximum(_tile_sums(squares, ys, xs) / n - mean ** 2, 0))
+        
+        # Laplacian energy (mean squared response)
+        laplacian_var = _tile_sums(cv2.integral(energy, sdepth=cv2.CV_64F), ys, xs) / n
+        
+        # Entropy of a per-tile gray histogram (one bincount over all pixels;
+        # non-skin pixels go to a discarded extra bin)
+        tile_index = (np.arange(h, dtype=np.intp)[:, None] // TILE_SIZE) * tiles_x \
+            + np.arange(w, dtype=np.intp)[None, :] // TILE_SIZE
+        codes = tile_index * ENTROPY_BINS + (gray >> (8 - int(np.log2(ENTROPY_BINS))))
+        if ctx.mask is not None:
+            codes[outside] = tiles_y * tiles_x * ENTROPY_BINS
+        hist = np.bincount(codes.ravel(), minlength=tiles_y * tiles_x * ENTROPY_BINS + 1)[:-1]
+        hist = hist.reshape(tiles_y, tiles_x, ENTROPY_BINS) / n[..., None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            entropy = -np.sum(np.where(hist > 0, hist * np.log2(hist), 0), axis=2)
+        
+        return {'std': std, 'laplacian_var': laplacian_var, 'entropy': entropy, 'skin': count / area}
+    
+    def _zone_scores(self, ctx: ImageContext, scores: np.ndarray, valid: np.ndarray) -> Dict[str, float]:
+        """Mean tile texture score of each face zone (zones without skin tiles are left out)"""
+        frame_h, frame_w = ctx.frame_shape[:2]
+        x0, y0 = ctx.offset
+        tiles_y, tiles_x = scores.shape
+        # Tile centers in frame coordinates, as fractions of the frame
+        cy = (y0 + (np.arange(tiles_y) + 0.5) * TILE_SIZE) / frame_h
+        cx = (x0 + (np.arange(tiles_x) + 0.5) * TILE_SIZE) / frame_w
+        
+        zones = {}
+        for zone, (top, bottom, left, right) in FACE_ZONES.items():
+            inside = valid & ((cy >= top) & (cy < bottom))[:, None] & ((cx >= left) & (cx < right))[None, :]
+            if inside.any():
+                zones[zone] = round(float(scores[inside].mean()), 1)
+        return zones
+    
+    @timed_stage("detect.texture")
+    def analyze_sync(self, image: Union[np.ndarray, ImageContext]) -> Tuple[Dict[str, Any], np.ndarray]:
+        """
+        Analyze skin texture
+        
+        Returns:
+            (metrics, roughness heatmap): global metrics plus 'zone_scores'
+            (texture score per face zone), and a uint8 full-frame heatmap
+            (0 = smooth or no skin, 255 = rough)
+        """
         try:
-            # Denormalize
-            if image.dtype in [np.float32, np.float64]:
-                mean = np.array([0.485, 0.456, 0.406])
-                std = np.array([0.229, 0.224, 0.225])
-                image = image * std + mean
-                image = (image * 255).astype(np.uint8)
+            # Work on the skin region only (computed once per request)
+            ctx = ImageContext.ensure(image).roi
             
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            # Grayscale plane
+            gray = ctx.gray
             
             # Calculate texture metrics
             
+            # Metrics are taken over the skin region only
+            mask = ctx.mask
+            
             # 1. Standard deviation (smoothness indicator)
-            std_dev = np.std(gray)
+            std_dev = cv2.meanStdDev(gray, mask=mask)[1][0, 0]
             smoothness_score = max(0, 100 - std_dev * 2)
             
             # 2. Laplacian variance (sharpness/roughness)
             laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-            roughness_score = min(100, np.var(laplacian) / 10)
+            roughness_score = min(100, cv2.meanStdDev(laplacian, mask=mask)[1][0, 0] ** 2 / 10)
             
             # 3. Entropy (texture complexity)
-            hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
+            hist = cv2.calcHist([gray], [0], mask, [256], [0, 256])
             hist = hist / hist.sum()
             entropy = -np.sum(hist * np.log2(hist + 1e-10))
             
@@ -64,9 +189,23 @@ class TextureAnalyzer:
                 'overall_score': float((smoothness_score + (100 - roughness_score)) / 2)
             }
             
-            logger.info(f"Texture analysis complete: {metrics['overall_score']:.1f}/100")
-            return metrics
+            # 4. Local texture per tile -> roughness map and face zone scores
+            tiles = self._tile_map(ctx, gray, laplacian)
+            valid = tiles['skin'] >= MIN_TILE_SKIN
+            scores = _texture_score(tiles['std'], tiles['laplacian_var'])
+            if valid.any():
+                metrics['local_standard_deviation'] = float(tiles['std'][valid].mean())
+                metrics['local_laplacian_variance'] = float(tiles['laplacian_var'][valid].mean())
+                metrics['local_entropy'] = float(tiles['entropy'][valid].mean())
+            metrics['zone_scores'] = self._zone_scores(ctx, scores, valid)
             
+            roughness = np.where(valid, (100 - scores) * (255 / HEATMAP_FULL_SCALE), 0).astype(np.float32)
+            heatmap = cv2.resize(roughness, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_LINEAR)
+            heatmap = ctx.restrict(np.clip(heatmap, 0, 255).astype(np.uint8))
+            
+            logger.info(f"Texture analysis complete: {metrics['overall_score']:.1f}/100")
+            return metrics, ctx.to_frame(heatmap)
+        
         except Exception as e:
             logger.error(f"Error in texture analysis: {e}")
             raise
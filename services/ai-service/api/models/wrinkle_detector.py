@@ -3,9 +3,13 @@ Wrinkles Detection Model (Mock Implementation)
 """
 import numpy as np
 import cv2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import logging
 
+from api.core.executor import run_in_worker
+from api.core.timing import timed_stage
+from api.utils.image_context import ImageContext
+
 logger = logging.getLogger(__name__)
 
 class WrinkleDetector:
@@ -18,7 +22,7 @@ class WrinkleDetector:
         self.device = device
         self.model = None
         self.is_loaded = False
-        
+    
     async def load_model(self, model_path: str):
         """Load pre-trained model weights"""
         try:
@@ -31,20 +35,25 @@ class WrinkleDetector:
     
     async def detect(
         self, 
-        image: np.ndarray, 
+        image: Union[np.ndarray, ImageContext], 
+        confidence_threshold: float = 0.5
+    ) -> List[Dict[str, Any]]:
+        """Detect wrinkles on the analysis worker pool (see detect_sync)"""
+        return await run_in_worker(self.detect_sync, image, confidence_threshold)
+    
+    @timed_stage("detect.wrinkles")
+    def detect_sync(
+        self, 
+        image: Union[np.ndarray, ImageContext], 
         confidence_threshold: float = 0.5
     ) -> List[Dict[str, Any]]:
         """Detect wrinkles in image"""
         try:
-            # Denormalize if needed
-            if image.dtype in [np.float32, np.float64]:
-                mean = np.array([0.485, 0.456, 0.406])
-                std = np.array([0.229, 0.224, 0.225])
-                image = image * std + mean
-                image = (image * 255).astype(np.uint8)
+            # Work on the skin region only (computed once per request)
+            ctx = ImageContext.ensure(image).roi
             
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            # Grayscale plane
+            gray = ctx.gray
             
             # Apply Gaussian blur
             blurred = cv2.GaussianBlur(gray, (5, 5), 0)
@@ -54,7 +63,7 @@ class WrinkleDetector:
             
             # Dilate to connect nearby edges
             kernel = np.ones((2, 2), np.uint8)
-            dilated = cv2.dilate(edges, kernel, iterations=1)
+            dilated = ctx.restrict(cv2.dilate(edges, kernel, iterations=1))
             
             # Find contours (wrinkle lines)
             contours, _ = cv2.findContours(
@@ -63,6 +72,7 @@ class WrinkleDetector:
                 cv2.CHAIN_APPROX_SIMPLE
             )
             
+            offset_x, offset_y = ctx.offset
             detections = []
             
             for contour in contours:
@@ -82,7 +92,7 @@ class WrinkleDetector:
                     continue
                 
                 detections.append({
-                    'bbox': [int(x), int(y), int(w), int(h)],
+                    'bbox': [int(x + offset_x), int(y + offset_y), int(w), int(h)],
                     'confidence': float(confidence),
                     'length_px': float(max(w, h)),
                     'depth_score': float(edge_density)
@@ -92,7 +102,7 @@ class WrinkleDetector:
             logger.info(f"Detected {len(detections)} wrinkles")
             
             return detections
-            
+        
         except Exception as e:
             logger.error(f"Error in wrinkle detection: {e}")
             raise
@@ -1,6 +1,6 @@
 """
 API routers initialization
 """
-from . import spots, wrinkles, texture, pores, multi_mode, uv_spots, brown_spots, red_areas, porphyrins, visualize
+from . import spots, wrinkles, texture, pores, multi_mode, uv_spots, brown_spots, red_areas, porphyrins, visualize, batch
 
-__all__ = ['spots', 'wrinkles', 'texture', 'pores', 'uv_spots', 'brown_spots', 'red_areas', 'porphyrins', 'multi_mode', 'visualize']
+__all__ = ['spots', 'wrinkles', 'texture', 'pores', 'uv_spots', 'brown_spots', 'red_areas', 'porphyrins', 'multi_mode', 'visualize', 'batch']
@@ -0,0 +1,167 @@
+"""
+Batch Analysis API Router
+Analyzes a session of photos in one request
+"""
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException
+from fastapi.responses import Response
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import time
+import logging
+
+from api.schemas import BatchAnalysisResponse, BatchImageResult
+from api.utils import decode_upload, prepare_image, ImageContext
+from api.core.config import settings
+from api.core.executor import run_in_worker
+from api.core.timing import timed_stage
+from api.core.analysis import parse_modes, run_detectors, build_mode_responses
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+model_loader = None
+
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png", "image/jpg"]
+
+def set_model_loader(loader):
+    global model_loader
+    model_loader = loader
+
+
+@timed_stage("serialize")
+def _serialize_result(
+    index: int,
+    filename: Optional[str],
+    raw_results: Dict[str, Any],
+    dimensions: Dict[str, int],
+    start_time: float
+) -> str:
+    """Build the per-mode responses for one image and serialize them to JSON"""
+    responses, overall_score = build_mode_responses(raw_results, dimensions)
+    result = BatchImageResult(
+        index=index,
+        filename=filename,
+        success=True,
+        image_dimensions=dimensions,
+        results={mode: response.model_dump(mode='json') for mode, response in responses.items()},
+        overall_score=round(overall_score, 1),
+        processing_time_ms=round((time.time() - start_time) * 1000, 2)
+    )
+    return result.model_dump_json()
+
+
+async def _analyze_one(
+    index: int,
+    file: UploadFile,
+    modes: List[str],
+    slots: asyncio.Semaphore
+) -> Tuple[bool, str]:
+    """
+    Decode, analyze and serialize one image of the batch
+    
+    Every stage runs on the worker pool, so while one image is being
+    analyzed the next ones are already decoding. Failures are reported
+    in the image's own result instead of failing the batch.
+    
+    Returns:
+        (success, serialized BatchImageResult)
+    """
+    async with slots:
+        start_time = time.time()
+        try:
+            if file.content_type not in ALLOWED_CONTENT_TYPES:
+                raise ValueError(f"Invalid file type: {file.content_type}. Allowed: JPEG, PNG")
+            
+            contents = await file.read()
+            # Header checks + reduced-size decode (image may be smaller than the upload)
+            decoded = await run_in_worker(decode_upload, contents, 1024)
+            if decoded is None:
+                raise ValueError("Failed to decode image")
+            image, (original_width, original_height) = decoded
+            
+            # Face crop + resize; transform maps frame coordinates back to the upload
+            processed, transform = await run_in_worker(
+                prepare_image, image, target_size=1024, original_size=(original_width, original_height)
+            )
+            del image
+            
+            raw_results = await run_detectors(model_loader, ImageContext(processed), modes, 0.5, transform)
+            
+            dimensions = {"width": original_width, "height": original_height}
+            fragment = await run_in_worker(
+                _serialize_result, index, file.filename, raw_results, dimensions, start_time
+            )
+            return True, fragment
+        
+        except Exception as e:
+            logger.warning(f"⚠️ Batch image {index} ({file.filename}) failed: {e}")
+            return False, BatchImageResult(
+                index=index,
+                filename=file.filename,
+                success=False,
+                error=str(e),
+                processing_time_ms=round((time.time() - start_time) * 1000, 2)
+            ).model_dump_json()
+
+
+@router.post("/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    modes: Optional[str] = Form(None)
+):
+    """
+    📚 Batch Analysis - Analyze a session of photos in one request
+    
+    Images are pipelined through decode, preprocessing, detection and
+    serialization on the analysis worker pool, overlapping stages between
+    images. A file that fails is reported in its own result and does not
+    fail the batch.
+    
+    - **files**: Image files (JPG, PNG), at most BATCH_MAX_IMAGES
+    - **modes**: Optional comma-separated modes (e.g. "spots,wrinkles,red_areas"), default all 8
+    
+    Returns one result per image, in upload order
+    """
+    start_time = time.time()
+    
+    if not model_loader:
+        raise HTTPException(500, "Model loader not initialized")
+    
+    if not files:
+        raise HTTPException(400, "No images provided")
+    
+    if len(files) > settings.BATCH_MAX_IMAGES:
+        raise HTTPException(400, f"Too many images: {len(files)} (max {settings.BATCH_MAX_IMAGES})")
+    
+    try:
+        selected_modes = parse_modes(modes)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    
+    logger.info(f"📚 Batch analysis starting: {len(files)} images, modes: {', '.join(selected_modes)}")
+    
+    # Bound the number of decoded images held in memory at once
+    slots = asyncio.Semaphore(max(1, settings.BATCH_MAX_IN_FLIGHT))
+    outcomes = await asyncio.gather(*(
+        _analyze_one(i, file, selected_modes, slots) for i, file in enumerate(files)
+    ))
+    
+    succeeded = sum(1 for success, _ in outcomes if success)
+    processing_time = (time.time() - start_time) * 1000
+    
+    # Per-image results are already serialized; splice them into the envelope
+    # (field order matches BatchAnalysisResponse)
+    header = {
+        "success": succeeded > 0,
+        "analysis_type": "batch",
+        "modes": selected_modes,
+        "total_images": len(files),
+        "succeeded": succeeded,
+        "failed": len(files) - succeeded,
+        "processing_time_ms": round(processing_time, 2),
+    }
+    body = json.dumps(header, separators=(',', ':'))[:-1] + ',"results":[' + ','.join(fragment for _, fragment in outcomes) + ']}'
+    
+    logger.info(f"✅ Batch analysis complete: {succeeded}/{len(files)} images, {processing_time:.0f}ms")
+    return Response(content=body, media_type="application/json")
@@ -1,29 +1,90 @@
 """
 Multi-Mode Analysis API Router
-Runs all 8 analysis modes in parallel
+Runs all 8 analysis modes (or a requested subset) in parallel
 """
-from fastapi import APIRouter, File, UploadFile, HTTPException
-import asyncio
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional
+import json
 import time
 import logging
 
 from api.schemas import MultiModeAnalysisResponse
-from api.utils import decode_image, preprocess_image
+from api.utils import decode_upload, ImageRejectedError, prepare_image, ImageContext
+from api.core.executor import run_in_worker
+from api.core.result_cache import get_result_cache
+from api.core.timing import current_timings
+from api.core.analysis import (
+    parse_modes, run_detectors, iter_detectors, build_mode_response, build_mode_responses
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 model_loader = None
 
+# Streaming formats: media type per format
+_STREAM_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
 def set_model_loader(loader):
     global model_loader
     model_loader = loader
 
 
+def _selected_modes(modes: Optional[str]) -> List[str]:
+    """parse_modes, with unknown names rejected as a 400"""
+    try:
+        return parse_modes(modes)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+def _multi_mode_response(
+    modes: List[str],
+    responses: Dict[str, Any],
+    overall_score: float,
+    start_time: float,
+    include_timings: bool
+) -> MultiModeAnalysisResponse:
+    red_areas = responses.get('red_areas')
+    porphyrins = responses.get('porphyrins')
+    return MultiModeAnalysisResponse(
+        success=True,
+        modes=modes,
+        spots=responses.get('spots'),
+        wrinkles=responses.get('wrinkles'),
+        texture=responses.get('texture'),
+        pores=responses.get('pores'),
+        uv_spots=responses.get('uv_spots'),
+        brown_spots=responses.get('brown_spots'),
+        red_areas=red_areas.model_dump() if red_areas else None,
+        porphyrins=porphyrins.model_dump() if porphyrins else None,
+        overall_score=round(overall_score, 1),
+        processing_time_ms=round((time.time() - start_time) * 1000, 2),
+        stage_timings_ms=current_timings() if include_timings else None
+    )
+
+
+def _format_event(stream_format: str, event: str, data: Dict[str, Any]) -> str:
+    """One stream event: an NDJSON line or a Server-Sent Event"""
+    payload = json.dumps(data, separators=(',', ':'))
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, **data}, separators=(',', ':')) + "\n"
+
+
 @router.post("/multi-mode", response_model=MultiModeAnalysisResponse)
-async def analyze_multi_mode(file: UploadFile = File(...)):
+async def analyze_multi_mode(
+    file: UploadFile = File(...),
+    modes: Optional[str] = Query(None, description="Comma-separated modes to run (e.g. spots,pores), default all 8"),
+    include_timings: bool = False
+):
     """
-    🎯 Multi-Mode Analysis - Run all 8 skin analysis modes
+    🎯 Multi-Mode Analysis - Run all 8 skin analysis modes (or a subset)
     
     Analyzes:
     1. Spots (hyperpigmentation)
@@ -36,6 +97,9 @@ async def analyze_multi_mode(file: UploadFile = File(...)):
     8. Porphyrins (bacteria, acne)
     
     - **file**: Image file (JPG, PNG)
+    - **modes**: Only run these detectors; the other modes are null in the
+      response and overall_score covers the modes that ran
+    - **include_timings**: Add per-stage durations (stage_timings_ms) to the response
     
     Returns comprehensive analysis across all modes
     """
@@ -45,197 +109,170 @@ async def analyze_multi_mode(file: UploadFile = File(...)):
         if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
             raise HTTPException(400, "Invalid file type")
         
+        selected_modes = _selected_modes(modes)
         contents = await file.read()
-        image = decode_image(contents)
         
-        if image is None:
+        # Repeat uploads are served from the result cache
+        cache_key, cached = await get_result_cache().lookup(contents, "multi-mode", modes=selected_modes)
+        if cached is not None:
+            logger.info("♻️ Multi-mode analysis served from cache")
+            return cached.model_copy(update={
+                "processing_time_ms": round((time.time() - start_time) * 1000, 2),
+                "stage_timings_ms": current_timings() if include_timings else None
+            })
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
             raise HTTPException(400, "Failed to decode image")
+        image, (original_width, original_height) = decoded
         
-        original_height, original_width = image.shape[:2]
         logger.info(f"🎯 Multi-mode analysis starting for {original_width}x{original_height} image")
         
-        processed = preprocess_image(image)
+        # Face crop + resize; transform maps frame coordinates back to the upload
+        processed, transform = await run_in_worker(
+            prepare_image, image, target_size=1024, original_size=(original_width, original_height)
+        )
+        
+        # Color planes are computed on first use and shared by all detectors
+        # (planes only needed by modes that were not requested are never built)
+        context = ImageContext(processed)
         
         if not model_loader:
             raise HTTPException(500, "Model loader not initialized")
         
-        # Get all 8 models
-        spot_model = model_loader.get_spot_model()
-        wrinkle_model = model_loader.get_wrinkle_model()
-        texture_model = model_loader.get_texture_model()
-        pores_model = model_loader.get_pores_model()
-        uv_spots_model = model_loader.get_uv_spots_model()
-        brown_spots_model = model_loader.get_brown_spots_model()
-        red_areas_model = model_loader.get_red_areas_model()
-        porphyrins_model = model_loader.get_porphyrins_model()
-        
-        # Execute all 8 analyses in parallel
-        spots_task = spot_model.detect(processed, 0.5)
-        wrinkles_task = wrinkle_model.detect(processed, 0.5)
-        texture_task = texture_model.analyze(processed)
-        pores_task = pores_model.detect(processed, 0.5)
-        uv_spots_task = uv_spots_model.detect(processed, 0.5)
-        brown_spots_task = brown_spots_model.detect(processed, 0.5)
-        red_areas_task = red_areas_model.detect(processed, 0.5)
-        porphyrins_task = porphyrins_model.detect(processed, 0.5)
-        
-        results = await asyncio.gather(
-            spots_task, wrinkles_task, texture_task, pores_task,
-            uv_spots_task, brown_spots_task, red_areas_task, porphyrins_task
-        )
-        
-        spots_detections = results[0]
-        wrinkles_detections = results[1]
-        texture_metrics = results[2]
-        pores_detections = results[3]
-        uv_spots_detections = results[4]
-        brown_spots_detections = results[5]
-        red_areas_result = results[6]  # Returns tuple (detections, heatmap)
-        porphyrins_detections = results[7]
-        
-        # Extract red areas detections and heatmap
-        red_areas_detections = red_areas_result[0] if isinstance(red_areas_result, tuple) else red_areas_result
-        red_areas_heatmap = red_areas_result[1] if isinstance(red_areas_result, tuple) else None
+        # Execute the selected analyses in parallel (each detector runs on the worker pool)
+        raw_results = await run_detectors(model_loader, context, selected_modes, 0.5, transform)
         
         # Build individual responses
-        # (Simplified - in production, call the individual endpoints)
-        from api.schemas import SpotsAnalysisResponse, WrinklesAnalysisResponse, TextureAnalysisResponse, PoresAnalysisResponse, AnalysisStatistics, SeverityLevel
-        import numpy as np
-        
-        # Spots
-        spots_count = len(spots_detections)
-        spots_avg_conf = float(np.mean([d['confidence'] for d in spots_detections])) if spots_detections else 0.0
-        spots_severity = min(100, spots_count * 1.5) if spots_detections else 0.0
-        spots_level = SeverityLevel.SEVERE if spots_severity >= 60 else (SeverityLevel.MODERATE if spots_severity >= 30 else SeverityLevel.MILD)
-        
-        spots_response = SpotsAnalysisResponse(
-            success=True,
-            detections=[{"id": i, "type": "spot", "bbox": d['bbox'], "confidence": d['confidence'], "size_mm": d.get('size_mm', 0), "melanin_density": d.get('melanin_density', 0)} for i, d in enumerate(spots_detections)],
-            statistics=AnalysisStatistics(total_count=spots_count, average_confidence=round(spots_avg_conf, 3), severity_score=round(spots_severity, 1), severity_level=spots_level),
-            image_dimensions={"width": original_width, "height": original_height}
-        )
-        
-        # Wrinkles
-        wrinkles_count = len(wrinkles_detections)
-        wrinkles_avg_conf = float(np.mean([d['confidence'] for d in wrinkles_detections])) if wrinkles_detections else 0.0
-        wrinkles_severity = min(100, wrinkles_count * 3) if wrinkles_detections else 0.0
-        wrinkles_level = SeverityLevel.SEVERE if wrinkles_severity >= 60 else (SeverityLevel.MODERATE if wrinkles_severity >= 30 else SeverityLevel.MILD)
-        
-        wrinkles_response = WrinklesAnalysisResponse(
-            success=True,
-            detections=wrinkles_detections,
-            statistics=AnalysisStatistics(total_count=wrinkles_count, average_confidence=round(wrinkles_avg_conf, 3), severity_score=round(wrinkles_severity, 1), severity_level=wrinkles_level),
-            image_dimensions={"width": original_width, "height": original_height}
-        )
-        
-        # Texture
-        texture_response = TextureAnalysisResponse(
-            success=True,
-            metrics=texture_metrics,
-            smoothness_score=round(texture_metrics['smoothness_score'], 1),
-            roughness_score=round(texture_metrics['roughness_score'], 1),
-            image_dimensions={"width": original_width, "height": original_height}
-        )
-        
-        # Pores
-        pores_count = len(pores_detections)
-        pores_avg_conf = float(np.mean([d['confidence'] for d in pores_detections])) if pores_detections else 0.0
-        pores_severity = min(100, pores_count / 2) if pores_detections else 0.0
-        pores_level = SeverityLevel.SEVERE if pores_severity >= 60 else (SeverityLevel.MODERATE if pores_severity >= 30 else SeverityLevel.MILD)
-        
-        pores_response = PoresAnalysisResponse(
-            success=True,
-            detections=[{"id": i, "type": "pore", "bbox": d['bbox'], "confidence": d['confidence'], "size_mm": d.get('size_mm', 0), "melanin_density": 0} for i, d in enumerate(pores_detections)],
-            statistics=AnalysisStatistics(total_count=pores_count, average_confidence=round(pores_avg_conf, 3), severity_score=round(pores_severity, 1), severity_level=pores_level),
-            image_dimensions={"width": original_width, "height": original_height}
-        )
-        
-        # UV Spots
-        uv_spots_count = len(uv_spots_detections)
-        uv_spots_avg_conf = float(np.mean([d['confidence'] for d in uv_spots_detections])) if uv_spots_detections else 0.0
-        uv_spots_severity = min(100, uv_spots_count * 2) if uv_spots_detections else 0.0
-        uv_spots_level = SeverityLevel.SEVERE if uv_spots_severity >= 60 else (SeverityLevel.MODERATE if uv_spots_severity >= 30 else SeverityLevel.MILD)
-        
-        uv_spots_response = SpotsAnalysisResponse(
-            success=True,
-            detections=[{"id": i, "type": "uv_spot", "bbox": d['bbox'], "confidence": d['confidence'], "size_mm": d.get('size_mm', 0), "melanin_density": d.get('depth_score', 0)} for i, d in enumerate(uv_spots_detections)],
-            statistics=AnalysisStatistics(total_count=uv_spots_count, average_confidence=round(uv_spots_avg_conf, 3), severity_score=round(uv_spots_severity, 1), severity_level=uv_spots_level),
-            image_dimensions={"width": original_width, "height": original_height}
-        )
-        
-        # Brown Spots
-        brown_spots_count = len(brown_spots_detections)
-        brown_spots_avg_conf = float(np.mean([d['confidence'] for d in brown_spots_detections])) if brown_spots_detections else 0.0
-        brown_spots_severity = min(100, brown_spots_count * 1.8) if brown_spots_detections else 0.0
-        brown_spots_level = SeverityLevel.SEVERE if brown_spots_severity >= 60 else (SeverityLevel.MODERATE if brown_spots_severity >= 30 else SeverityLevel.MILD)
-        
-        brown_spots_response = SpotsAnalysisResponse(
-            success=True,
-            detections=[{"id": i, "type": "brown_spot", "bbox": d['bbox'], "confidence": d['confidence'], "size_mm": d.get('size_mm', 0), "melanin_density": d.get('melanin_intensity', 0)} for i, d in enumerate(brown_spots_detections)],
-            statistics=AnalysisStatistics(total_count=brown_spots_count, average_confidence=round(brown_spots_avg_conf, 3), severity_score=round(brown_spots_severity, 1), severity_level=brown_spots_level),
-            image_dimensions={"width": original_width, "height": original_height}
-        )
+        # Overall score (0-100, higher = better skin health) weights the modes that ran equally
+        dimensions = {"width": original_width, "height": original_height}
+        responses, overall_score = build_mode_responses(raw_results, dimensions)
         
-        # Red Areas
-        red_areas_count = len(red_areas_detections)
-        red_areas_avg_conf = float(np.mean([d['confidence'] for d in red_areas_detections])) if red_areas_detections else 0.0
-        red_areas_severity = min(100, red_areas_count * 4) if red_areas_detections else 0.0
-        red_areas_level = SeverityLevel.SEVERE if red_areas_severity >= 60 else (SeverityLevel.MODERATE if red_areas_severity >= 30 else SeverityLevel.MILD)
+        response = _multi_mode_response(selected_modes, responses, overall_score, start_time, include_timings)
         
-        red_areas_response = SpotsAnalysisResponse(
-            success=True,
-            detections=[{"id": i, "type": "red_area", "bbox": d['bbox'], "confidence": d['confidence'], "size_mm": 0, "melanin_density": d.get('redness_intensity', 0)} for i, d in enumerate(red_areas_detections)],
-            statistics=AnalysisStatistics(total_count=red_areas_count, average_confidence=round(red_areas_avg_conf, 3), severity_score=round(red_areas_severity, 1), severity_level=red_areas_level),
-            image_dimensions={"width": original_width, "height": original_height}
+        logger.info(
+            f"✅ Multi-mode analysis complete: overall {overall_score:.1f}/100, "
+            f"{response.processing_time_ms:.0f}ms"
         )
-        
-        # Porphyrins
-        porphyrins_count = len(porphyrins_detections)
-        porphyrins_avg_conf = float(np.mean([d['confidence'] for d in porphyrins_detections])) if porphyrins_detections else 0.0
-        porphyrins_severity = min(100, porphyrins_count * 3) if porphyrins_detections else 0.0
-        porphyrins_level = SeverityLevel.SEVERE if porphyrins_severity >= 60 else (SeverityLevel.MODERATE if porphyrins_severity >= 30 else SeverityLevel.MILD)
-        
-        porphyrins_response = SpotsAnalysisResponse(
-            success=True,
-            detections=[{"id": i, "type": "porphyrin", "bbox": d['bbox'], "confidence": d['confidence'], "size_mm": d.get('size_mm', 0), "melanin_density": d.get('fluorescence_intensity', 0)} for i, d in enumerate(porphyrins_detections)],
-            statistics=AnalysisStatistics(total_count=porphyrins_count, average_confidence=round(porphyrins_avg_conf, 3), severity_score=round(porphyrins_severity, 1), severity_level=porphyrins_level),
-            image_dimensions={"width": original_width, "height": original_height}
-        )
-        
-        # Calculate overall score (0-100, higher = better skin health)
-        # Weight all 8 modes equally
-        overall_score = (
-            max(0, 100 - spots_severity) * 0.125 +
-            max(0, 100 - wrinkles_severity) * 0.125 +
-            texture_metrics['overall_score'] * 0.125 +
-            max(0, 100 - pores_severity) * 0.125 +
-            max(0, 100 - uv_spots_severity) * 0.125 +
-            max(0, 100 - brown_spots_severity) * 0.125 +
-            max(0, 100 - red_areas_severity) * 0.125 +
-            max(0, 100 - porphyrins_severity) * 0.125
-        )
-        
-        processing_time = (time.time() - start_time) * 1000
-        
-        response = MultiModeAnalysisResponse(
-            success=True,
-            spots=spots_response,
-            wrinkles=wrinkles_response,
-            texture=texture_response,
-            pores=pores_response,
-            uv_spots=uv_spots_response,
-            brown_spots=brown_spots_response,
-            red_areas=red_areas_response.dict(),
-            porphyrins=porphyrins_response.dict(),
-            overall_score=round(overall_score, 1),
-            processing_time_ms=round(processing_time, 2)
-        )
-        
-        logger.info(f"✅ Multi-mode analysis complete: overall {overall_score:.1f}/100, {processing_time:.0f}ms")
+        await get_result_cache().store(cache_key, response)
         return response
-        
+    
     except HTTPException:
         raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
     except Exception as e:
         logger.error(f"❌ Error: {e}", exc_info=True)
         raise HTTPException(500, f"Analysis failed: {str(e)}")
+
+
+@router.post("/multi-mode/stream")
+async def analyze_multi_mode_stream(
+    file: UploadFile = File(...),
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$", description="ndjson or sse"),
+    modes: Optional[str] = Query(None, description="Comma-separated modes to run (e.g. spots,pores), default all 8"),
+    include_timings: bool = False
+):
+    """
+    🎯 Streaming Multi-Mode Analysis - Results of each mode as soon as it finishes
+    
+    Same analysis as /multi-mode, but each mode is sent as its own event the
+    moment its detector completes (fast modes like texture arrive first),
+    followed by a summary event:
+    
+    - `mode`: {"mode": "texture", "result": {...TextureAnalysisResponse}, "elapsed_ms": 12.3}
+    - `summary`: {"overall_score": 87.5, "modes": [...], "processing_time_ms": 450.1}
+    - `error`: {"detail": "..."} if analysis fails after streaming started
+    
+    - **file**: Image file (JPG, PNG)
+    - **format**: `ndjson` (one JSON object per line, with an "event" field)
+      or `sse` (text/event-stream)
+    - **modes**: Only run (and stream) these modes
+    - **include_timings**: Add per-stage durations (stage_timings_ms) to the summary
+    """
+    start_time = time.time()
+    
+    if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
+        raise HTTPException(400, "Invalid file type")
+    
+    if not model_loader:
+        raise HTTPException(500, "Model loader not initialized")
+    
+    selected_modes = _selected_modes(modes)
+    contents = await file.read()
+    
+    # A cached /multi-mode result is replayed as a stream
+    cache_key, cached = await get_result_cache().lookup(contents, "multi-mode", modes=selected_modes)
+    
+    context = None
+    dimensions = None
+    transform = None
+    if cached is None:
+        # Decode before streaming starts so bad uploads still get a 400
+        # (header checks + reduced-size decode; image may be smaller than the upload)
+        try:
+            decoded = await run_in_worker(decode_upload, contents, 1024)
+        except ImageRejectedError as e:
+            raise HTTPException(e.status_code, str(e))
+        if decoded is None:
+            raise HTTPException(400, "Failed to decode image")
+        image, (original_width, original_height) = decoded
+        
+        dimensions = {"width": original_width, "height": original_height}
+        # Face crop + resize; transform maps frame coordinates back to the upload
+        processed, transform = await run_in_worker(
+            prepare_image, image, target_size=1024, original_size=(original_width, original_height)
+        )
+        context = ImageContext(processed)
+    
+    def elapsed_ms() -> float:
+        return round((time.time() - start_time) * 1000, 2)
+    
+    def summary(overall_score: float) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "overall_score": round(overall_score, 1),
+            "modes": selected_modes,
+            "processing_time_ms": elapsed_ms(),
+            "stage_timings_ms": current_timings() if include_timings else None,
+        }
+    
+    async def events() -> AsyncIterator[str]:
+        if cached is not None:
+            logger.info("♻️ Streaming multi-mode analysis served from cache")
+            for mode in selected_modes:
+                result = getattr(cached, mode)
+                if hasattr(result, 'model_dump'):
+                    result = result.model_dump(mode='json')
+                yield _format_event(format, "mode", {"mode": mode, "result": result, "elapsed_ms": elapsed_ms()})
+            yield _format_event(format, "summary", summary(cached.overall_score))
+            return
+        
+        try:
+            responses = {}
+            health_scores = []
+            async for mode, raw in iter_detectors(model_loader, context, selected_modes, 0.5, transform):
+                responses[mode], health = build_mode_response(mode, raw, dimensions)
+                health_scores.append(health)
+                result = responses[mode].model_dump(mode='json')
+                yield _format_event(format, "mode", {"mode": mode, "result": result, "elapsed_ms": elapsed_ms()})
+            
+            # Same score as /multi-mode (modes that ran weighted equally)
+            overall_score = sum(health_scores) / len(health_scores) if health_scores else 0.0
+            yield _format_event(format, "summary", summary(overall_score))
+            
+            logger.info(f"✅ Streaming multi-mode analysis complete: overall {overall_score:.1f}/100, {elapsed_ms():.0f}ms")
+            response = _multi_mode_response(selected_modes, responses, overall_score, start_time, False)
+            await get_result_cache().store(cache_key, response)
+        
+        except Exception as e:
+            logger.error(f"❌ Error: {e}", exc_info=True)
+            yield _format_event(format, "error", {"success": False, "detail": f"Analysis failed: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type=_STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
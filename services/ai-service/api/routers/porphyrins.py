@@ -8,7 +8,11 @@ import time
 import logging
 
 from api.schemas import AnalysisStatistics, SeverityLevel
-from api.utils import decode_image, preprocess_image
+from api.utils import decode_upload, ImageRejectedError, prepare_image
+from api.core.analysis import detect_mode
+from api.core.executor import run_in_worker
+from api.core.result_cache import get_result_cache
+from api.core.timing import current_timings
 from pydantic import BaseModel
 from typing import List, Dict, Any
 
@@ -41,12 +45,14 @@ class PorphyrinsAnalysisResponse(BaseModel):
     image_dimensions: Dict[str, int]
     overall_bacterial_load: float
     processing_time_ms: float | None = None
+    stage_timings_ms: Dict[str, float] | None = None
 
 
 @router.post("/porphyrins", response_model=PorphyrinsAnalysisResponse)
 async def analyze_porphyrins(
     file: UploadFile = File(...),
-    confidence_threshold: float = 0.5
+    confidence_threshold: float = 0.5,
+    include_timings: bool = False
 ):
     """
     💡 Analyze porphyrins (bacterial fluorescence, P. acnes detection)
@@ -55,6 +61,7 @@ async def analyze_porphyrins(
     
     - **file**: Image file (JPG, PNG)
     - **confidence_threshold**: Minimum confidence score (0.0-1.0)
+    - **include_timings**: Add per-stage durations (stage_timings_ms) to the response
     
     Returns detection boxes with bacterial load and activity classification
     """
@@ -65,21 +72,35 @@ async def analyze_porphyrins(
             raise HTTPException(400, "Invalid file type. Only JPG/PNG allowed.")
         
         contents = await file.read()
-        image = decode_image(contents)
         
-        if image is None:
+        # Repeat uploads are served from the result cache
+        cache_key, cached = await get_result_cache().lookup(contents, "porphyrins", confidence_threshold=confidence_threshold)
+        if cached is not None:
+            logger.info("♻️ Porphyrins analysis served from cache")
+            return cached.model_copy(update={
+                "processing_time_ms": round((time.time() - start_time) * 1000, 2),
+                "stage_timings_ms": current_timings() if include_timings else None
+            })
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
             raise HTTPException(400, "Failed to decode image")
+        image, (original_width, original_height) = decoded
         
-        original_height, original_width = image.shape[:2]
         logger.info(f"💡 Porphyrins analysis: {original_width}x{original_height}")
         
-        processed = preprocess_image(image, target_size=1024, normalize=True)
+        # Face crop + resize; transform maps frame coordinates back to the upload
+        processed, transform = await run_in_worker(
+            prepare_image, image, target_size=1024, original_size=(original_width, original_height)
+        )
         
         if not model_loader:
             raise HTTPException(500, "Model loader not initialized")
         
-        porphyrin_model = model_loader.get_porphyrins_model()
-        detections = await porphyrin_model.detect(processed, confidence_threshold)
+        # Detections are mapped back to original image coordinates
+        detections = await detect_mode(model_loader, processed, 'porphyrins', confidence_threshold, transform)
         
         # Calculate statistics
         total_colonies = len(detections)
@@ -128,14 +149,18 @@ async def analyze_porphyrins(
             ),
             image_dimensions={"width": original_width, "height": original_height},
             overall_bacterial_load=round(bacterial_load, 2),
-            processing_time_ms=round(processing_time, 2)
+            processing_time_ms=round(processing_time, 2),
+            stage_timings_ms=current_timings() if include_timings else None
         )
         
         logger.info(f"✅ Porphyrins: {total_colonies} colonies, load {bacterial_load:.1f}/10, {processing_time:.0f}ms")
+        await get_result_cache().store(cache_key, response)
         return response
-        
+    
     except HTTPException:
         raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
     except Exception as e:
         logger.error(f"❌ Porphyrins error: {e}", exc_info=True)
         raise HTTPException(500, f"Analysis failed: {str(e)}")
@@ -10,7 +10,11 @@ import cv2
 import base64
 
 from api.schemas import AnalysisStatistics, SeverityLevel
-from api.utils import decode_image, preprocess_image
+from api.utils import decode_upload, ImageRejectedError, prepare_image
+from api.core.analysis import detect_mode
+from api.core.executor import run_in_worker
+from api.core.result_cache import get_result_cache
+from api.core.timing import current_timings, stage
 from pydantic import BaseModel
 from typing import List, Dict, Any
 
@@ -43,13 +47,15 @@ class RedAreasAnalysisResponse(BaseModel):
     heatmap_base64: str | None = None
     coverage_percentage: float
     processing_time_ms: float | None = None
+    stage_timings_ms: Dict[str, float] | None = None
 
 
 @router.post("/red-areas", response_model=RedAreasAnalysisResponse)
 async def analyze_red_areas(
     file: UploadFile = File(...),
     confidence_threshold: float = 0.5,
-    include_heatmap: bool = True
+    include_heatmap: bool = True,
+    include_timings: bool = False
 ):
     """
     🔴 Analyze red areas (inflammation, redness, rosacea, blood vessels)
@@ -59,6 +65,7 @@ async def analyze_red_areas(
     - **file**: Image file (JPG, PNG)
     - **confidence_threshold**: Minimum confidence score (0.0-1.0)
     - **include_heatmap**: Return base64-encoded heatmap image
+    - **include_timings**: Add per-stage durations (stage_timings_ms) to the response
     
     Returns detection boxes, heatmap, and coverage percentage
     """
@@ -69,21 +76,35 @@ async def analyze_red_areas(
             raise HTTPException(400, "Invalid file type. Only JPG/PNG allowed.")
         
         contents = await file.read()
-        image = decode_image(contents)
         
-        if image is None:
+        # Repeat uploads are served from the result cache
+        cache_key, cached = await get_result_cache().lookup(contents, "red_areas", confidence_threshold=confidence_threshold, include_heatmap=include_heatmap)
+        if cached is not None:
+            logger.info("♻️ Red areas analysis served from cache")
+            return cached.model_copy(update={
+                "processing_time_ms": round((time.time() - start_time) * 1000, 2),
+                "stage_timings_ms": current_timings() if include_timings else None
+            })
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
             raise HTTPException(400, "Failed to decode image")
+        image, (original_width, original_height) = decoded
         
-        original_height, original_width = image.shape[:2]
         logger.info(f"🔴 Red areas analysis: {original_width}x{original_height}")
         
-        processed = preprocess_image(image, target_size=1024, normalize=True)
+        # Face crop + resize; transform maps frame coordinates back to the upload
+        processed, transform = await run_in_worker(
+            prepare_image, image, target_size=1024, original_size=(original_width, original_height)
+        )
         
         if not model_loader:
             raise HTTPException(500, "Model loader not initialized")
         
-        red_model = model_loader.get_red_areas_model()
-        detections, heatmap_colored = await red_model.detect(processed, confidence_threshold)
+        # Detections are mapped back to original image coordinates
+        detections, heatmap_colored = await detect_mode(model_loader, processed, 'red_areas', confidence_threshold, transform)
         
         # Calculate statistics
         total_areas = len(detections)
@@ -121,7 +142,10 @@ async def analyze_red_areas(
         # Encode heatmap as base64
         heatmap_base64 = None
         if include_heatmap and heatmap_colored is not None:
-            _, buffer = cv2.imencode('.png', heatmap_colored)
+            # Same extent as the upload (aligned with the boxes), at most 1024 px
+            heatmap_colored = transform.warp_to_original(heatmap_colored, max_side=1024)
+            with stage("encode"):
+                _, buffer = cv2.imencode('.png', heatmap_colored)
             heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
         
         processing_time = (time.time() - start_time) * 1000
@@ -138,14 +162,18 @@ async def analyze_red_areas(
             image_dimensions={"width": original_width, "height": original_height},
             heatmap_base64=heatmap_base64,
             coverage_percentage=round(coverage, 2),
-            processing_time_ms=round(processing_time, 2)
+            processing_time_ms=round(processing_time, 2),
+            stage_timings_ms=current_timings() if include_timings else None
         )
         
         logger.info(f"✅ Red areas: {total_areas} detections, {coverage:.1f}% coverage, {processing_time:.0f}ms")
+        await get_result_cache().store(cache_key, response)
         return response
-        
+    
     except HTTPException:
         raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
     except Exception as e:
         logger.error(f"❌ Red areas error: {e}", exc_info=True)
         raise HTTPException(500, f"Analysis failed: {str(e)}")
@@ -4,9 +4,15 @@ Texture Analysis API Router
 from fastapi import APIRouter, File, UploadFile, HTTPException
 import time
 import logging
+import cv2
+import base64
 
 from api.schemas import TextureAnalysisResponse
-from api.utils import decode_image, preprocess_image
+from api.utils import decode_upload, ImageRejectedError, prepare_image
+from api.core.analysis import detect_mode, texture_response
+from api.core.executor import run_in_worker
+from api.core.result_cache import get_result_cache
+from api.core.timing import current_timings, stage
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -19,13 +25,19 @@ def set_model_loader(loader):
 
 
 @router.post("/texture", response_model=TextureAnalysisResponse)
-async def analyze_texture(file: UploadFile = File(...)):
+async def analyze_texture(
+    file: UploadFile = File(...),
+    include_heatmap: bool = False,
+    include_timings: bool = False
+):
     """
     🔬 Analyze skin texture, smoothness, and roughness
     
     - **file**: Image file (JPG, PNG)
+    - **include_heatmap**: Return a base64-encoded roughness heatmap (roughness_map)
+    - **include_timings**: Add per-stage durations (stage_timings_ms) to the response
     
-    Returns texture metrics and scores
+    Returns texture metrics, scores and per-face-zone scores
     """
     start_time = time.time()
     
@@ -34,36 +46,60 @@ async def analyze_texture(file: UploadFile = File(...)):
             raise HTTPException(400, "Invalid file type")
         
         contents = await file.read()
-        image = decode_image(contents)
         
-        if image is None:
+        # Repeat uploads are served from the result cache
+        cache_key, cached = await get_result_cache().lookup(contents, "texture", include_heatmap=include_heatmap)
+        if cached is not None:
+            logger.info("♻️ Texture analysis served from cache")
+            return cached.model_copy(update={
+                "processing_time_ms": round((time.time() - start_time) * 1000, 2),
+                "stage_timings_ms": current_timings() if include_timings else None
+            })
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
             raise HTTPException(400, "Failed to decode image")
+        image, (original_width, original_height) = decoded
         
-        original_height, original_width = image.shape[:2]
-        processed = preprocess_image(image)
+        # Face crop + resize; transform maps the heatmap back to the upload
+        processed, transform = await run_in_worker(
+            prepare_image, image, target_size=1024, original_size=(original_width, original_height)
+        )
         
         if not model_loader:
             raise HTTPException(500, "Model loader not initialized")
         
-        texture_model = model_loader.get_texture_model()
-        metrics = await texture_model.analyze(processed)
+        metrics, heatmap = await detect_mode(model_loader, processed, 'texture')
+        
+        # Encode heatmap as base64
+        roughness_map = None
+        if include_heatmap:
+            # Same extent as the upload, at most 1024 px
+            heatmap = transform.warp_to_original(heatmap, max_side=1024)
+            with stage("encode"):
+                _, buffer = cv2.imencode('.png', cv2.applyColorMap(heatmap, cv2.COLORMAP_JET))
+            roughness_map = base64.b64encode(buffer).decode('utf-8')
         
         processing_time = (time.time() - start_time) * 1000
         
-        response = TextureAnalysisResponse(
-            success=True,
-            metrics=metrics,
-            smoothness_score=round(metrics['smoothness_score'], 1),
-            roughness_score=round(metrics['roughness_score'], 1),
-            image_dimensions={"width": original_width, "height": original_height},
-            processing_time_ms=round(processing_time, 2)
+        response = texture_response(
+            metrics,
+            {"width": original_width, "height": original_height},
+            roughness_map=roughness_map,
+            processing_time_ms=round(processing_time, 2),
+            stage_timings_ms=current_timings() if include_timings else None
         )
         
         logger.info(f"✅ Texture analysis: {metrics['overall_score']:.1f}/100, {processing_time:.0f}ms")
+        await get_result_cache().store(cache_key, response)
         return response
-        
+    
     except HTTPException:
         raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
     except Exception as e:
         logger.error(f"❌ Error: {e}", exc_info=True)
         raise HTTPException(500, f"Analysis failed: {str(e)}")
@@ -2,16 +2,21 @@
 Visualization API Router
 Generate annotated images with professional overlays
 """
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Query
 from fastapi.responses import Response
+from pydantic import ValidationError
 import cv2
+import numpy as np
 import time
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
-from api.utils import decode_image, preprocess_image, OverlayRenderer, create_multimode_visualization
-from api.core.model_loader import ModelLoader
-import asyncio
+from api.schemas import MultiModeAnalysisResponse
+from api.utils import decode_upload, encode_image, ImageRejectedError, prepare_image, ImageContext, OverlayRenderer, create_multimode_visualization, FrameTransform
+from api.core.analysis import ANALYSIS_MODES, parse_modes, detect_mode, run_detectors
+from api.core.executor import run_in_worker
+from api.core.result_cache import get_result_cache
+from api.core.timing import stage
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -24,6 +29,178 @@ def set_model_loader(loader):
     model_loader = loader
 
 
+def _cached_image_response(cached, start_time: float) -> Response:
+    """Image response for a cached (content, media_type, headers) visualization"""
+    content, media_type, headers = cached
+    processing_time = (time.time() - start_time) * 1000
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"X-Processing-Time": f"{processing_time:.2f}ms", "X-Cache": "HIT", **headers}
+    )
+
+
+def _selected_modes(modes: Optional[str]) -> List[str]:
+    """parse_modes, with unknown names rejected as a 400"""
+    try:
+        return parse_modes(modes)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+def _scale_results(results: Dict[str, Any], image_shape) -> Dict[str, Any]:
+    """
+    Map multi-mode results (in coordinates of the uploaded image) onto the
+    decoded image, which may have been decoded at reduced size
+    
+    Raises:
+        HTTPException: 422 if no mode's result has image_dimensions
+    """
+    dimensions = next(
+        (results[mode]['image_dimensions'] for mode in ANALYSIS_MODES
+         if results.get(mode) and results[mode].get('image_dimensions')),
+        None
+    )
+    if dimensions is None:
+        raise HTTPException(422, "Invalid results: no mode result with image_dimensions")
+    height, width = image_shape[:2]
+    transform = FrameTransform(
+        np.array([
+            [dimensions['width'] / width, 0.0, 0.0],
+            [0.0, dimensions['height'] / height, 0.0]
+        ]),
+        image_shape
+    )
+    
+    scaled = dict(results)
+    for mode, result in results.items():
+        if isinstance(result, dict) and result.get('detections'):
+            scaled[mode] = {**result, 'detections': transform.map_detections(result['detections'])}
+    return scaled
+
+
+def _render_multi_mode(
+    image: np.ndarray,
+    results: Dict[str, Any],
+    red_areas_heatmap: Optional[np.ndarray],
+    transform: FrameTransform,
+    start_time: float,
+    show_legend: bool = True,
+    show_stats: bool = True,
+    show_numbers: bool = True
+):
+    """
+    Draw run_detectors results on the decoded image (runs on the worker pool)
+    
+    Returns:
+        (annotated RGB image, total detection count)
+    """
+    spots_detections = results.get('spots', [])
+    wrinkles_detections = results.get('wrinkles', [])
+    pores_detections = results.get('pores', [])
+    uv_spots_detections = results.get('uv_spots', [])
+    brown_spots_detections = results.get('brown_spots', [])
+    porphyrins_detections = results.get('porphyrins', [])
+    
+    # Red areas heatmap is still in frame coordinates
+    if red_areas_heatmap is not None:
+        red_areas_heatmap = transform.warp_to_original(red_areas_heatmap)
+    
+    # Create overlay renderer
+    renderer = OverlayRenderer(image)
+    
+    # Draw spots (general surface spots)
+    if spots_detections:
+        renderer.draw_spots(spots_detections, 'spots', show_numbers=show_numbers)
+    
+    # Draw UV spots (subsurface pigmentation)
+    if uv_spots_detections:
+        renderer.draw_spots(uv_spots_detections, 'uv_spots', show_numbers=show_numbers)
+    
+    # Draw brown spots (sun damage, age spots)
+    if brown_spots_detections:
+        renderer.draw_spots(brown_spots_detections, 'brown_spots', show_numbers=show_numbers)
+    
+    # Draw porphyrins (bacterial fluorescence)
+    if porphyrins_detections:
+        renderer.draw_spots(porphyrins_detections, 'porphyrins', show_numbers=show_numbers)
+    
+    # Draw wrinkles
+    if wrinkles_detections:
+        renderer.draw_wrinkles(wrinkles_detections, show_numbers=show_numbers)
+    
+    # Draw pores (usually without numbers due to high count)
+    if pores_detections:
+        renderer.draw_pores(pores_detections, show_numbers=False)
+    
+    # Draw red areas heatmap
+    if red_areas_heatmap is not None:
+        renderer.draw_heatmap_overlay(red_areas_heatmap, alpha=0.4, colormap=cv2.COLORMAP_JET)
+    
+    # Draw legend
+    if show_legend:
+        counts = {
+            'spots': len(spots_detections),
+            'uv_spots': len(uv_spots_detections),
+            'brown_spots': len(brown_spots_detections),
+            'porphyrins': len(porphyrins_detections),
+            'wrinkles': len(wrinkles_detections),
+            'pores': len(pores_detections),
+        }
+        legend_modes = [k for k, v in counts.items() if v > 0]
+        if legend_modes:
+            renderer.draw_legend(legend_modes, counts, position='top-right')
+    
+    total_detections = (
+        len(spots_detections) + len(uv_spots_detections) + 
+        len(brown_spots_detections) + len(porphyrins_detections) +
+        len(wrinkles_detections) + len(pores_detections)
+    )
+    
+    # Draw stats panel
+    if show_stats:
+        processing_time = (time.time() - start_time) * 1000
+        stats = {
+            'Total Detections': total_detections,
+            'Processing Time': f"{processing_time:.0f}ms"
+        }
+        renderer.draw_stats_panel(stats, position='bottom-left')
+    
+    # Get final annotated image
+    return renderer.get_result('RGB'), total_detections
+
+
+def _render_single_mode(
+    image: np.ndarray,
+    mode: str,
+    detections,
+    heatmap: Optional[np.ndarray],
+    transform: FrameTransform,
+    show_numbers: bool = True,
+    show_confidence: bool = False
+) -> np.ndarray:
+    """Draw one mode's result on the decoded image (runs on the worker pool)"""
+    # Heatmap is still in frame coordinates
+    if heatmap is not None:
+        heatmap = transform.warp_to_original(heatmap)
+    
+    # Create overlay
+    renderer = OverlayRenderer(image)
+    
+    if mode in ['spots', 'uv_spots', 'brown_spots', 'porphyrins']:
+        renderer.draw_spots(detections, mode, show_numbers=show_numbers, 
+                          show_confidence=show_confidence)
+    elif mode == 'wrinkles':
+        renderer.draw_wrinkles(detections, show_numbers=show_numbers)
+    elif mode == 'pores':
+        renderer.draw_pores(detections, show_numbers=show_numbers)
+    elif mode in ('red_areas', 'texture') and heatmap is not None:
+        renderer.draw_heatmap_overlay(heatmap, alpha=0.5, colormap=cv2.COLORMAP_JET)
+    
+    # Get result
+    return renderer.get_result('RGB')
+
+
 @router.post("/visualize/multi-mode")
 async def visualize_multi_mode(
     file: UploadFile = File(...),
@@ -31,6 +208,11 @@ async def visualize_multi_mode(
     show_stats: bool = Query(True, description="Show statistics panel"),
     show_numbers: bool = Query(True, description="Show detection numbers on markers"),
     include_heatmap: bool = Query(True, description="Include red areas heatmap"),
+    modes: Optional[str] = Query(None, description="Comma-separated modes to run and draw (e.g. spots,pores), default all 8"),
+    format: Optional[str] = Query(None, pattern="^(png|jpeg|webp)$", description="Output format: png, jpeg or webp (default: VISUALIZATION_FORMAT)"),
+    quality: Optional[int] = Query(None, ge=1, le=100, description="JPEG/WebP quality"),
+    compression: Optional[int] = Query(None, ge=0, le=9, description="PNG compression level"),
+    max_dimension: Optional[int] = Query(None, ge=0, description="Downscale the output so its longest side is at most this (0 = full size)"),
 ):
     """
     🎨 Generate Annotated Image - Professional 8-Mode Visualization
@@ -44,7 +226,9 @@ async def visualize_multi_mode(
     - 📏 Magenta lines for wrinkles
     - ⚫ Cyan dots for pores
     
-    Returns annotated image as PNG
+    `modes` limits the detectors that run (and the overlays drawn).
+    Returns annotated image (PNG by default; `format`, `quality`,
+    `compression` and `max_dimension` select a smaller preview encoding)
     """
     start_time = time.time()
     
@@ -52,140 +236,177 @@ async def visualize_multi_mode(
         if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
             raise HTTPException(400, "Invalid file type. Only JPG/PNG allowed.")
         
+        selected_modes = _selected_modes(modes)
         contents = await file.read()
-        image = decode_image(contents)
         
-        if image is None:
+        # Repeat uploads are served from the result cache
+        cache_key, cached = await get_result_cache().lookup(
+            contents, "visualize/multi-mode", modes=selected_modes,
+            show_legend=show_legend, show_stats=show_stats,
+            show_numbers=show_numbers, include_heatmap=include_heatmap,
+            format=format, quality=quality, compression=compression, max_dimension=max_dimension
+        )
+        if cached is not None:
+            logger.info("♻️ Visualization served from cache")
+            return _cached_image_response(cached, start_time)
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
             raise HTTPException(400, "Failed to decode image")
+        image, _ = decoded  # Overlays are drawn on the decoded image
         
         original_image = image.copy()
         logger.info(f"🎨 Visualization: {image.shape[1]}x{image.shape[0]}")
         
-        processed = preprocess_image(image, target_size=1024, normalize=True)
+        # Face crop + resize; transform maps frame coordinates back to the upload
+        processed, transform = await run_in_worker(prepare_image, image, target_size=1024)
         
         if not model_loader:
             raise HTTPException(500, "Model loader not initialized")
         
-        # Get all 8 models
-        spot_model = model_loader.get_spot_model()
-        wrinkle_model = model_loader.get_wrinkle_model()
-        texture_model = model_loader.get_texture_model()
-        pores_model = model_loader.get_pores_model()
-        uv_spots_model = model_loader.get_uv_spots_model()
-        brown_spots_model = model_loader.get_brown_spots_model()
-        red_areas_model = model_loader.get_red_areas_model()
-        porphyrins_model = model_loader.get_porphyrins_model()
-        
-        # Run all analyses in parallel
-        results = await asyncio.gather(
-            spot_model.detect(processed, 0.5),
-            wrinkle_model.detect(processed, 0.5),
-            texture_model.analyze(processed),
-            pores_model.detect(processed, 0.5),
-            uv_spots_model.detect(processed, 0.5),
-            brown_spots_model.detect(processed, 0.5),
-            red_areas_model.detect(processed, 0.5),
-            porphyrins_model.detect(processed, 0.5)
-        )
+        # Color planes are computed once and shared by all detectors
+        context = ImageContext(processed)
         
-        spots_detections = results[0]
-        wrinkles_detections = results[1]
-        texture_metrics = results[2]
-        pores_detections = results[3]
-        uv_spots_detections = results[4]
-        brown_spots_detections = results[5]
-        red_areas_result = results[6]
-        porphyrins_detections = results[7]
-        
-        # Extract red areas data
-        red_areas_detections = red_areas_result[0] if isinstance(red_areas_result, tuple) else red_areas_result
-        red_areas_heatmap = red_areas_result[1] if isinstance(red_areas_result, tuple) else None
-        
-        # Create overlay renderer
-        renderer = OverlayRenderer(original_image)
-        
-        # Draw spots (general surface spots)
-        if spots_detections:
-            renderer.draw_spots(spots_detections, 'spots', show_numbers=show_numbers)
-        
-        # Draw UV spots (subsurface pigmentation)
-        if uv_spots_detections:
-            renderer.draw_spots(uv_spots_detections, 'uv_spots', show_numbers=show_numbers)
-        
-        # Draw brown spots (sun damage, age spots)
-        if brown_spots_detections:
-            renderer.draw_spots(brown_spots_detections, 'brown_spots', show_numbers=show_numbers)
-        
-        # Draw porphyrins (bacterial fluorescence)
-        if porphyrins_detections:
-            renderer.draw_spots(porphyrins_detections, 'porphyrins', show_numbers=show_numbers)
-        
-        # Draw wrinkles
-        if wrinkles_detections:
-            renderer.draw_wrinkles(wrinkles_detections, show_numbers=show_numbers)
-        
-        # Draw pores (usually without numbers due to high count)
-        if pores_detections:
-            renderer.draw_pores(pores_detections, show_numbers=False)
-        
-        # Draw red areas heatmap
-        if include_heatmap and red_areas_heatmap is not None:
-            renderer.draw_heatmap_overlay(red_areas_heatmap, alpha=0.4, colormap=cv2.COLORMAP_JET)
-        
-        # Draw legend
-        if show_legend:
-            counts = {
-                'spots': len(spots_detections),
-                'uv_spots': len(uv_spots_detections),
-                'brown_spots': len(brown_spots_detections),
-                'porphyrins': len(porphyrins_detections),
-                'wrinkles': len(wrinkles_detections),
-                'pores': len(pores_detections),
-            }
-            modes = [k for k, v in counts.items() if v > 0]
-            if modes:
-                renderer.draw_legend(modes, counts, position='top-right')
-        
-        # Draw stats panel
-        if show_stats:
-            processing_time = (time.time() - start_time) * 1000
-            total_detections = (
-                len(spots_detections) + len(uv_spots_detections) + 
-                len(brown_spots_detections) + len(porphyrins_detections) +
-                len(wrinkles_detections) + len(pores_detections)
+        # Run the selected analyses in parallel on the worker pool
+        # (detections come back in original image coordinates)
+        results = await run_detectors(model_loader, context, selected_modes, 0.5, transform)
+        
+        # Red areas heatmap (frame coordinates, warped by the renderer)
+        red_areas_result = results.get('red_areas')
+        red_areas_heatmap = red_areas_result[1] if include_heatmap and isinstance(red_areas_result, tuple) else None
+        
+        # Warp + draw on the worker pool
+        with stage("render"):
+            annotated, total_detections = await run_in_worker(
+                _render_multi_mode, original_image, results, red_areas_heatmap, transform, start_time,
+                show_legend=show_legend, show_stats=show_stats, show_numbers=show_numbers
             )
-            stats = {
-                'Total Detections': total_detections,
-                'Processing Time': f"{processing_time:.0f}ms"
+        
+        # Encode on the worker pool (recorded as the "encode" stage)
+        content, media_type = await run_in_worker(
+            encode_image, annotated, format, quality, compression, max_dimension
+        )
+        
+        processing_time = (time.time() - start_time) * 1000
+        logger.info(f"✅ Visualization complete: {processing_time:.0f}ms")
+        
+        headers = {"X-Total-Detections": str(total_detections)}
+        await get_result_cache().store(cache_key, (content, media_type, headers))
+        
+        # Return annotated image
+        return Response(
+            content=content,
+            media_type=media_type,
+            headers={
+                "X-Processing-Time": f"{processing_time:.2f}ms",
+                "X-Cache": "MISS",
+                **headers
             }
-            renderer.draw_stats_panel(stats, position='bottom-left')
+        )
+    
+    except HTTPException:
+        raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
+    except Exception as e:
+        logger.error(f"❌ Visualization error: {e}", exc_info=True)
+        raise HTTPException(500, f"Visualization failed: {str(e)}")
+
+
+@router.post("/visualize/from-results")
+async def visualize_from_results(
+    file: UploadFile = File(...),
+    results: Optional[str] = Form(None, description="MultiModeAnalysisResponse JSON from /api/analyze/multi-mode"),
+    modes: Optional[str] = Query(None, description="`modes` of the cached analysis to use when `results` is omitted"),
+    show_legend: bool = Query(True, description="Show detection count legend"),
+    show_stats: bool = Query(True, description="Show statistics panel"),
+    show_numbers: bool = Query(True, description="Show detection numbers on markers"),
+    format: Optional[str] = Query(None, pattern="^(png|jpeg|webp)$", description="Output format: png, jpeg or webp (default: VISUALIZATION_FORMAT)"),
+    quality: Optional[int] = Query(None, ge=1, le=100, description="JPEG/WebP quality"),
+    compression: Optional[int] = Query(None, ge=0, le=9, description="PNG compression level"),
+    max_dimension: Optional[int] = Query(None, ge=0, description="Downscale the output so its longest side is at most this (0 = full size)"),
+):
+    """
+    🎨 Render Existing Multi-Mode Results - No detectors are run
+    
+    Draws the overlay for results the client already received from
+    /api/analyze/multi-mode:
+    
+    - **file**: The same image that was analyzed
+    - **results**: The multi-mode JSON response (form field). If omitted,
+      the analysis cached for this exact upload (and `modes`) is used; 409
+      if there is none
+    
+    The red areas heatmap is not part of the multi-mode response and is not
+    drawn. Returns annotated image (PNG by default; see `format`)
+    """
+    start_time = time.time()
+    
+    try:
+        if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
+            raise HTTPException(400, "Invalid file type. Only JPG/PNG allowed.")
+        
+        selected_modes = _selected_modes(modes)
+        contents = await file.read()
+        
+        if results is not None:
+            try:
+                analysis = MultiModeAnalysisResponse.model_validate_json(results)
+            except ValidationError as e:
+                raise HTTPException(422, f"Invalid results: {e}")
+        else:
+            # Results of a previous /api/analyze/multi-mode call on the same bytes
+            _, analysis = await get_result_cache().lookup(contents, "multi-mode", modes=selected_modes)
+            if analysis is None:
+                raise HTTPException(
+                    409, "No cached analysis for this image. Send the multi-mode response as `results` "
+                    "or call /api/analyze/multi-mode first."
+                )
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
+            raise HTTPException(400, "Failed to decode image")
+        image, _ = decoded  # Overlays are drawn on the decoded image
         
-        # Get final annotated image
-        annotated = renderer.get_result('RGB')
+        result_dict = analysis.model_dump(mode='json')
+        scaled = await run_in_worker(_scale_results, result_dict, image.shape)
         
-        # Convert to BGR for OpenCV encoding
-        annotated_bgr = cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR)
+        with stage("render"):
+            annotated = await run_in_worker(
+                create_multimode_visualization, image, scaled,
+                show_legend=show_legend, show_stats=show_stats, show_numbers=show_numbers
+            )
         
-        # Encode as PNG
-        success, buffer = cv2.imencode('.png', annotated_bgr)
-        if not success:
-            raise HTTPException(500, "Failed to encode image")
+        # Encode on the worker pool (recorded as the "encode" stage)
+        content, media_type = await run_in_worker(
+            encode_image, annotated, format, quality, compression, max_dimension
+        )
         
+        # Same count as /visualize/multi-mode (red areas are not drawn)
+        total_detections = sum(
+            len((scaled.get(mode) or {}).get('detections') or [])
+            for mode in ('spots', 'uv_spots', 'brown_spots', 'porphyrins', 'wrinkles', 'pores')
+        )
         processing_time = (time.time() - start_time) * 1000
-        logger.info(f"✅ Visualization complete: {processing_time:.0f}ms")
+        logger.info(f"✅ Visualization from results: {total_detections} detections, {processing_time:.0f}ms")
         
-        # Return image as PNG
         return Response(
-            content=buffer.tobytes(),
-            media_type="image/png",
+            content=content,
+            media_type=media_type,
             headers={
                 "X-Processing-Time": f"{processing_time:.2f}ms",
                 "X-Total-Detections": str(total_detections)
             }
         )
-        
+    
     except HTTPException:
         raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
     except Exception as e:
         logger.error(f"❌ Visualization error: {e}", exc_info=True)
         raise HTTPException(500, f"Visualization failed: {str(e)}")
@@ -196,7 +417,11 @@ async def visualize_single_mode(
     mode: str,
     file: UploadFile = File(...),
     show_numbers: bool = Query(True, description="Show detection numbers"),
-    show_confidence: bool = Query(False, description="Show confidence scores")
+    show_confidence: bool = Query(False, description="Show confidence scores"),
+    format: Optional[str] = Query(None, pattern="^(png|jpeg|webp)$", description="Output format: png, jpeg or webp (default: VISUALIZATION_FORMAT)"),
+    quality: Optional[int] = Query(None, ge=1, le=100, description="JPEG/WebP quality"),
+    compression: Optional[int] = Query(None, ge=0, le=9, description="PNG compression level"),
+    max_dimension: Optional[int] = Query(None, ge=0, description="Downscale the output so its longest side is at most this (0 = full size)"),
 ):
     """
     🎨 Generate Single-Mode Annotated Image
@@ -208,7 +433,7 @@ async def visualize_single_mode(
     - red_areas: Heatmap
     - texture: Heatmap
     
-    Returns annotated image as PNG
+    Returns annotated image (PNG by default; see `format`)
     """
     start_time = time.time()
     
@@ -223,83 +448,78 @@ async def visualize_single_mode(
             raise HTTPException(400, "Invalid file type. Only JPG/PNG allowed.")
         
         contents = await file.read()
-        image = decode_image(contents)
         
-        if image is None:
+        # Repeat uploads are served from the result cache
+        cache_key, cached = await get_result_cache().lookup(
+            contents, "visualize/single-mode",
+            mode=mode, show_numbers=show_numbers, show_confidence=show_confidence,
+            format=format, quality=quality, compression=compression, max_dimension=max_dimension
+        )
+        if cached is not None:
+            logger.info(f"♻️ {mode} visualization served from cache")
+            return _cached_image_response(cached, start_time)
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
             raise HTTPException(400, "Failed to decode image")
+        image, _ = decoded  # Overlays are drawn on the decoded image
         
         original_image = image.copy()
-        processed = preprocess_image(image, target_size=1024, normalize=True)
+        # Face crop + resize; transform maps frame coordinates back to the upload
+        processed, transform = await run_in_worker(prepare_image, image, target_size=1024)
         
         if not model_loader:
             raise HTTPException(500, "Model loader not initialized")
         
-        # Get specific model and run analysis
-        if mode == 'spots':
-            model = model_loader.get_spot_model()
-            detections = await model.detect(processed, 0.5)
-        elif mode == 'uv_spots':
-            model = model_loader.get_uv_spots_model()
-            detections = await model.detect(processed, 0.5)
-        elif mode == 'brown_spots':
-            model = model_loader.get_brown_spots_model()
-            detections = await model.detect(processed, 0.5)
-        elif mode == 'porphyrins':
-            model = model_loader.get_porphyrins_model()
-            detections = await model.detect(processed, 0.5)
-        elif mode == 'wrinkles':
-            model = model_loader.get_wrinkle_model()
-            detections = await model.detect(processed, 0.5)
-        elif mode == 'pores':
-            model = model_loader.get_pores_model()
-            detections = await model.detect(processed, 0.5)
-        elif mode == 'red_areas':
-            model = model_loader.get_red_areas_model()
-            result = await model.detect(processed, 0.5)
+        # Run analysis (detections in original image coordinates)
+        result = await detect_mode(model_loader, processed, mode, 0.5, transform)
+        heatmap = None
+        if mode == 'red_areas':
             detections = result[0] if isinstance(result, tuple) else result
             heatmap = result[1] if isinstance(result, tuple) else None
-        else:  # texture
-            model = model_loader.get_texture_model()
-            metrics = await model.analyze(processed)
+        elif mode == 'texture':
             detections = []
+            heatmap = result[1]  # Roughness map
+        else:
+            detections = result
+        
+        # Warp + draw on the worker pool
+        with stage("render"):
+            annotated = await run_in_worker(
+                _render_single_mode, original_image, mode, detections, heatmap, transform,
+                show_numbers=show_numbers, show_confidence=show_confidence
+            )
         
-        # Create overlay
-        renderer = OverlayRenderer(original_image)
-        
-        if mode in ['spots', 'uv_spots', 'brown_spots', 'porphyrins']:
-            renderer.draw_spots(detections, mode, show_numbers=show_numbers, 
-                              show_confidence=show_confidence)
-        elif mode == 'wrinkles':
-            renderer.draw_wrinkles(detections, show_numbers=show_numbers)
-        elif mode == 'pores':
-            renderer.draw_pores(detections, show_numbers=show_numbers)
-        elif mode == 'red_areas' and heatmap is not None:
-            renderer.draw_heatmap_overlay(heatmap, alpha=0.5, colormap=cv2.COLORMAP_JET)
-        
-        # Get result
-        annotated = renderer.get_result('RGB')
-        annotated_bgr = cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR)
-        
-        # Encode as PNG
-        success, buffer = cv2.imencode('.png', annotated_bgr)
-        if not success:
-            raise HTTPException(500, "Failed to encode image")
+        # Encode on the worker pool (recorded as the "encode" stage)
+        content, media_type = await run_in_worker(
+            encode_image, annotated, format, quality, compression, max_dimension
+        )
         
         processing_time = (time.time() - start_time) * 1000
         logger.info(f"✅ {mode} visualization: {len(detections) if isinstance(detections, list) else 0} detections, {processing_time:.0f}ms")
         
+        headers = {
+            "X-Mode": mode,
+            "X-Detection-Count": str(len(detections) if isinstance(detections, list) else 0)
+        }
+        await get_result_cache().store(cache_key, (content, media_type, headers))
+        
         return Response(
-            content=buffer.tobytes(),
-            media_type="image/png",
+            content=content,
+            media_type=media_type,
             headers={
                 "X-Processing-Time": f"{processing_time:.2f}ms",
-                "X-Mode": mode,
-                "X-Detection-Count": str(len(detections) if isinstance(detections, list) else 0)
+                "X-Cache": "MISS",
+                **headers
             }
         )
-        
+    
     except HTTPException:
         raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
     except Exception as e:
         logger.error(f"❌ {mode} visualization error: {e}", exc_info=True)
         raise HTTPException(500, f"Visualization failed: {str(e)}")
@@ -7,7 +7,11 @@ import time
 import logging
 
 from api.schemas import WrinklesAnalysisResponse, AnalysisStatistics, SeverityLevel
-from api.utils import decode_image, preprocess_image
+from api.utils import decode_upload, ImageRejectedError, prepare_image
+from api.core.analysis import detect_mode
+from api.core.executor import run_in_worker
+from api.core.result_cache import get_result_cache
+from api.core.timing import current_timings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -22,13 +26,15 @@ def set_model_loader(loader):
 @router.post("/wrinkles", response_model=WrinklesAnalysisResponse)
 async def analyze_wrinkles(
     file: UploadFile = File(...),
-    confidence_threshold: float = 0.5
+    confidence_threshold: float = 0.5,
+    include_timings: bool = False
 ):
     """
     📏 Analyze skin wrinkles and fine lines
     
     - **file**: Image file (JPG, PNG)
     - **confidence_threshold**: Minimum confidence score (0.0-1.0)
+    - **include_timings**: Add per-stage durations (stage_timings_ms) to the response
     
     Returns wrinkle line detections with depth scores
     """
@@ -39,19 +45,33 @@ async def analyze_wrinkles(
             raise HTTPException(400, "Invalid file type")
         
         contents = await file.read()
-        image = decode_image(contents)
         
-        if image is None:
+        # Repeat uploads are served from the result cache
+        cache_key, cached = await get_result_cache().lookup(contents, "wrinkles", confidence_threshold=confidence_threshold)
+        if cached is not None:
+            logger.info("♻️ Wrinkles analysis served from cache")
+            return cached.model_copy(update={
+                "processing_time_ms": round((time.time() - start_time) * 1000, 2),
+                "stage_timings_ms": current_timings() if include_timings else None
+            })
+        
+        # Header checks + reduced-size decode (image may be smaller than the upload)
+        decoded = await run_in_worker(decode_upload, contents, 1024)
+        
+        if decoded is None:
             raise HTTPException(400, "Failed to decode image")
+        image, (original_width, original_height) = decoded
         
-        original_height, original_width = image.shape[:2]
-        processed = preprocess_image(image)
+        # Face crop + resize; transform maps frame coordinates back to the upload
+        processed, transform = await run_in_worker(
+            prepare_image, image, target_size=1024, original_size=(original_width, original_height)
+        )
         
         if not model_loader:
             raise HTTPException(500, "Model loader not initialized")
         
-        wrinkle_model = model_loader.get_wrinkle_model()
-        detections = await wrinkle_model.detect(processed, confidence_threshold)
+        # Detections are mapped back to original image coordinates
+        detections = await detect_mode(model_loader, processed, 'wrinkles', confidence_threshold, transform)
         
         total_wrinkles = len(detections)
         avg_confidence = float(np.mean([d['confidence'] for d in detections])) if detections else 0.0
@@ -83,14 +103,18 @@ async def analyze_wrinkles(
                 severity_level=severity_level
             ),
             image_dimensions={"width": original_width, "height": original_height},
-            processing_time_ms=round(processing_time, 2)
+            processing_time_ms=round(processing_time, 2),
+            stage_timings_ms=current_timings() if include_timings else None
         )
         
         logger.info(f"✅ Wrinkles analysis: {total_wrinkles} lines, {processing_time:.0f}ms")
+        await get_result_cache().store(cache_key, response)
         return response
-        
+    
     except HTTPException:
         raise
+    except ImageRejectedError as e:
+        raise HTTPException(e.status_code, str(e))
     except Exception as e:
         logger.error(f"❌ Error: {e}", exc_info=True)
         raise HTTPException(500, f"Analysis failed: {str(e)}")
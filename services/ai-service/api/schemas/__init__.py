@@ -11,6 +11,8 @@ from .analysis import (
     TextureAnalysisResponse,
     PoresAnalysisResponse,
     MultiModeAnalysisResponse,
+    BatchImageResult,
+    BatchAnalysisResponse,
     ErrorResponse
 )
 
@@ -24,5 +26,7 @@ __all__ = [
     'TextureAnalysisResponse',
     'PoresAnalysisResponse',
     'MultiModeAnalysisResponse',
+    'BatchImageResult',
+    'BatchAnalysisResponse',
     'ErrorResponse'
 ]
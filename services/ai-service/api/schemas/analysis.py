@@ -44,6 +44,7 @@ class SpotsAnalysisResponse(BaseModel):
     statistics: AnalysisStatistics
     image_dimensions: ImageDimensions
     processing_time_ms: Optional[float] = None
+    stage_timings_ms: Optional[Dict[str, float]] = Field(None, description="Per-stage durations (include_timings=true)")
 
 
 class WrinklesAnalysisResponse(BaseModel):
@@ -54,6 +55,7 @@ class WrinklesAnalysisResponse(BaseModel):
     statistics: AnalysisStatistics
     image_dimensions: ImageDimensions
     processing_time_ms: Optional[float] = None
+    stage_timings_ms: Optional[Dict[str, float]] = Field(None, description="Per-stage durations (include_timings=true)")
 
 
 class TextureAnalysisResponse(BaseModel):
@@ -63,8 +65,11 @@ class TextureAnalysisResponse(BaseModel):
     metrics: Dict[str, float]
     smoothness_score: float = Field(..., ge=0.0, le=100.0)
     roughness_score: float = Field(..., ge=0.0, le=100.0)
+    zone_scores: Optional[Dict[str, float]] = Field(None, description="Texture score per face zone (0-100, higher = smoother)")
+    roughness_map: Optional[str] = Field(None, description="Base64 encoded roughness heatmap")
     image_dimensions: ImageDimensions
     processing_time_ms: Optional[float] = None
+    stage_timings_ms: Optional[Dict[str, float]] = Field(None, description="Per-stage durations (include_timings=true)")
 
 
 class PoresAnalysisResponse(BaseModel):
@@ -76,22 +81,49 @@ class PoresAnalysisResponse(BaseModel):
     density_map: Optional[str] = Field(None, description="Base64 encoded heatmap")
     image_dimensions: ImageDimensions
     processing_time_ms: Optional[float] = None
+    stage_timings_ms: Optional[Dict[str, float]] = Field(None, description="Per-stage durations (include_timings=true)")
 
 
 class MultiModeAnalysisResponse(BaseModel):
-    """Response for multi-mode analysis (all 8 modes)"""
+    """Response for multi-mode analysis (all 8 modes, or the requested ones)"""
     success: bool
     analysis_type: str = "multi_mode"
-    spots: SpotsAnalysisResponse
-    wrinkles: WrinklesAnalysisResponse
-    texture: TextureAnalysisResponse
-    pores: PoresAnalysisResponse
+    modes: Optional[List[str]] = Field(None, description="Modes that ran (modes not requested are null)")
+    spots: Optional[SpotsAnalysisResponse] = None
+    wrinkles: Optional[WrinklesAnalysisResponse] = None
+    texture: Optional[TextureAnalysisResponse] = None
+    pores: Optional[PoresAnalysisResponse] = None
     uv_spots: Optional[SpotsAnalysisResponse] = None
     brown_spots: Optional[SpotsAnalysisResponse] = None
     red_areas: Optional[Dict[str, Any]] = None
     porphyrins: Optional[Dict[str, Any]] = None
-    overall_score: float = Field(..., ge=0.0, le=100.0)
+    overall_score: float = Field(..., ge=0.0, le=100.0, description="Weights the modes that ran equally")
     processing_time_ms: float
+    stage_timings_ms: Optional[Dict[str, float]] = Field(None, description="Per-stage durations (include_timings=true)")
+
+
+class BatchImageResult(BaseModel):
+    """Analysis result (or error) for one image of a batch"""
+    index: int = Field(..., description="Position of the image in the upload")
+    filename: Optional[str] = None
+    success: bool
+    image_dimensions: Optional[ImageDimensions] = None
+    results: Optional[Dict[str, Any]] = Field(None, description="Analysis response per mode")
+    overall_score: Optional[float] = Field(None, ge=0.0, le=100.0)
+    error: Optional[str] = None
+    processing_time_ms: float
+
+
+class BatchAnalysisResponse(BaseModel):
+    """Response for batch analysis (one entry per uploaded image)"""
+    success: bool
+    analysis_type: str = "batch"
+    modes: List[str]
+    total_images: int
+    succeeded: int
+    failed: int
+    processing_time_ms: float
+    results: List[BatchImageResult]
 
 
 class ErrorResponse(BaseModel):
@@ -3,11 +3,23 @@ Utilities module initialization
 """
 from .image_processing import (
     decode_image,
+    decode_upload,
+    encode_image,
+    probe_image_size,
+    ImageRejectedError,
     preprocess_image,
+    normalize_image,
+    denormalize_image,
     enhance_contrast,
     apply_face_alignment,
-    calculate_skin_mask
+    prepare_image,
+    calculate_skin_mask,
+    compute_skin_roi
 )
+from .image_context import ImageContext
+from .region_stats import RegionStats
+from .frame_transform import FrameTransform
+from .synthetic_face import make_synthetic_face
 from .overlay_renderer import (
     OverlayRenderer,
     create_multimode_visualization
@@ -15,10 +27,22 @@ from .overlay_renderer import (
 
 __all__ = [
     'decode_image',
+    'decode_upload',
+    'encode_image',
+    'probe_image_size',
+    'ImageRejectedError',
     'preprocess_image',
+    'normalize_image',
+    'denormalize_image',
     'enhance_contrast',
     'apply_face_alignment',
+    'prepare_image',
     'calculate_skin_mask',
+    'compute_skin_roi',
+    'ImageContext',
+    'RegionStats',
+    'FrameTransform',
+    'make_synthetic_face',
     'OverlayRenderer',
     'create_multimode_visualization'
 ]
@@ -0,0 +1,176 @@
+"""
+RGB -> color class lookup table
+The HSV hue windows and fluorescence threshold used by the brown spot,
+red area and porphyrin detectors depend only on a pixel's RGB value, so
+they are precomputed once for all 2^24 colors. A single fancy-indexing
+pass then yields every detector's color mask at once, replacing a dozen
+full-frame inRange / bitwise passes per multi-mode request.
+
+Detectors that threshold against image-wide statistics (mean L*, min/max
+normalized a*, b* or Erythema Index) still compute those masks per image.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from enum import IntFlag
+from pathlib import Path
+from typing import Optional
+import cv2
+import numpy as np
+import logging
+
+from api.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ColorClass(IntFlag):
+    """Bits of the color class LUT (one per detector color rule)"""
+    BROWN = 1       # Brown/tan hue, excluding red (BrownSpotDetector)
+    RED = 2         # Red hue (RedAreaDetector)
+    PORPHYRIN = 4   # Orange-red hue with strong fluorescence (PorphyrinDetector)
+
+
+# Color rules baked into the LUT. Changing any value changes the cache key.
+COLOR_RULES = {
+    # Brown hue range in HSV (OpenCV hue is 0-180)
+    'brown': [([5, 20, 20], [25, 255, 200]),      # Light to dark brown
+              ([8, 15, 15], [28, 255, 150])],     # Darker areas with brown tint
+    # Red areas are excluded from brown spots (inflammation, not pigmentation)
+    'brown_exclude_red': [([0, 50, 50], [10, 255, 255]),
+                          ([160, 50, 50], [180, 255, 255])],
+    # Red hue: 0-10 and 160-180
+    'red': [([0, 40, 40], [10, 255, 255]),
+            ([160, 40, 40], [180, 255, 255])],
+    # Porphyrin fluorescence color: orange to red
+    'porphyrin': [([5, 50, 50], [25, 255, 255])],
+    # Fluorescence index (R/255 * (1 - B/255)) must exceed this
+    'porphyrin_fluorescence': 0.4,
+}
+
+_LUT_SIZE = 1 << 24
+
+_lut: Optional[np.ndarray] = None
+_lut_lock = threading.Lock()
+
+
+def _hsv_mask(hsv: np.ndarray, ranges) -> np.ndarray:
+    """Union of inRange masks for a list of (lower, upper) HSV ranges"""
+    mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
+    for lower, upper in ranges:
+        mask |= cv2.inRange(hsv, np.array(lower), np.array(upper))
+    return mask > 0
+
+
+def fluorescence_index(r: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Simulated porphyrin fluorescence: high R, low B (0-1 range)
+    
+    Args:
+        r, b: uint8 red and blue channels
+    """
+    fluor_index = (r.astype(np.float32) / 255.0) * (1.0 - b.astype(np.float32) / 255.0)
+    return np.clip(fluor_index, 0, 1)
+
+
+def build_color_lut() -> np.ndarray:
+    """
+    Evaluate every color rule for all 2^24 RGB values
+    
+    Returns:
+        uint8 array of ColorClass bits indexed by (R << 16) | (G << 8) | B
+    """
+    codes = np.arange(_LUT_SIZE, dtype=np.uint32)
+    rgb = np.empty((4096, 4096, 3), dtype=np.uint8)
+    rgb[..., 0] = (codes >> 16).reshape(4096, 4096)
+    rgb[..., 1] = ((codes >> 8) & 0xFF).reshape(4096, 4096)
+    rgb[..., 2] = (codes & 0xFF).reshape(4096, 4096)
+    del codes
+    
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    lut = np.zeros((4096, 4096), dtype=np.uint8)
+    
+    brown = _hsv_mask(hsv, COLOR_RULES['brown']) & ~_hsv_mask(hsv, COLOR_RULES['brown_exclude_red'])
+    lut[brown] |= int(ColorClass.BROWN)
+    
+    lut[_hsv_mask(hsv, COLOR_RULES['red'])] |= int(ColorClass.RED)
+    
+    # Same quantization as thresholding the 8-bit fluorescence map
+    fluor = (fluorescence_index(rgb[..., 0], rgb[..., 2]) * 255).astype(np.uint8)
+    fluorescent = fluor > int(COLOR_RULES['porphyrin_fluorescence'] * 255)
+    lut[_hsv_mask(hsv, COLOR_RULES['porphyrin']) & fluorescent] |= int(ColorClass.PORPHYRIN)
+    
+    return lut.ravel()
+
+
+def _cache_path() -> Path:
+    """LUT cache file, keyed by the color rules and OpenCV version"""
+    key = json.dumps({'rules': COLOR_RULES, 'opencv': cv2.__version__}, sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    return Path(settings.COLOR_LUT_DIR) / f"color_lut_{digest}.npy"
+
+
+def get_color_lut() -> np.ndarray:
+    """
+    Get the color class LUT, building it on first use
+    
+    The table is written to COLOR_LUT_DIR and memory-mapped read-only,
+    so restarts skip the build and processes on one node share its pages.
+    """
+    global _lut
+    if _lut is not None:
+        return _lut
+    
+    with _lut_lock:
+        if _lut is not None:
+            return _lut
+        
+        path = _cache_path()
+        if path.exists():
+            try:
+                _lut = np.load(path, mmap_mode='r')
+                logger.info(f"🎨 Color LUT memory-mapped from {path}")
+                return _lut
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable color LUT cache {path}: {e}")
+        
+        logger.info("🎨 Building color LUT (2^24 entries)...")
+        lut = build_color_lut()
+        
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, lut)
+            os.replace(tmp_path, path)
+            _lut = np.load(path, mmap_mode='r')
+            logger.info(f"🎨 Color LUT cached at {path}")
+        except OSError as e:
+            logger.warning(f"Could not cache color LUT ({e}), keeping it in memory")
+            _lut = lut
+        
+        return _lut
+
+
+def lookup_color_classes(rgb: np.ndarray) -> np.ndarray:
+    """
+    Map an RGB image to per-pixel ColorClass bits in one pass
+    
+    Args:
+        rgb: uint8 RGB image
+    
+    Returns:
+        uint8 array (H, W) of ColorClass bits
+    """
+    if sys.byteorder == 'little':
+        # BGRA bytes read as little-endian uint32 are (A << 24) | (R << 16) | (G << 8) | B
+        bgra = cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2BGRA)
+        codes = bgra.view(np.uint32)[..., 0]
+        codes &= 0xFFFFFF
+    else:
+        codes = rgb[..., 0].astype(np.uint32) << 16
+        codes |= rgb[..., 1].astype(np.uint32) << 8
+        codes |= rgb[..., 2]
+    return np.take(get_color_lut(), codes)
@@ -0,0 +1,225 @@
+"""
+Face detection and alignment (CPU only)
+Finds the largest face with OpenCV's YuNet detector (cv2.FaceDetectorYN),
+falling back to a Haar cascade, and crops the image to the face, rotated
+so the eyes are level. Analysis then runs on the face instead of the
+whole photo.
+
+YuNet needs its ONNX model in MODELS_DIR (FACE_DETECTOR_MODEL_PATH, from
+https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet).
+Without it the Haar cascade shipped with opencv-python is used; if
+neither is available, images are analyzed uncropped.
+"""
+import math
+import threading
+from pathlib import Path
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+import logging
+
+from api.core.config import settings
+from api.core.timing import timed_stage
+
+logger = logging.getLogger(__name__)
+
+# Faces are searched on a copy with this longest side
+DETECTION_SIZE = 640
+
+# Minimum YuNet face score
+SCORE_THRESHOLD = 0.8
+
+# Crop around the face box, as a fraction of its width/height
+# (forehead is included above the YuNet/Haar box)
+CROP_MARGIN_SIDES = 0.2
+CROP_MARGIN_TOP = 0.35
+CROP_MARGIN_BOTTOM = 0.15
+
+# Longest side of a typical face crop, as a fraction of the image's longest
+# side (portraits: 30-50%); decode_upload keeps enough resolution for it
+EXPECTED_CROP_FRACTION = 0.3
+
+# Faces smaller than this fraction of the image are ignored
+MIN_FACE_FRACTION = 0.02
+
+# Skip the crop when it would keep nearly the whole image
+MAX_CROP_FRACTION = 0.9
+
+# Rotations below this many degrees are not corrected (plain crop)
+MIN_ROTATION_DEGREES = 2.0
+
+_HAAR_CASCADE = 'haarcascade_frontalface_default.xml'
+
+
+class FaceDetector:
+    """
+    Largest-face detector (thread-safe)
+    
+    The backend is chosen on first use: YuNet if its model file exists,
+    otherwise a Haar cascade, otherwise none (detect() returns None).
+    OpenCV detectors are not safe to share between threads, so each
+    analysis worker thread builds its own instance instead of every request
+    waiting on one.
+    """
+    
+    def __init__(self):
+        self.backend: Optional[str] = None
+        self._model_path: Optional[str] = None  # YuNet model or Haar cascade file
+        self._initialized = False
+        self._lock = threading.Lock()  # Guards backend selection only
+        self._local = threading.local()
+    
+    def _initialize(self):
+        model_path = Path(settings.MODELS_DIR) / settings.FACE_DETECTOR_MODEL_PATH
+        if model_path.exists() and hasattr(cv2, 'FaceDetectorYN'):
+            self._model_path = str(model_path)
+            self.backend = 'yunet'
+        else:
+            cascade_dir = getattr(getattr(cv2, 'data', None), 'haarcascades', '')
+            cascade_path = Path(cascade_dir) / _HAAR_CASCADE
+            cascade = cv2.CascadeClassifier(str(cascade_path)) if cascade_path.exists() else None
+            if cascade is not None and not cascade.empty():
+                self._model_path = str(cascade_path)
+                self.backend = 'haar'
+        
+        if self.backend:
+            logger.info(f"✅ Face detector ready ({self.backend})")
+        else:
+            logger.warning(
+                f"⚠️ No face detector available ({model_path} missing, no Haar cascade) - "
+                "images are analyzed without face cropping"
+            )
+        self._initialized = True
+    
+    def _ensure_initialized(self):
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self._initialize()
+    
+    @property
+    def available(self) -> bool:
+        """Whether a detector backend exists (selects it on first call)"""
+        self._ensure_initialized()
+        return self.backend is not None
+    
+    def _thread_detector(self):
+        """This thread's detector instance (None without a backend)"""
+        self._ensure_initialized()
+        if self.backend is None:
+            return None
+        
+        detector = getattr(self._local, 'detector', None)
+        if detector is None:
+            if self.backend == 'yunet':
+                detector = cv2.FaceDetectorYN.create(
+                    self._model_path, "", (DETECTION_SIZE, DETECTION_SIZE), SCORE_THRESHOLD
+                )
+            else:
+                detector = cv2.CascadeClassifier(self._model_path)
+            self._local.detector = detector
+        return detector
+    
+    def detect(self, image: np.ndarray) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Find the largest face
+        
+        Args:
+            image: Input image (RGB)
+        
+        Returns:
+            (box [x, y, w, h], eye centers [[right_x, right_y], [left_x, left_y]]
+            or None for Haar) in image coordinates, or None if no face was found
+        """
+        detector = self._thread_detector()
+        if detector is None:
+            return None
+        
+        h, w = image.shape[:2]
+        scale = min(1.0, DETECTION_SIZE / max(h, w))
+        small = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA) \
+            if scale < 1.0 else image
+        
+        if self.backend == 'yunet':
+            detector.setInputSize((small.shape[1], small.shape[0]))
+            _, faces = detector.detect(cv2.cvtColor(small, cv2.COLOR_RGB2BGR))
+            if faces is None or len(faces) == 0:
+                return None
+            face = max(faces, key=lambda f: f[2] * f[3])
+            return face[0:4] / scale, face[4:8].reshape(2, 2) / scale
+        
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        min_side = max(24, int(math.sqrt(MIN_FACE_FRACTION) * min(small.shape[:2])))
+        faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+        if len(faces) == 0:
+            return None
+        face = max(faces, key=lambda f: f[2] * f[3])
+        return np.asarray(face, dtype=np.float64) / scale, None
+
+
+_face_detector = FaceDetector()
+
+
+def get_face_detector() -> FaceDetector:
+    """Shared face detector (initialized on first use)"""
+    return _face_detector
+
+
+@timed_stage("align")
+def align_face(image: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Crop (and level) the largest face
+    
+    Args:
+        image: Input image (RGB)
+    
+    Returns:
+        (face image, 2x3 affine from image to face coordinates), or
+        (image, None) when alignment is disabled or no usable face is found
+    """
+    if not settings.FACE_ALIGNMENT_ENABLED:
+        return image, None
+    
+    found = get_face_detector().detect(image)
+    if found is None:
+        return image, None
+    
+    (fx, fy, fw, fh), eyes = found
+    h, w = image.shape[:2]
+    if fw * fh < MIN_FACE_FRACTION * w * h:
+        return image, None
+    
+    crop_w = fw * (1 + 2 * CROP_MARGIN_SIDES)
+    crop_h = fh * (1 + CROP_MARGIN_TOP + CROP_MARGIN_BOTTOM)
+    if crop_w * crop_h >= MAX_CROP_FRACTION * w * h:
+        return image, None
+    
+    # Crop center (face center shifted up by the extra forehead margin)
+    cx = fx + fw / 2
+    cy = fy + fh / 2 - fh * (CROP_MARGIN_TOP - CROP_MARGIN_BOTTOM) / 2
+    
+    angle = 0.0
+    if eyes is not None:
+        (rx, ry), (lx, ly) = eyes
+        angle = math.degrees(math.atan2(ly - ry, lx - rx))
+    
+    out_w, out_h = int(round(crop_w)), int(round(crop_h))
+    
+    if abs(angle) < MIN_ROTATION_DEGREES:
+        # Axis-aligned crop: a view of the image, no resampling
+        x0 = int(np.clip(round(cx - crop_w / 2), 0, w - 1))
+        y0 = int(np.clip(round(cy - crop_h / 2), 0, h - 1))
+        x1, y1 = min(w, x0 + out_w), min(h, y0 + out_h)
+        matrix = np.array([[1.0, 0.0, -x0], [0.0, 1.0, -y0]])
+        return image[y0:y1, x0:x1], matrix
+    
+    # Rotate about the crop center so the eyes are level, then move the
+    # crop to the origin
+    matrix = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+    matrix[0, 2] += out_w / 2 - cx
+    matrix[1, 2] += out_h / 2 - cy
+    aligned = cv2.warpAffine(
+        image, matrix, (out_w, out_h),
+        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE
+    )
+    return aligned, matrix
@@ -0,0 +1,135 @@
+"""
+Frame transform
+Detectors run on a preprocessed frame (face crop, resized and optionally
+padded to a square). FrameTransform keeps the affine from original image
+coordinates to that frame, so detections can be mapped back to the
+uploaded image.
+"""
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def resized_shape(height: int, width: int, target_size: int) -> Tuple[int, int]:
+    """(height, width) after resizing the longest side to target_size"""
+    if height > width:
+        return target_size, int(width * (target_size / height))
+    return int(height * (target_size / width)), target_size
+
+
+def letterbox_matrix(height: int, width: int, target_size: int, pad: bool = True) -> np.ndarray:
+    """
+    Affine (2x3) of preprocess_image: resize the longest side to
+    target_size and, if pad, center on a square canvas
+    """
+    new_h, new_w = resized_shape(height, width, target_size)
+    
+    left = (target_size - new_w) // 2 if pad else 0
+    top = (target_size - new_h) // 2 if pad else 0
+    return np.array([
+        [new_w / width, 0.0, left],
+        [0.0, new_h / height, top]
+    ], dtype=np.float64)
+
+
+def _to_3x3(matrix: np.ndarray) -> np.ndarray:
+    return np.vstack([matrix, [0.0, 0.0, 1.0]])
+
+
+class FrameTransform:
+    """
+    Affine mapping between the original image and the analysis frame
+    
+    Example:
+        transform = FrameTransform.compose(align_matrix, letterbox_matrix(h, w, 1024), image.shape)
+        detections = transform.map_detections(detections)  # original coordinates
+    """
+    
+    def __init__(self, matrix: np.ndarray, original_shape: Tuple[int, ...]):
+        """
+        Args:
+            matrix: 2x3 affine from original image coordinates to the frame
+            original_shape: Shape of the original image
+        """
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.inverse = cv2.invertAffineTransform(self.matrix)
+        self.original_height, self.original_width = original_shape[:2]
+    
+    @classmethod
+    def compose(
+        cls,
+        first: Optional[np.ndarray],
+        second: np.ndarray,
+        original_shape: Tuple[int, ...]
+    ) -> 'FrameTransform':
+        """Transform applying `first` (None = identity), then `second`"""
+        if first is None:
+            return cls(second, original_shape)
+        return cls((_to_3x3(second) @ _to_3x3(first))[:2], original_shape)
+    
+    def from_original_size(self, original_size: Tuple[int, int]) -> 'FrameTransform':
+        """
+        Same transform, starting from an image that was decoded downscaled
+        (original_size = (width, height) of the full-resolution image)
+        """
+        width, height = original_size
+        if (width, height) == (self.original_width, self.original_height):
+            return self
+        scale = np.array([
+            [self.original_width / width, 0.0, 0.0],
+            [0.0, self.original_height / height, 0.0]
+        ])
+        return FrameTransform.compose(scale, self.matrix, (height, width))
+    
+    def map_points(self, points: np.ndarray) -> np.ndarray:
+        """Map (N, 2) frame points to original image coordinates"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return points @ self.inverse[:, :2].T + self.inverse[:, 2]
+    
+    def map_bbox(self, bbox: List[int]) -> List[int]:
+        """
+        Map a frame [x, y, w, h] box to the original image (bounding box of
+        its mapped corners, clipped to the image)
+        """
+        x, y, w, h = bbox
+        corners = self.map_points([[x, y], [x + w, y], [x, y + h], [x + w, y + h]])
+        x0, y0 = np.floor(corners.min(axis=0))
+        x1, y1 = np.ceil(corners.max(axis=0))
+        x0, x1 = np.clip([x0, x1], 0, self.original_width)
+        y0, y1 = np.clip([y0, y1], 0, self.original_height)
+        return [int(x0), int(y0), int(x1 - x0), int(y1 - y0)]
+    
+    def map_detections(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Map 'bbox' (and 'points', if present) of each detection to the original image"""
+        mapped = []
+        for detection in detections:
+            detection = dict(detection)
+            detection['bbox'] = self.map_bbox(detection['bbox'])
+            if detection.get('points'):
+                detection['points'] = self.map_points(detection['points']).round().astype(int).tolist()
+            mapped.append(detection)
+        return mapped
+    
+    def warp_to_original(self, plane: np.ndarray, max_side: Optional[int] = None) -> np.ndarray:
+        """
+        Resample a frame-sized plane (e.g. a heatmap) onto the original image
+        
+        Args:
+            plane: Plane in frame coordinates
+            max_side: Downscale the result so its longest side is at most
+                this (same extent and aspect ratio as the original image)
+        """
+        matrix = self.matrix
+        width, height = self.original_width, self.original_height
+        if max_side and max(width, height) > max_side:
+            scale = max_side / max(width, height)
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+            matrix = (_to_3x3(matrix) @ np.diag([1.0 / scale, 1.0 / scale, 1.0]))[:2]
+        return cv2.warpAffine(
+            plane, matrix, (width, height),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_CONSTANT, borderValue=0
+        )
@@ -0,0 +1,224 @@
+"""
+Shared per-request image context
+Every detector works on the same preprocessed frame and needs the same
+color-space conversions. ImageContext computes each plane on first use
+and caches it, so a multi-mode request converts the frame only once.
+
+Detectors work on `ctx.roi`, a child context cropped to the skin region
+(computed once per request), so background, hair and padding pixels are
+never converted, thresholded or labeled.
+"""
+import threading
+import cv2
+import numpy as np
+from typing import Callable, Dict, Optional, Tuple, Union
+import logging
+
+from api.core.config import settings
+from .image_processing import normalize_image, denormalize_image, compute_skin_roi
+from .color_lut import ColorClass, lookup_color_classes
+
+logger = logging.getLogger(__name__)
+
+
+class ImageContext:
+    """
+    Lazily computed, cached color planes of one preprocessed image
+    
+    Detectors may run concurrently on the analysis worker pool, so each
+    plane is guarded by its own lock and computed at most once.
+    Cached planes are shared between detectors and must not be modified.
+    """
+    
+    def __init__(
+        self,
+        image: np.ndarray,
+        offset: Tuple[int, int] = (0, 0),
+        mask: Optional[np.ndarray] = None,
+        frame_shape: Optional[Tuple[int, ...]] = None
+    ):
+        """
+        uint8 input (preprocess_image with normalize=False) is used as-is;
+        float input is denormalized once on first access.
+        
+        Args:
+            image: Preprocessed image (RGB, uint8 or ImageNet-normalized float)
+            offset: (x, y) of this image in the full frame (ROI contexts)
+            mask: uint8 mask (0/255) of the pixels to analyze (None = all)
+            frame_shape: Shape of the full frame (defaults to the image shape)
+        """
+        self._source = image
+        self.offset = offset
+        self.mask = mask
+        self.frame_shape = frame_shape or image.shape
+        self._planes: Dict[str, object] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+    
+    @classmethod
+    def ensure(cls, image: Union[np.ndarray, 'ImageContext']) -> 'ImageContext':
+        """Wrap a raw array in a context (contexts are returned unchanged)"""
+        if isinstance(image, ImageContext):
+            return image
+        return cls(image)
+    
+    def _plane(self, name: str, compute: Callable[[], object]):
+        """Return a cached plane, computing it on first access"""
+        value = self._planes.get(name)
+        if value is not None:
+            return value
+        
+        with self._locks_guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        
+        with lock:
+            value = self._planes.get(name)
+            if value is None:
+                value = compute()
+                self._planes[name] = value
+        return value
+    
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self._source.shape
+    
+    # Skin region
+    
+    @property
+    def roi(self) -> 'ImageContext':
+        """
+        Child context cropped to the skin region of the frame
+        
+        Its `mask` marks the skin region inside the crop and its `offset`
+        maps crop coordinates back to the frame. Returns this context when
+        SKIN_ROI_ENABLED is off, it is already a crop, or no skin is found.
+        """
+        if not settings.SKIN_ROI_ENABLED or self.offset != (0, 0) or self.mask is not None:
+            return self
+        
+        def compute():
+            roi = compute_skin_roi(self.rgb)
+            if roi is None:
+                logger.debug("No skin region found, analyzing the full frame")
+                return self
+            (x, y, w, h), mask = roi
+            if (w, h) == (self.shape[1], self.shape[0]) and cv2.countNonZero(mask) == w * h:
+                return self  # Skin everywhere, nothing to restrict
+            return ImageContext(
+                self.rgb[y:y + h, x:x + w],
+                offset=(x, y),
+                mask=mask,
+                frame_shape=self.shape
+            )
+        return self._plane('roi', compute)
+    
+    def restrict(self, binary: np.ndarray) -> np.ndarray:
+        """Zero a detector mask outside the analyzed region (new array)"""
+        if self.mask is None:
+            return binary
+        return cv2.bitwise_and(binary, self.mask)
+    
+    def masked_mean(self, plane: np.ndarray) -> float:
+        """Mean of a single-channel plane over the analyzed region"""
+        return cv2.mean(plane, mask=self.mask)[0]
+    
+    def masked_normalize(self, plane: np.ndarray) -> np.ndarray:
+        """Min-max scale a single-channel plane to 0-255 (uint8) using the range inside the region"""
+        if self.mask is None:
+            return cv2.normalize(plane, None, 0, 255, cv2.NORM_MINMAX)
+        low, high, _, _ = cv2.minMaxLoc(plane, self.mask)
+        scale = 255.0 / (high - low) if high > low else 0.0
+        return cv2.convertScaleAbs(plane, alpha=scale, beta=-low * scale)
+    
+    def in_region(self, x: float, y: float) -> bool:
+        """Whether a point (crop coordinates) lies in the analyzed region"""
+        if self.mask is None:
+            return True
+        h, w = self.mask.shape
+        return 0 <= x < w and 0 <= y < h and self.mask[int(y), int(x)] > 0
+    
+    def to_frame(self, plane: np.ndarray) -> np.ndarray:
+        """Paste a plane computed on this context into a zeroed full-frame array"""
+        if self.offset == (0, 0) and plane.shape[:2] == self.frame_shape[:2]:
+            return plane
+        frame = np.zeros(self.frame_shape[:2] + plane.shape[2:], dtype=plane.dtype)
+        x, y = self.offset
+        h, w = plane.shape[:2]
+        frame[y:y + h, x:x + w] = plane
+        return frame
+    
+    # Base image
+    
+    @property
+    def rgb(self) -> np.ndarray:
+        """uint8 RGB image"""
+        def compute():
+            if self._source.dtype in [np.float32, np.float64]:
+                return denormalize_image(self._source)
+            return self._source
+        return self._plane('rgb', compute)
+    
+    @property
+    def normalized(self) -> np.ndarray:
+        """ImageNet-normalized float32 image (only for learned models)"""
+        def compute():
+            if self._source.dtype == np.float32:
+                return self._source
+            return normalize_image(self.rgb)
+        return self._plane('normalized', compute)
+    
+    # Color spaces
+    
+    @property
+    def hsv(self) -> np.ndarray:
+        return self._plane('hsv', lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2HSV))
+    
+    @property
+    def lab(self) -> np.ndarray:
+        return self._plane('lab', lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2LAB))
+    
+    @property
+    def ycrcb(self) -> np.ndarray:
+        return self._plane('ycrcb', lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2YCrCb))
+    
+    @property
+    def gray(self) -> np.ndarray:
+        return self._plane('gray', lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY))
+    
+    # Split channels (contiguous copies)
+    
+    @property
+    def rgb_channels(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(R, G, B)"""
+        return self._plane('rgb_channels', lambda: tuple(cv2.split(self.rgb)))
+    
+    @property
+    def hsv_channels(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(H, S, V)"""
+        return self._plane('hsv_channels', lambda: tuple(cv2.split(self.hsv)))
+    
+    @property
+    def lab_channels(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(L*, a*, b*)"""
+        return self._plane('lab_channels', lambda: tuple(cv2.split(self.lab)))
+    
+    @property
+    def ycrcb_channels(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(Y, Cr, Cb)"""
+        return self._plane('ycrcb_channels', lambda: tuple(cv2.split(self.ycrcb)))
+    
+    # Color classes (RGB lookup table)
+    
+    @property
+    def color_classes(self) -> np.ndarray:
+        """Per-pixel ColorClass bits for every LUT-based detector rule"""
+        return self._plane('color_classes', lambda: lookup_color_classes(self.rgb))
+    
+    def color_mask(self, color_class: ColorClass) -> np.ndarray:
+        """Binary mask (0/255) of pixels in the given color class"""
+        return self._plane(
+            f'color_mask_{int(color_class)}',
+            lambda: cv2.compare(
+                cv2.bitwise_and(self.color_classes, int(color_class)), 0, cv2.CMP_GT
+            )
+        )
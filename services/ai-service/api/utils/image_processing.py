@@ -1,20 +1,185 @@
 """
 Image processing utilities
 """
+import math
+import struct
 import cv2
 import numpy as np
 from typing import Optional, Tuple
 import logging
 
+from api.core.config import settings
+from api.core.timing import timed_stage
+from .face_alignment import EXPECTED_CROP_FRACTION, align_face, get_face_detector
+from .frame_transform import FrameTransform, letterbox_matrix, resized_shape
+
 logger = logging.getLogger(__name__)
 
+# ImageNet normalization constants (float32 to avoid float64 promotion)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Skin ROI: side length the skin mask is computed at, minimum size of a skin
+# component (fraction of the frame) and margin added around the region
+SKIN_ROI_WORKING_SIZE = 256
+SKIN_ROI_MIN_COMPONENT = 0.01
+SKIN_ROI_MARGIN = 0.03
+
+# JPEG DCT-domain downscaling factors
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# JPEG start-of-frame markers (all except DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# Output formats: file extension and media type
+IMAGE_FORMATS = {
+    'png': ('.png', 'image/png'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+}
+
+
+class ImageRejectedError(ValueError):
+    """Upload refused before decoding (too large, too small, unreadable header)"""
+    
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def probe_image_size(contents: bytes) -> Optional[Tuple[int, int, str]]:
+    """
+    Read image dimensions from the file header without decoding pixels
+    
+    Args:
+        contents: Image file bytes
+    
+    Returns:
+        (width, height, 'jpeg' | 'png'), or None for other or malformed files
+    """
+    if contents[:8] == b'\x89PNG\r\n\x1a\n' and contents[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', contents[16:24])
+        return width, height, 'png'
+    
+    if contents[:2] != b'\xff\xd8':
+        return None
+    
+    # Walk JPEG segments up to the start-of-frame header
+    offset = 2
+    size = len(contents)
+    while offset + 4 <= size:
+        if contents[offset] != 0xFF:
+            return None
+        marker = contents[offset + 1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # No payload
+            offset += 2
+            continue
+        if marker in (0xD9, 0xDA):  # End of image / start of scan before any frame
+            return None
+        
+        length = struct.unpack('>H', contents[offset + 2:offset + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > size:
+                return None
+            height, width = struct.unpack('>HH', contents[offset + 5:offset + 9])
+            return width, height, 'jpeg'
+        offset += 2 + length
+    return None
+
+
+@timed_stage("decode")
+def decode_upload(contents: bytes, target_size: int = 1024) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+    """
+    Validate and decode an upload at roughly the size analysis needs
+    
+    Dimensions are read from the header first, so decompression bombs and
+    images outside MIN_IMAGE_SIZE / MAX_IMAGE_PIXELS are refused without
+    decoding. JPEGs are decoded with DCT-domain scaling (1/2, 1/4 or 1/8)
+    to the smallest size whose longest side is still >= target_size; the
+    result is then capped at MAX_IMAGE_SIZE.
+    
+    With FACE_ALIGNMENT_ENABLED and a face detector available, the analysis
+    frame is a face crop of roughly EXPECTED_CROP_FRACTION of the image, so
+    the image is decoded at target_size / EXPECTED_CROP_FRACTION instead
+    (still capped at MAX_IMAGE_SIZE); the crop then keeps about
+    target_size pixels when the cap allows it.
+    
+    Args:
+        contents: Image file bytes (JPEG or PNG)
+        target_size: Analysis frame size the image will be resized to
+    
+    Returns:
+        (decoded RGB image, (width, height) of the uploaded image), or None
+        if the file cannot be decoded
+    
+    Raises:
+        ImageRejectedError: Image too large (413) or too small (400)
+    """
+    probed = probe_image_size(contents)
+    if probed is None:
+        return None
+    width, height, image_format = probed
+    
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        raise ImageRejectedError(
+            f"Image too large: {width}x{height} ({width * height / 1e6:.0f} MP), "
+            f"limit is {settings.MAX_IMAGE_PIXELS / 1e6:.0f} MP",
+            status_code=413
+        )
+    if min(width, height) < settings.MIN_IMAGE_SIZE:
+        raise ImageRejectedError(
+            f"Image too small: {width}x{height}, "
+            f"both sides must be at least {settings.MIN_IMAGE_SIZE}px"
+        )
+    
+    # Size the face crop needs (see face_alignment.align_face), within the
+    # MAX_IMAGE_SIZE cap
+    if settings.FACE_ALIGNMENT_ENABLED and get_face_detector().available:
+        target_size = math.ceil(target_size / EXPECTED_CROP_FRACTION)
+    target_size = min(target_size, settings.MAX_IMAGE_SIZE)
+    
+    flags = cv2.IMREAD_COLOR
+    if image_format == 'jpeg':
+        longest = max(width, height)
+        for factor, reduced_flag in _REDUCED_FLAGS:
+            if longest / factor >= target_size:
+                flags = reduced_flag
+                break
+    
+    try:
+        image = cv2.imdecode(np.frombuffer(contents, np.uint8), flags)
+    except cv2.error as e:
+        logger.error(f"Error decoding image: {e}")
+        return None
+    if image is None:
+        return None
+    
+    # EXIF orientation may have rotated the decoded image
+    decoded_h, decoded_w = image.shape[:2]
+    if (decoded_w > decoded_h) != (width > height) and width != height:
+        width, height = height, width
+    
+    if max(decoded_h, decoded_w) > settings.MAX_IMAGE_SIZE:
+        scale = settings.MAX_IMAGE_SIZE / max(decoded_h, decoded_w)
+        image = cv2.resize(
+            image, (max(1, round(decoded_w * scale)), max(1, round(decoded_h * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+    
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), (width, height)
+
+
+@timed_stage("decode")
 def decode_image(contents: bytes) -> Optional[np.ndarray]:
     """
     Decode image from bytes
     
     Args:
         contents: Image file bytes
-        
+    
     Returns:
         numpy array (RGB) or None if failed
     """
@@ -28,44 +193,100 @@ def decode_image(contents: bytes) -> Optional[np.ndarray]:
         # Convert BGR to RGB
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         return image
-        
+    
     except Exception as e:
         logger.error(f"Error decoding image: {e}")
         return None
 
 
+@timed_stage("encode")
+def encode_image(
+    image: np.ndarray,
+    format: Optional[str] = None,
+    quality: Optional[int] = None,
+    compression: Optional[int] = None,
+    max_dimension: Optional[int] = None
+) -> Tuple[bytes, str]:
+    """
+    Encode an image for a response (defaults from the VISUALIZATION_* settings)
+    
+    Args:
+        image: Image (RGB)
+        format: 'png', 'jpeg' or 'webp'
+        quality: JPEG/WebP quality (1-100)
+        compression: PNG compression level (0-9, higher = smaller and slower)
+        max_dimension: Downscale so the longest side is at most this (0 = keep size)
+    
+    Returns:
+        (encoded bytes, media type)
+    """
+    format = (format or settings.VISUALIZATION_FORMAT).lower()
+    if format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {format}")
+    extension, media_type = IMAGE_FORMATS[format]
+    
+    if max_dimension is None:
+        max_dimension = settings.VISUALIZATION_MAX_DIMENSION
+    h, w = image.shape[:2]
+    if max_dimension and max(h, w) > max_dimension:
+        scale = max_dimension / max(h, w)
+        image = cv2.resize(
+            image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+        )
+    
+    if format == 'png':
+        level = settings.VISUALIZATION_PNG_COMPRESSION if compression is None else compression
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(np.clip(level, 0, 9))]
+    else:
+        quality = settings.VISUALIZATION_QUALITY if quality is None else quality
+        flag = cv2.IMWRITE_JPEG_QUALITY if format == 'jpeg' else cv2.IMWRITE_WEBP_QUALITY
+        params = [flag, int(np.clip(quality, 1, 100))]
+    
+    success, buffer = cv2.imencode(extension, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), params)
+    if not success:
+        raise ValueError(f"Failed to encode image as {format}")
+    return buffer.tobytes(), media_type
+
+
+@timed_stage("preprocess")
 def preprocess_image(
     image: np.ndarray,
     target_size: int = 1024,
-    normalize: bool = True
+    normalize: bool = True,
+    pad: bool = True
 ) -> np.ndarray:
     """
     Preprocess image for ML model inference
     - Resize to target size while maintaining aspect ratio
-    - Pad to square
+    - Pad to square (unless pad=False)
     - Normalize pixel values (ImageNet normalization)
     
+    The CV detectors work on uint8 pixels, so routers pass normalize=False
+    and skip the normalize/denormalize round trip. Learned models get a
+    float32 tensor from normalize_image (or ImageContext.normalized).
+    
     Args:
         image: Input image (RGB)
         target_size: Target size for the longest side
         normalize: Whether to apply ImageNet normalization
-        
+        pad: Pad to a target_size square; False keeps the native aspect
+            ratio (no padding pixels for the detectors to scan)
+    
     Returns:
         Preprocessed image ready for model input
+        (uint8 RGB, or float32 when normalize=True)
     """
     h, w = image.shape[:2]
     
     # Maintain aspect ratio
-    if h > w:
-        new_h = target_size
-        new_w = int(w * (target_size / h))
-    else:
-        new_w = target_size
-        new_h = int(h * (target_size / w))
+    new_h, new_w = resized_shape(h, w, target_size)
     
     # Resize
     resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
     
+    if not pad:
+        return normalize_image(resized) if normalize else resized
+    
     # Pad to square
     delta_h = target_size - new_h
     delta_w = target_size - new_w
@@ -81,15 +302,42 @@ def preprocess_image(
     
     # Normalize
     if normalize:
-        padded = padded.astype(np.float32) / 255.0
-        # ImageNet mean and std
-        mean = np.array([0.485, 0.456, 0.406])
-        std = np.array([0.229, 0.224, 0.225])
-        padded = (padded - mean) / std
+        padded = normalize_image(padded)
     
     return padded
 
 
+def normalize_image(image: np.ndarray) -> np.ndarray:
+    """
+    Apply ImageNet normalization
+    
+    Args:
+        image: uint8 image (RGB)
+    
+    Returns:
+        float32 normalized image
+    """
+    normalized = image.astype(np.float32)
+    normalized *= np.float32(1.0 / 255.0)
+    normalized -= IMAGENET_MEAN
+    normalized /= IMAGENET_STD
+    return normalized
+
+
+def denormalize_image(image: np.ndarray) -> np.ndarray:
+    """
+    Undo ImageNet normalization
+    
+    Args:
+        image: ImageNet-normalized float image (RGB)
+    
+    Returns:
+        uint8 image (RGB)
+    """
+    image = image * IMAGENET_STD + IMAGENET_MEAN
+    return np.clip(np.rint(image * 255), 0, 255).astype(np.uint8)
+
+
 def enhance_contrast(image: np.ndarray) -> np.ndarray:
     """
     Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
@@ -97,7 +345,7 @@ def enhance_contrast(image: np.ndarray) -> np.ndarray:
     
     Args:
         image: Input image (RGB)
-        
+    
     Returns:
         Contrast-enhanced image
     """
@@ -119,17 +367,49 @@ def enhance_contrast(image: np.ndarray) -> np.ndarray:
 def apply_face_alignment(image: np.ndarray) -> Tuple[np.ndarray, bool]:
     """
     Detect face and align for consistent analysis
-    (Placeholder - requires face detection library like dlib or MediaPipe)
+    (see api/utils/face_alignment.py)
     
     Args:
         image: Input image (RGB)
-        
+    
     Returns:
         (aligned_image, face_detected)
     """
-    # TODO: Implement face detection and alignment
-    # For now, return original image
-    return image, False
+    aligned, matrix = align_face(image)
+    return aligned, matrix is not None
+
+
+def prepare_image(
+    image: np.ndarray,
+    target_size: int = 1024,
+    original_size: Optional[Tuple[int, int]] = None,
+    pad: Optional[bool] = None
+) -> Tuple[np.ndarray, FrameTransform]:
+    """
+    Crop/align the face and preprocess it for the detectors
+    
+    Args:
+        image: Decoded image (RGB)
+        target_size: Analysis frame size
+        original_size: (width, height) of the uploaded image when `image`
+            was decoded at a reduced size (see decode_upload)
+        pad: Letterbox the frame to a square (default: PAD_TO_SQUARE)
+    
+    Returns:
+        (uint8 analysis frame, transform mapping frame coordinates back to
+        the uploaded image, or to `image` if original_size is None)
+    """
+    if pad is None:
+        pad = settings.PAD_TO_SQUARE
+    
+    face, align_matrix = align_face(image)
+    processed = preprocess_image(face, target_size=target_size, normalize=False, pad=pad)
+    transform = FrameTransform.compose(
+        align_matrix, letterbox_matrix(*face.shape[:2], target_size, pad), image.shape
+    )
+    if original_size is not None:
+        transform = transform.from_original_size(original_size)
+    return processed, transform
 
 
 def calculate_skin_mask(image: np.ndarray) -> np.ndarray:
@@ -138,7 +418,7 @@ def calculate_skin_mask(image: np.ndarray) -> np.ndarray:
     
     Args:
         image: Input image (RGB)
-        
+    
     Returns:
         Binary mask where 1 = skin, 0 = non-skin
     """
@@ -162,3 +442,52 @@ def calculate_skin_mask(image: np.ndarray) -> np.ndarray:
     mask = mask.astype(np.float32) / 255.0
     
     return mask
+
+
+@timed_stage("skin_roi")
+def compute_skin_roi(image: np.ndarray) -> Optional[Tuple[Tuple[int, int, int, int], np.ndarray]]:
+    """
+    Locate the skin region of a frame (face without background, hair,
+    clothes or letterbox padding)
+    
+    The skin mask is computed on a downscaled copy. Holes inside skin
+    components (dark spots, eyes, brows) are filled so lesions stay inside
+    the region, and specks smaller than SKIN_ROI_MIN_COMPONENT are dropped.
+    
+    Args:
+        image: Input image (RGB uint8)
+    
+    Returns:
+        ((x, y, w, h) bounding box, uint8 mask (0/255) of that box) in image
+        coordinates, or None if no sizeable skin region was found
+    """
+    h, w = image.shape[:2]
+    scale = min(1.0, SKIN_ROI_WORKING_SIZE / max(h, w))
+    small_w, small_h = max(1, round(w * scale)), max(1, round(h * scale))
+    small = cv2.resize(image, (small_w, small_h), interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+    
+    skin = (calculate_skin_mask(small) > 0.5).astype(np.uint8) * 255
+    contours, _ = cv2.findContours(skin, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = SKIN_ROI_MIN_COMPONENT * small_w * small_h
+    contours = [c for c in contours if cv2.contourArea(c) >= min_area]
+    if not contours:
+        return None
+    
+    # Filled outer contours, grown by the margin
+    region = np.zeros_like(skin)
+    cv2.drawContours(region, contours, -1, 255, thickness=cv2.FILLED)
+    margin = max(1, round(SKIN_ROI_MARGIN * max(small_w, small_h)))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * margin + 1, 2 * margin + 1))
+    region = cv2.dilate(region, kernel)
+    
+    # Bounding box back in full-resolution coordinates
+    sx, sy, sw, sh = cv2.boundingRect(region)
+    x0 = max(0, int(np.floor(sx * w / small_w)))
+    y0 = max(0, int(np.floor(sy * h / small_h)))
+    x1 = min(w, int(np.ceil((sx + sw) * w / small_w)))
+    y1 = min(h, int(np.ceil((sy + sh) * h / small_h)))
+    
+    mask = cv2.resize(
+        region[sy:sy + sh, sx:sx + sw], (x1 - x0, y1 - y0), interpolation=cv2.INTER_NEAREST
+    )
+    return (x0, y0, x1 - x0, y1 - y0), mask
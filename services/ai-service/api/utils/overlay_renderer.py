@@ -47,7 +47,7 @@ class OverlayRenderer:
         self.image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
         self.height, self.width = self.image.shape[:2]
         self.overlay = self.image.copy()
-        
+    
     def draw_spots(
         self, 
         detections: List[Dict[str, Any]], 
@@ -63,33 +63,37 @@ class OverlayRenderer:
             spot_type: Type of spots ('spots', 'uv_spots', 'brown_spots', 'porphyrins')
             show_numbers: Show detection numbers
             show_confidence: Show confidence scores
-            
+        
         Returns:
             Self for method chaining
         """
         color = self.COLORS.get(spot_type, self.COLORS['spots'])
         
-        for i, det in enumerate(detections, 1):
-            bbox = det['bbox']
-            confidence = det.get('confidence', 0)
-            
+        markers = []
+        for det in detections:
             # Calculate center point
-            x, y, w, h = bbox
+            x, y, w, h = det['bbox']
             center_x = int(x + w / 2)
             center_y = int(y + h / 2)
             
             # Calculate radius based on size (with minimum and maximum)
             radius = int(max(min(w, h) / 2, 3))
             radius = min(radius, 20)  # Cap at 20 pixels
-            
-            # Draw outer white border
+            markers.append((center_x, center_y, radius))
+        
+        # Draw outer white borders
+        for center_x, center_y, radius in markers:
             cv2.circle(self.overlay, (center_x, center_y), radius + 2, 
                       self.COLORS['marker_border'], 2)
-            
-            # Draw filled circle with transparency
-            overlay_temp = self.overlay.copy()
-            cv2.circle(overlay_temp, (center_x, center_y), radius, color, -1)
-            cv2.addWeighted(overlay_temp, 0.6, self.overlay, 0.4, 0, self.overlay)
+        
+        # Draw filled circles with transparency (one layer for all markers)
+        layer = self._new_mask()
+        for center_x, center_y, radius in markers:
+            cv2.circle(layer, (center_x, center_y), radius, 255, -1)
+        self._blend_mask(layer, color, 0.6)
+        
+        for i, (det, (center_x, center_y, radius)) in enumerate(zip(detections, markers), 1):
+            confidence = det.get('confidence', 0)
             
             # Draw circle outline
             cv2.circle(self.overlay, (center_x, center_y), radius, color, 2)
@@ -122,7 +126,7 @@ class OverlayRenderer:
         Args:
             detections: List of wrinkle detections with 'points' or 'bbox'
             show_numbers: Show detection numbers
-            
+        
         Returns:
             Self for method chaining
         """
@@ -177,29 +181,31 @@ class OverlayRenderer:
         Args:
             detections: List of pore detections
             show_numbers: Show detection numbers (usually False for pores)
-            
+        
         Returns:
             Self for method chaining
         """
         color = self.COLORS['pores']
         
-        for i, det in enumerate(detections, 1):
-            bbox = det['bbox']
-            
+        markers = []
+        for det in detections:
             # Calculate center point
-            x, y, w, h = bbox
+            x, y, w, h = det['bbox']
             center_x = int(x + w / 2)
             center_y = int(y + h / 2)
             
             # Small radius for pores (2-4 pixels)
             radius = max(2, int(min(w, h) / 3))
-            
-            # Draw small circle with slight transparency
-            overlay_temp = self.overlay.copy()
-            cv2.circle(overlay_temp, (center_x, center_y), radius, color, -1)
-            cv2.addWeighted(overlay_temp, 0.5, self.overlay, 0.5, 0, self.overlay)
-            
-            # Draw outline
+            markers.append((center_x, center_y, radius))
+        
+        # Draw small circles with slight transparency (one layer for all pores)
+        layer = self._new_mask()
+        for center_x, center_y, radius in markers:
+            cv2.circle(layer, (center_x, center_y), radius, 255, -1)
+        self._blend_mask(layer, color, 0.5)
+        
+        # Draw outlines
+        for center_x, center_y, radius in markers:
             cv2.circle(self.overlay, (center_x, center_y), radius, color, 1)
         
         return self
@@ -217,7 +223,7 @@ class OverlayRenderer:
             heatmap: Grayscale heatmap (0-255)
             alpha: Transparency (0=invisible, 1=opaque)
             colormap: OpenCV colormap (COLORMAP_JET for red->yellow->green)
-            
+        
         Returns:
             Self for method chaining
         """
@@ -255,7 +261,7 @@ class OverlayRenderer:
             color: Box color (BGR), None for auto
             label_key: Key for label text
             show_confidence: Show confidence scores
-            
+        
         Returns:
             Self for method chaining
         """
@@ -292,7 +298,7 @@ class OverlayRenderer:
             modes: List of mode names
             counts: Dictionary of mode -> count
             position: 'top-right', 'top-left', 'bottom-right', 'bottom-left'
-            
+        
         Returns:
             Self for method chaining
         """
@@ -312,10 +318,7 @@ class OverlayRenderer:
             x, y = 10, self.height - box_height - 10
         
         # Draw semi-transparent background
-        overlay_temp = self.overlay.copy()
-        cv2.rectangle(overlay_temp, (x, y), (x + box_width, y + box_height),
-                     (0, 0, 0), -1)
-        cv2.addWeighted(overlay_temp, 0.7, self.overlay, 0.3, 0, self.overlay)
+        self._blend_rect(x, y, box_width, box_height, (0, 0, 0), 0.7)
         
         # Draw border
         cv2.rectangle(self.overlay, (x, y), (x + box_width, y + box_height),
@@ -349,7 +352,7 @@ class OverlayRenderer:
         Args:
             stats: Dictionary of statistics to display
             position: Panel position
-            
+        
         Returns:
             Self for method chaining
         """
@@ -370,10 +373,7 @@ class OverlayRenderer:
             x, y = self.width - box_width - 10, self.height - box_height - 10
         
         # Draw background
-        overlay_temp = self.overlay.copy()
-        cv2.rectangle(overlay_temp, (x, y), (x + box_width, y + box_height),
-                     (30, 30, 30), -1)
-        cv2.addWeighted(overlay_temp, 0.85, self.overlay, 0.15, 0, self.overlay)
+        self._blend_rect(x, y, box_width, box_height, (30, 30, 30), 0.85)
         
         # Draw border
         cv2.rectangle(self.overlay, (x, y), (x + box_width, y + box_height),
@@ -411,6 +411,60 @@ class OverlayRenderer:
         
         return self
     
+    def _new_mask(self) -> np.ndarray:
+        """Empty single-channel layer to draw translucent shapes into"""
+        return np.zeros((self.height, self.width), dtype=np.uint8)
+    
+    def _blend_mask(
+        self,
+        mask: np.ndarray,
+        color: Tuple[int, int, int],
+        alpha: float
+    ) -> None:
+        """
+        Blend a solid color over the overlay wherever mask is set
+        
+        Only pixels inside the mask's bounding rectangle are read, so a
+        whole layer of markers costs a single pass.
+        
+        Args:
+            mask: Layer from _new_mask() (non-zero = covered)
+            color: Fill color (BGR)
+            alpha: Opacity of the fill
+        """
+        x, y, w, h = cv2.boundingRect(mask)
+        if w == 0 or h == 0:
+            return
+        
+        region = self.overlay[y:y + h, x:x + w]
+        covered = mask[y:y + h, x:x + w] > 0
+        pixels = region[covered].astype(np.float32)
+        blended = pixels * (1 - alpha) + np.array(color, dtype=np.float32) * alpha
+        region[covered] = np.clip(np.rint(blended), 0, 255).astype(np.uint8)
+    
+    def _blend_rect(
+        self,
+        x: int,
+        y: int,
+        width: int,
+        height: int,
+        color: Tuple[int, int, int],
+        alpha: float
+    ) -> None:
+        """
+        Blend a solid rectangle (corners inclusive, like cv2.rectangle)
+        over the overlay, touching only the pixels it covers
+        """
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + width + 1), min(self.height, y + height + 1)
+        if x1 <= x0 or y1 <= y0:
+            return
+        
+        region = self.overlay[y0:y1, x0:x1]
+        solid = np.empty_like(region)
+        solid[:] = color
+        self.overlay[y0:y1, x0:x1] = cv2.addWeighted(solid, alpha, region, 1 - alpha, 0)
+    
     def _draw_label(
         self,
         x: int,
@@ -465,7 +519,7 @@ class OverlayRenderer:
         
         Args:
             format: Output format ('RGB' or 'BGR')
-            
+        
         Returns:
             Rendered image
         """
@@ -478,45 +532,48 @@ def create_multimode_visualization(
     image: np.ndarray,
     results: Dict[str, Any],
     show_legend: bool = True,
-    show_stats: bool = True
+    show_stats: bool = True,
+    show_numbers: bool = True
 ) -> np.ndarray:
     """
     Create comprehensive visualization for multi-mode analysis
     
     Args:
         image: Original image (RGB)
-        results: Multi-mode analysis results
+        results: Multi-mode analysis results (modes that did not run are
+            missing or None)
         show_legend: Show detection count legend
         show_stats: Show statistics panel
-        
+        show_numbers: Show detection numbers on markers
+    
     Returns:
         Annotated image (RGB)
     """
     renderer = OverlayRenderer(image)
     
     # Draw each mode's detections
-    if 'spots' in results and results['spots'].get('detections'):
-        renderer.draw_spots(results['spots']['detections'], 'spots', show_numbers=True)
+    if results.get('spots') and results['spots'].get('detections'):
+        renderer.draw_spots(results['spots']['detections'], 'spots', show_numbers=show_numbers)
     
     if 'uv_spots' in results and results['uv_spots']:
         uv_dets = results['uv_spots'].get('detections', [])
         if uv_dets:
-            renderer.draw_spots(uv_dets, 'uv_spots', show_numbers=True)
+            renderer.draw_spots(uv_dets, 'uv_spots', show_numbers=show_numbers)
     
     if 'brown_spots' in results and results['brown_spots']:
         brown_dets = results['brown_spots'].get('detections', [])
         if brown_dets:
-            renderer.draw_spots(brown_dets, 'brown_spots', show_numbers=True)
+            renderer.draw_spots(brown_dets, 'brown_spots', show_numbers=show_numbers)
     
     if 'porphyrins' in results and results['porphyrins']:
         porph_dets = results['porphyrins'].get('detections', [])
         if porph_dets:
-            renderer.draw_spots(porph_dets, 'porphyrins', show_numbers=True)
+            renderer.draw_spots(porph_dets, 'porphyrins', show_numbers=show_numbers)
     
-    if 'wrinkles' in results and results['wrinkles'].get('detections'):
-        renderer.draw_wrinkles(results['wrinkles']['detections'], show_numbers=True)
+    if results.get('wrinkles') and results['wrinkles'].get('detections'):
+        renderer.draw_wrinkles(results['wrinkles']['detections'], show_numbers=show_numbers)
     
-    if 'pores' in results and results['pores'].get('detections'):
+    if results.get('pores') and results['pores'].get('detections'):
         renderer.draw_pores(results['pores']['detections'], show_numbers=False)
     
     # Draw heatmap for red areas (if available)
@@ -530,7 +587,7 @@ def create_multimode_visualization(
         counts = {}
         modes = []
         
-        if 'spots' in results:
+        if results.get('spots'):
             modes.append('spots')
             counts['spots'] = results['spots']['statistics']['total_count']
         if 'uv_spots' in results and results['uv_spots']:
@@ -539,10 +596,10 @@ def create_multimode_visualization(
         if 'brown_spots' in results and results['brown_spots']:
             modes.append('brown_spots')
             counts['brown_spots'] = results['brown_spots']['statistics']['total_count']
-        if 'wrinkles' in results:
+        if results.get('wrinkles'):
             modes.append('wrinkles')
             counts['wrinkles'] = results['wrinkles']['statistics']['total_count']
-        if 'pores' in results:
+        if results.get('pores'):
             modes.append('pores')
             counts['pores'] = results['pores']['statistics']['total_count']
         if 'porphyrins' in results and results['porphyrins']:
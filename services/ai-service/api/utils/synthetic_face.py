@@ -0,0 +1,53 @@
+"""
+Synthetic test face
+Deterministic skin-like image used where a real photo is not available:
+the benchmark inputs and the startup warmup.
+"""
+import cv2
+import numpy as np
+
+
+def make_synthetic_face(size: int, seed: int = 0) -> np.ndarray:
+    """
+    Deterministic skin-like RGB image with spots, lines, redness and pores,
+    so every detector has something to find
+    """
+    rng = np.random.default_rng(seed)
+    scale = size / 1024.0
+    
+    # Skin tone with low-frequency shading and fine noise
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    shading = 0.9 + 0.1 * np.cos((xx - 0.5) * np.pi) * np.cos((yy - 0.5) * np.pi)
+    image = np.empty((size, size, 3), dtype=np.float32)
+    for c, tone in enumerate((224, 180, 150)):
+        image[..., c] = tone * shading
+    image += rng.normal(0, 4, image.shape).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    
+    def radius(lo, hi):
+        return max(1, int(rng.integers(lo, hi) * scale))
+    
+    def point():
+        return tuple(int(v) for v in rng.integers(int(40 * scale), size - int(40 * scale), 2))
+    
+    # Brown / dark spots
+    for _ in range(40):
+        color = tuple(int(v) for v in rng.integers([90, 55, 30], [150, 100, 70]))
+        cv2.circle(image, point(), radius(3, 10), color, -1)
+    
+    # Red patches
+    for _ in range(10):
+        cv2.ellipse(image, point(), (radius(15, 40), radius(8, 25)), float(rng.integers(0, 180)),
+                    0, 360, (210, 90, 90), -1)
+    
+    # Wrinkle-like lines
+    for _ in range(15):
+        p1 = point()
+        p2 = (p1[0] + radius(40, 120), p1[1] + int(rng.integers(-20, 20) * scale))
+        cv2.line(image, p1, p2, (150, 115, 95), max(1, int(2 * scale)))
+    
+    # Pores
+    for _ in range(300):
+        cv2.circle(image, point(), radius(1, 3), (170, 130, 110), -1)
+    
+    return cv2.GaussianBlur(image, (3, 3), 0)
@@ -0,0 +1,391 @@
+"""
+Benchmark suite for Beauty AI Analysis Service
+Runs every detector and every endpoint (in-process, through FastAPI's
+TestClient - no live server needed) on synthetic and test_images/ inputs
+at several sizes, and records wall time, CPU time, peak RSS and
+allocations per stage as JSON.
+
+Usage:
+    python benchmark.py                                  # Full run -> benchmark_results/<timestamp>.json
+    python benchmark.py --sizes 512 1024 --repeat 5
+    python benchmark.py --groups detectors --inputs synthetic
+    python benchmark.py --compare benchmark_results/baseline.json --threshold 0.2
+
+With --compare the exit code is 1 if any stage got slower than the
+threshold (relative median wall time), so it can gate a deploy.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+SERVICE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+from api.core.config import settings  # noqa: E402
+
+# Measure the work itself, not the result cache or the startup warmup
+# (which would run in the background during the first endpoint timings;
+# --warmup runs warm every case before it is measured)
+settings.RESULT_CACHE_MAX_MB = 0
+settings.WARMUP_ENABLED = False
+
+from api.core.analysis import ANALYSIS_MODES  # noqa: E402
+from api.core.model_loader import ModelLoader  # noqa: E402
+from api.utils import decode_image, decode_upload, preprocess_image, ImageContext, make_synthetic_face  # noqa: E402
+
+DEFAULT_SIZES = [512, 1024, 2048, 4096]
+DEFAULT_INPUTS = ['synthetic', 'face_sample']
+TEST_IMAGES_DIR = SERVICE_DIR / "test_images"
+
+# Detector stages: (mode, method)
+DETECTORS = [(mode, 'analyze_sync' if mode == 'texture' else 'detect_sync') for mode in ANALYSIS_MODES]
+
+# Endpoint stages: (name, path, upload field, number of copies of the image)
+ENDPOINTS = [
+    ('spots', '/api/analyze/spots', 'file', 1),
+    ('wrinkles', '/api/analyze/wrinkles', 'file', 1),
+    ('texture', '/api/analyze/texture', 'file', 1),
+    ('pores', '/api/analyze/pores', 'file', 1),
+    ('uv_spots', '/api/analyze/uv-spots', 'file', 1),
+    ('brown_spots', '/api/analyze/brown-spots', 'file', 1),
+    ('red_areas', '/api/analyze/red-areas', 'file', 1),
+    ('porphyrins', '/api/analyze/porphyrins', 'file', 1),
+    ('multi_mode', '/api/analyze/multi-mode', 'file', 1),
+    ('multi_mode_stream', '/api/analyze/multi-mode/stream', 'file', 1),
+    ('batch_x4', '/api/analyze/batch', 'files', 4),
+    ('visualize_multi_mode', '/api/visualize/multi-mode', 'file', 1),
+    ('visualize_spots', '/api/visualize/single-mode/spots', 'file', 1),
+]
+
+
+# ---------------------------------------------------------------------------
+# Inputs
+# ---------------------------------------------------------------------------
+
+def load_input(name: str, size: int) -> np.ndarray:
+    """RGB input image of the given size"""
+    if name == 'synthetic':
+        return make_synthetic_face(size)
+    
+    path = TEST_IMAGES_DIR / f"{name}.jpg"
+    bgr = cv2.imread(str(path))
+    if bgr is None:
+        raise FileNotFoundError(f"Test image not found: {path}")
+    interpolation = cv2.INTER_AREA if size < max(bgr.shape[:2]) else cv2.INTER_CUBIC
+    return cv2.cvtColor(cv2.resize(bgr, (size, size), interpolation=interpolation), cv2.COLOR_BGR2RGB)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 92) -> bytes:
+    ok, buffer = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                              [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buffer.tobytes()
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (None if unavailable)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """Samples RSS in a background thread to find the peak during a stage"""
+    
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.start_rss = None
+        self.peak_rss = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss()
+        if self.start_rss is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None and rss > self.peak_rss:
+                self.peak_rss = rss
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        rss = current_rss()
+        if rss is not None and self.peak_rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {
+        'median': round(statistics.median(values), 3),
+        'min': round(min(values), 3),
+        'max': round(max(values), 3),
+    }
+
+
+def measure(
+    func: Callable[[], Any], repeat: int, warmup: int, track_allocations: bool
+) -> Tuple[Dict[str, Any], Any]:
+    """
+    Time a stage and record its memory behaviour (returns record, last result)
+    
+    Timing runs are done without tracemalloc (it slows allocation-heavy
+    code considerably); allocations are measured in one extra run.
+    CPU time is process-wide, so it includes the analysis worker threads.
+    """
+    for _ in range(warmup):
+        func()
+    
+    wall, cpu = [], []
+    peak_rss_delta = 0
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        with RssSampler() as sampler:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            result = func()
+            wall.append((time.perf_counter() - wall_start) * 1000)
+            cpu.append((time.process_time() - cpu_start) * 1000)
+        if sampler.peak_rss is not None:
+            peak_rss_delta = max(peak_rss_delta, sampler.peak_rss - sampler.start_rss)
+    
+    rss = current_rss()
+    record = {
+        'wall_ms': _summary(wall),
+        'cpu_ms': _summary(cpu),
+        'peak_rss_mb': round(rss / 2**20, 1) if rss is not None else None,
+        'peak_rss_delta_mb': round(peak_rss_delta / 2**20, 1),
+    }
+    
+    if track_allocations:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        func()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        record['alloc_peak_mb'] = round(alloc_peak / 2**20, 2)
+        record['alloc_blocks'] = sum(max(s.count_diff, 0) for s in stats)
+    
+    return record, result
+
+
+# ---------------------------------------------------------------------------
+# Benchmark groups
+# ---------------------------------------------------------------------------
+
+def bench_detectors(loader: ModelLoader, inputs: List[str], sizes: List[int], args) -> List[Dict[str, Any]]:
+    """Decode, preprocess and every detector (sync, in this thread)"""
+    results = []
+    for input_name in inputs:
+        for size in sizes:
+            image = load_input(input_name, size)
+            jpeg = encode_jpeg(image)
+            
+            def record(stage: str, func: Callable[[], Any]):
+                print(f"  detectors  {input_name:<12} {size:>5}px  {stage:<20}", end='', flush=True)
+                entry, result = measure(func, args.repeat, args.warmup, not args.no_alloc)
+                print(f"{entry['wall_ms']['median']:>9.1f} ms")
+                results.append({'group': 'detectors', 'stage': stage, 'input': input_name,
+                                 'size': size, **entry})
+                return result
+            
+            decoded = record('decode', lambda: decode_image(jpeg))
+            record('decode_upload', lambda: decode_upload(jpeg, 1024))  # Header check + reduced decode
+            processed = record('preprocess', lambda: preprocess_image(decoded, target_size=1024, normalize=False))
+            
+            # Each detector on a fresh context (includes its own color conversions)
+            for name, method in DETECTORS:
+                run = getattr(loader.models[name], method)
+                if method == 'analyze_sync':
+                    record(name, lambda run=run: run(ImageContext(processed)))
+                else:
+                    record(name, lambda run=run: run(ImageContext(processed), 0.5))
+            
+            # All detectors sharing one context, sequentially
+            def all_detectors():
+                context = ImageContext(processed)
+                for name, method in DETECTORS:
+                    run = getattr(loader.models[name], method)
+                    if method == 'analyze_sync':
+                        run(context)
+                    else:
+                        run(context, 0.5)
+            record('all_shared_context', all_detectors)
+    
+    return results
+
+
+def bench_endpoints(inputs: List[str], sizes: List[int], args) -> List[Dict[str, Any]]:
+    """Every router through FastAPI's TestClient"""
+    from fastapi.testclient import TestClient
+    import main
+    
+    results = []
+    with TestClient(main.app) as client:
+        for input_name in inputs:
+            for size in sizes:
+                jpeg = encode_jpeg(load_input(input_name, size))
+                
+                for name, path, field, copies in ENDPOINTS:
+                    files = [(field, (f"{input_name}_{i}.jpg", jpeg, 'image/jpeg')) for i in range(copies)]
+                    status = {}
+                    
+                    def call():
+                        response = client.post(path, files=files)
+                        status['code'] = response.status_code
+                        return response
+                    
+                    print(f"  endpoints  {input_name:<12} {size:>5}px  {name:<20}", end='', flush=True)
+                    entry, _ = measure(call, args.repeat, args.warmup, not args.no_alloc)
+                    print(f"{entry['wall_ms']['median']:>9.1f} ms  [{status.get('code')}]")
+                    results.append({'group': 'endpoints', 'stage': name, 'input': input_name,
+                                    'size': size, 'status': status.get('code'), **entry})
+    
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def environment_info() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+        'analysis_workers': settings.ANALYSIS_WORKERS,
+    }
+
+
+def _key(entry: Dict[str, Any]) -> tuple:
+    return (entry['group'], entry['stage'], entry['input'], entry['size'])
+
+
+def compare(current: List[Dict[str, Any]], baseline_path: Path, threshold: float) -> int:
+    """Print median wall time changes against a baseline; return the number of regressions"""
+    baseline = {_key(e): e for e in json.loads(baseline_path.read_text())['results']}
+    regressions = 0
+    
+    print(f"\n📊 Comparison with {baseline_path} (threshold +{threshold:.0%})")
+    for entry in current:
+        old = baseline.get(_key(entry))
+        if old is None:
+            continue
+        before, after = old['wall_ms']['median'], entry['wall_ms']['median']
+        change = (after - before) / before if before > 0 else 0.0
+        regressed = change > threshold
+        regressions += regressed
+        marker = '❌' if regressed else ('✅' if change < -threshold else '  ')
+        group, stage, input_name, size = _key(entry)
+        print(f"  {marker} {group:<10} {input_name:<12} {size:>5}px  {stage:<20} "
+              f"{before:>9.1f} -> {after:>9.1f} ms  ({change:+.1%})")
+    
+    print(f"\n{regressions} regression(s)")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark detectors and endpoints")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--inputs', nargs='+', default=DEFAULT_INPUTS,
+                        help="'synthetic' and/or test_images/<name>.jpg stems")
+    parser.add_argument('--groups', nargs='+', choices=['detectors', 'endpoints'],
+                        default=['detectors', 'endpoints'])
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per stage")
+    parser.add_argument('--no-alloc', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--output', type=Path, default=None,
+                        help="JSON output path (default: benchmark_results/<timestamp>.json)")
+    parser.add_argument('--compare', type=Path, default=None, help="Baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Allowed relative slowdown of median wall time (default 0.2)")
+    args = parser.parse_args()
+    
+    # Keep per-request logs out of the report
+    logging.basicConfig(level=logging.WARNING)
+    
+    print("🏁 Beauty AI benchmark")
+    print(f"   sizes={args.sizes} inputs={args.inputs} groups={args.groups} repeat={args.repeat}")
+    
+    results = []
+    if 'detectors' in args.groups:
+        loader = ModelLoader()
+        asyncio.run(loader.load_models(ANALYSIS_MODES))
+        results += bench_detectors(loader, args.inputs, args.sizes, args)
+    if 'endpoints' in args.groups:
+        results += bench_endpoints(args.inputs, args.sizes, args)
+    
+    report = {
+        'environment': environment_info(),
+        'config': {
+            'sizes': args.sizes, 'inputs': args.inputs, 'groups': args.groups,
+            'repeat': args.repeat, 'warmup': args.warmup, 'allocations': not args.no_alloc,
+        },
+        'results': results,
+    }
+    
+    output = args.output or SERVICE_DIR / "benchmark_results" / (
+        datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n💾 Results written to {output}")
+    
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,73 @@
+"""
+Re-save detector weights in the memory-mappable format
+The service memory-maps pickled .pth modules (WEIGHTS_MMAP): weights are
+paged in from the page cache on first use and shared by every worker and
+restart on the node. That needs the zip format written by torch.save since
+PyTorch 1.6; files in the legacy format are loaded fully into each process.
+This script rewrites legacy files in place (keeping a .bak copy).
+TorchScript archives cannot be memory-mapped and are left as they are.
+Needs torch (pip install -r requirements-export.txt).
+
+Usage:
+    python convert_weights.py                  # Every mode with a .pth
+    python convert_weights.py --modes spots pores
+"""
+
+import argparse
+import shutil
+import sys
+import zipfile
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+from api.core.config import settings  # noqa: E402
+from api.core.model_loader import DETECTORS  # noqa: E402
+
+
+def is_torchscript(path: Path) -> bool:
+    """TorchScript archives are zip files with a constants.pkl entry"""
+    with zipfile.ZipFile(path) as archive:
+        return any(name.endswith('/constants.pkl') for name in archive.namelist())
+
+
+def convert(mode: str, path: Path):
+    import torch
+    
+    if zipfile.is_zipfile(path):
+        kind = 'TorchScript, cannot be memory-mapped' if is_torchscript(path) else 'already memory-mappable'
+        print(f"  - {mode}: {path.name} ({kind})")
+        return
+    
+    module = torch.load(str(path), map_location='cpu', weights_only=False)
+    backup = path.with_name(path.name + '.bak')
+    shutil.copy2(path, backup)
+    torch.save(module, str(path))
+    
+    # Check the rewritten file maps
+    torch.load(str(path), map_location='cpu', weights_only=False, mmap=True)
+    print(f"  ✅ {mode}: {path.name} converted (original kept as {backup.name})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=list(DETECTORS), default=list(DETECTORS))
+    args = parser.parse_args()
+    
+    try:
+        import torch  # noqa: F401
+    except ImportError as e:
+        raise SystemExit(f"Conversion needs torch: {e}")
+    
+    print("📦 Weight conversion")
+    for mode in args.modes:
+        path = Path(settings.MODELS_DIR) / getattr(settings, DETECTORS[mode].weights_setting)
+        if not path.is_file():
+            print(f"  - {mode}: no weights ({path.name}), skipped")
+            continue
+        convert(mode, path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Export detector networks to ONNX (optionally INT8-quantized)
+Converts each mode's .pth in MODELS_DIR (TorchScript or pickled nn.Module)
+to <name>.onnx with dynamic batch/height/width axes and checks it against
+PyTorch. With --int8 it also writes <name>.int8.onnx, statically quantized
+with a calibration set of analysis frames drawn from test_images/ (decoded,
+face-cropped and resized exactly as the service does).
+
+Usage:
+    python export_onnx.py                                # Every mode with a .pth
+    python export_onnx.py --modes spots pores --int8
+    python export_onnx.py --int8 --calibration-dir test_images --size 1024
+
+Serve the exports with INFERENCE_BACKEND=onnx (or onnx-int8), or per mode
+with INFERENCE_BACKENDS=spots=onnx-int8. Only this script needs torch and
+onnx (pip install -r requirements-export.txt); the serving image only needs
+onnxruntime.
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+SERVICE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+from api.core.config import settings  # noqa: E402
+from api.core.inference import backend_path, load_torch_module, network_input  # noqa: E402
+from api.core.model_loader import DETECTORS  # noqa: E402
+from api.utils import decode_image, prepare_image  # noqa: E402
+
+CALIBRATION_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Largest relative difference accepted between the FP32 export and PyTorch
+EXPORT_TOLERANCE = 1e-3
+
+
+def calibration_inputs(directory: Path, size: int, limit: int) -> List[np.ndarray]:
+    """Network inputs for the images in a directory (as served: face crop + resize)"""
+    inputs = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in CALIBRATION_EXTENSIONS:
+            continue
+        image = decode_image(path.read_bytes())
+        if image is None:
+            print(f"  ⚠️ Skipping {path.name} (cannot decode)")
+            continue
+        frame, _ = prepare_image(image, target_size=size)
+        inputs.append(network_input(frame))
+        if len(inputs) >= limit:
+            break
+    if not inputs:
+        raise SystemExit(f"No calibration images in {directory}")
+    return inputs
+
+
+def load_module(path: Path):
+    """TorchScript archive or pickled nn.Module, in eval mode"""
+    module = load_torch_module(path)
+    if module is None:
+        raise SystemExit(f"{path.name} is not a model (state_dict only?); save the full module or TorchScript")
+    return module
+
+
+def export(mode: str, module, sample: np.ndarray, output: Path, opset: int) -> List[str]:
+    """Export to ONNX with dynamic axes, verify against PyTorch; returns output names"""
+    import torch
+    import onnxruntime as ort
+    
+    batch = torch.from_numpy(sample[None])
+    with torch.inference_mode():
+        reference = module(batch)
+    references = list(reference) if isinstance(reference, (tuple, list)) else [reference]
+    output_names = [f"output_{i}" for i in range(len(references))]
+    
+    dynamic_axes = {'input': {0: 'batch', 2: 'height', 3: 'width'}}
+    dynamic_axes.update({name: {0: 'batch'} for name in output_names})
+    torch.onnx.export(
+        module, (batch,), str(output),
+        input_names=['input'], output_names=output_names,
+        dynamic_axes=dynamic_axes, opset_version=opset
+    )
+    
+    session = ort.InferenceSession(str(output), providers=['CPUExecutionProvider'])
+    for name, expected, actual in zip(output_names, references, session.run(None, {'input': sample[None]})):
+        expected = expected.detach().cpu().numpy()
+        error = float(np.abs(expected - actual).max() / (np.abs(expected).max() or 1.0))
+        status = '✅' if error <= EXPORT_TOLERANCE else '⚠️'
+        print(f"  {status} {mode} {name}: max relative error {error:.2e}")
+    return output_names
+
+
+def quantize(model: Path, output: Path, inputs: List[np.ndarray]):
+    """Static INT8 quantization (QDQ, per-channel weights) calibrated on `inputs`"""
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._inputs = iter(inputs)
+        
+        def get_next(self):
+            array = next(self._inputs, None)
+            return None if array is None else {'input': array[None]}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference + graph cleanup before quantization
+        prepared = Path(tmp) / 'prepared.onnx'
+        quant_pre_process(str(model), str(prepared))
+        quantize_static(
+            str(prepared), str(output), FrameReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=list(DETECTORS), default=list(DETECTORS))
+    parser.add_argument('--int8', action='store_true', help="Also write <name>.int8.onnx (static INT8)")
+    parser.add_argument('--calibration-dir', type=Path, default=SERVICE_DIR / "test_images")
+    parser.add_argument('--calibration-limit', type=int, default=64, help="Max calibration images")
+    parser.add_argument('--size', type=int, default=1024, help="Analysis frame size (as served)")
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+    
+    try:
+        import torch  # noqa: F401
+        import onnx  # noqa: F401
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise SystemExit(f"Export needs torch, onnx and onnxruntime: {e}")
+    
+    print("📦 ONNX export")
+    inputs = calibration_inputs(args.calibration_dir, args.size, args.calibration_limit)
+    print(f"   {len(inputs)} calibration frame(s) from {args.calibration_dir}")
+    
+    exported = 0
+    for mode in args.modes:
+        pth = Path(settings.MODELS_DIR) / getattr(settings, DETECTORS[mode].weights_setting)
+        if not pth.is_file():
+            print(f"  - {mode}: no weights ({pth.name}), skipped")
+            continue
+        
+        onnx_path = backend_path(str(pth), 'onnx')
+        export(mode, load_module(pth), inputs[0], onnx_path, args.opset)
+        print(f"  ✅ {mode}: {onnx_path.name}")
+        
+        if args.int8:
+            int8_path = backend_path(str(pth), 'onnx-int8')
+            quantize(onnx_path, int8_path, inputs)
+            print(f"  ✅ {mode}: {int8_path.name}")
+        exported += 1
+    
+    print(f"Done: {exported} model(s) exported")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Production launcher configuration
+    gunicorn -c gunicorn.conf.py main:app
+
+The master process imports the app (preload_app) and loads the detector
+models and color LUT once (main.preload_shared_state), then forks the
+workers. Workers share those pages copy-on-write instead of each holding
+its own copy, so every core can serve requests without multiplying memory
+by the worker count. Each worker's analysis and inference threads default
+to its share of the cores (api.core.config), not a thread per core.
+
+Workers are recycled:
+- after GUNICORN_MAX_REQUESTS requests (with jitter, so they do not all
+  restart at once);
+- when they stop heartbeating for GUNICORN_TIMEOUT seconds (hung event loop);
+- when their private memory (pages no longer shared with the master)
+  exceeds WORKER_MAX_PRIVATE_MB.
+
+Environment:
+    WEB_CONCURRENCY            Worker processes (default: one per CPU core)
+    GUNICORN_BIND              Listen address (default 0.0.0.0:8000)
+    GUNICORN_MAX_REQUESTS      Requests before a worker is recycled (0 = never)
+    GUNICORN_TIMEOUT           Heartbeat timeout in seconds
+    WORKER_MAX_PRIVATE_MB      Private memory limit per worker (0 = no limit)
+"""
+import gc
+import os
+import signal
+import threading
+import time
+
+_cores = os.cpu_count() or 1
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 0)) or _cores
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# Load models/LUTs in the master, fork workers afterwards
+preload_app = True
+
+# Recycling
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+WORKER_MAX_PRIVATE_MB = int(os.environ.get('WORKER_MAX_PRIVATE_MB', 0))
+MEMORY_CHECK_SECONDS = 30
+
+
+def when_ready(server):
+    """Master, after the app was imported and before workers are forked"""
+    import main
+    main.preload_shared_state()
+    
+    # Move everything allocated so far out of the garbage collector's
+    # reach, so collections in the workers do not write to (and copy) the
+    # shared pages
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Shared state preloaded in master (pid {os.getpid()}), forking {workers} workers")
+
+
+def _private_memory_mb() -> float:
+    """Memory of this process that is not shared with other processes (MB)"""
+    private = 0
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    private += int(line.split()[1])  # kB
+    except OSError:
+        return 0.0
+    return private / 1024
+
+
+def _watch_memory(worker):
+    while True:
+        time.sleep(MEMORY_CHECK_SECONDS)
+        private_mb = _private_memory_mb()
+        if private_mb > WORKER_MAX_PRIVATE_MB:
+            worker.log.warning(
+                f"Worker {worker.pid} uses {private_mb:.0f} MB private memory "
+                f"(limit {WORKER_MAX_PRIVATE_MB} MB) - recycling"
+            )
+            # Graceful shutdown; the master forks a replacement
+            os.kill(worker.pid, signal.SIGTERM)
+            return
+
+
+def post_worker_init(worker):
+    """Worker, after fork"""
+    if WORKER_MAX_PRIVATE_MB > 0:
+        threading.Thread(target=_watch_memory, args=(worker,), name='memory-watchdog', daemon=True).start()
@@ -4,14 +4,23 @@ FastAPI backend for skin analysis using computer vision and ML
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
+import cv2
 import uvicorn
 
-from api.routers import spots, wrinkles, texture, pores, multi_mode, uv_spots, brown_spots, red_areas, porphyrins, visualize
+from api.routers import spots, wrinkles, texture, pores, multi_mode, uv_spots, brown_spots, red_areas, porphyrins, visualize, batch
 from api.core.config import settings
-from api.core.model_loader import ModelLoader
+from api.core.model_loader import ModelLoader, DETECTORS
+from api.core.executor import get_executor, run_in_worker, shutdown_executor
+from api.core.inference import close_batchers
+from api.core.warmup import run_warmup, get_warmup_state
+from api.core.result_cache import get_result_cache
+from api.core.metrics import registry as metrics_registry
+from api.core.timing import StageTimingMiddleware
+from api.utils.color_lut import get_color_lut
 
 # Configure logging
 logging.basicConfig(
@@ -22,38 +31,70 @@ logger = logging.getLogger(__name__)
 
 # Global model loader
 model_loader = None
+warmup_task = None
+
+# Routers that run detectors (each gets the model loader on startup)
+MODEL_ROUTERS = (spots, wrinkles, texture, pores, uv_spots, brown_spots, red_areas, porphyrins, multi_mode, visualize, batch)
+
+
+def preload_shared_state():
+    """
+    Load the models and lookup tables before workers are forked (gunicorn
+    master with preload_app, see gunicorn.conf.py)
+    
+    Forked workers inherit them copy-on-write and skip loading in lifespan.
+    No threads may be left running here: they do not survive a fork.
+    """
+    global model_loader
+    
+    # OpenCV's thread pool is created on first parallel use; keep it out
+    # of the master so every worker starts its own
+    cv2_threads = cv2.getNumThreads()
+    cv2.setNumThreads(0)
+    try:
+        model_loader = ModelLoader()
+        asyncio.run(model_loader.load_all_models())
+        get_color_lut()
+    finally:
+        shutdown_executor()
+        cv2.setNumThreads(cv2_threads)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Load ML models on startup, cleanup on shutdown"""
-    global model_loader
+    global model_loader, warmup_task
     
     logger.info("🚀 Starting Beauty AI Analysis Service...")
     logger.info(f"📝 Version: {settings.API_VERSION}")
     logger.info(f"🔧 Environment: {'Production' if settings.USE_GPU else 'Development (CPU)'}")
     
-    # Load all ML models
+    # Load the preloaded ML models (PRELOAD_MODES; the rest load on first use)
     try:
-        model_loader = ModelLoader()
-        await model_loader.load_all_models()
+        if model_loader is not None and model_loader.is_loaded:
+            logger.info("📦 Using models preloaded by the master process")
+        else:
+            model_loader = ModelLoader()
+            await model_loader.load_all_models()
         
         # Inject model loader into routers
-        spots.set_model_loader(model_loader)
-        wrinkles.set_model_loader(model_loader)
-        texture.set_model_loader(model_loader)
-        pores.set_model_loader(model_loader)
-        uv_spots.set_model_loader(model_loader)
-        brown_spots.set_model_loader(model_loader)
-        red_areas.set_model_loader(model_loader)
-        porphyrins.set_model_loader(model_loader)
-        multi_mode.set_model_loader(model_loader)
-        visualize.set_model_loader(model_loader)
+        for router_module in MODEL_ROUTERS:
+            router_module.set_model_loader(model_loader)
         
-        logger.info("✅ All models loaded successfully!")
-        logger.info(f"🌐 Server ready at http://0.0.0.0:8000")
-        logger.info(f"📚 API docs at http://0.0.0.0:8000/docs")
+        # Start the worker pool that runs detectors off the event loop
+        get_executor()
         
+        # Build or memory-map the color class LUT before the first request
+        await run_in_worker(get_color_lut)
+        
+        # Warm up in the background: /health answers right away, /ready
+        # once every preloaded mode has run on the synthetic images
+        warmup_task = asyncio.create_task(run_warmup(model_loader))
+        
+        logger.info("✅ Startup complete!")
+        logger.info(f"🌐 Server listening at http://0.0.0.0:8000 (ready after warmup, see /ready)")
+        logger.info(f"📚 API docs at http://0.0.0.0:8000/docs")
+    
     except Exception as e:
         logger.error(f"❌ Failed to load models: {e}")
         raise
@@ -62,6 +103,10 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     logger.info("🛑 Shutting down Beauty AI Analysis Service...")
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await close_batchers()
+    shutdown_executor()
 
 
 # Initialize FastAPI app
@@ -84,6 +129,8 @@ app = FastAPI(
     
     **Multi-Mode Analysis** - Run all 8 modes in parallel for comprehensive assessment
     
+    **Batch Analysis** - Analyze a whole session of photos in one request
+    
     **Technologies:**
     - FastAPI for high-performance API
     - OpenCV 4.x with multi-spectral color space analysis (LAB, HSV, YCrCb)
@@ -104,8 +151,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage timing (Server-Timing header + /metrics histograms)
+app.add_middleware(StageTimingMiddleware)
+
 
 # Root endpoint
 @app.get("/", tags=["Health"])
@@ -119,6 +170,8 @@ async def root():
         "endpoints": {
             "docs": "/docs",
             "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics",
             "spots": "/api/analyze/spots",
             "wrinkles": "/api/analyze/wrinkles",
             "texture": "/api/analyze/texture",
@@ -128,6 +181,8 @@ async def root():
             "red_areas": "/api/analyze/red-areas",
             "porphyrins": "/api/analyze/porphyrins",
             "multi_mode": "/api/analyze/multi-mode",
+            "multi_mode_stream": "/api/analyze/multi-mode/stream",
+            "batch": "/api/analyze/batch",
             "visualize_multi": "/api/visualize/multi-mode",
             "visualize_single": "/api/visualize/single-mode/{mode}"
         }
@@ -136,24 +191,43 @@ async def root():
 
 @app.get("/health", tags=["Health"])
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness: the process is up)"""
     return {
         "status": "healthy",
         "version": settings.API_VERSION,
+        # Detectors currently in memory (modes not preloaded load on first use)
         "models": {
-            "spots": model_loader.spots_model is not None if model_loader else False,
-            "wrinkles": model_loader.wrinkles_model is not None if model_loader else False,
-            "texture": model_loader.texture_model is not None if model_loader else False,
-            "pores": model_loader.pores_model is not None if model_loader else False,
-            "uv_spots": model_loader.uv_spots_model is not None if model_loader else False,
-            "brown_spots": model_loader.brown_spots_model is not None if model_loader else False,
-            "red_areas": model_loader.red_areas_model is not None if model_loader else False,
-            "porphyrins": model_loader.porphyrins_model is not None if model_loader else False,
+            mode: mode in model_loader.models for mode in DETECTORS
         } if model_loader else {},
-        "device": model_loader.device if model_loader else "unknown"
+        "device": model_loader.device if model_loader else "unknown",
+        "result_cache": get_result_cache().stats()
     }
 
 
+@app.get("/ready", tags=["Health"])
+async def readiness_check():
+    """
+    Readiness probe: 200 once models are loaded and the startup warmup has
+    finished (also if it failed after its retries), 503 before. Includes
+    warmup timings and any warmup error.
+    """
+    warmup = get_warmup_state()
+    ready = bool(model_loader and model_loader.is_loaded) and warmup.ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "warmup": warmup.report()}
+    )
+
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage and per-request duration histograms, result cache counters"""
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # Include routers
 app.include_router(
     spots.router, 
@@ -200,6 +274,11 @@ app.include_router(
     prefix="/api/analyze", 
     tags=["Multi-Mode Analysis"]
 )
+app.include_router(
+    batch.router, 
+    prefix="/api/analyze", 
+    tags=["Batch Analysis"]
+)
 app.include_router(
     visualize.router, 
     prefix="/api", 
@@ -226,7 +305,8 @@ async def internal_error_handler(request, exc):
 
 
 if __name__ == "__main__":
-    # Run with: python main.py
+    # Development server: python main.py (auto-reload, one process)
+    # Production: gunicorn -c gunicorn.conf.py main:app
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -2,6 +2,7 @@
 Test script for visualization endpoints
 """
 import requests
+import json
 import os
 import time
 
@@ -87,6 +88,42 @@ def test_single_mode_visualization(mode: str):
         print(f"   Response: {response.text}")
         return False
 
+def test_from_results_without_dimensions():
+    """Results whose modes are all null must be rejected (422), not hang"""
+    print("\n🧪 Testing From-Results Visualization with empty results...")
+    
+    results = {
+        "success": True,
+        "overall_score": 50,
+        "processing_time_ms": 1,
+        "spots": None,
+        "wrinkles": None,
+        "texture": None,
+        "pores": None,
+        "uv_spots": None,
+        "brown_spots": None,
+        "red_areas": None,
+        "porphyrins": None
+    }
+    
+    image_path = "test_images/face_sample.jpg"
+    with open(image_path, "rb") as f:
+        files = {"file": ("face_sample.jpg", f, "image/jpeg")}
+        response = requests.post(
+            f"{API_URL}/api/visualize/from-results",
+            files=files,
+            data={"results": json.dumps(results)},
+            timeout=30
+        )
+    
+    if response.status_code == 422:
+        print(f"✅ Empty results rejected: {response.json().get('detail')}")
+        return True
+    else:
+        print(f"❌ FAILED: expected 422, got {response.status_code}")
+        print(f"   Response: {response.text}")
+        return False
+
 if __name__ == "__main__":
     print("=" * 60)
     print("VISUALIZATION ENDPOINT TEST")
@@ -113,10 +150,14 @@ if __name__ == "__main__":
     for mode in modes_to_test:
         results[mode] = test_single_mode_visualization(mode)
     
+    # Test from-results with no usable results
+    success_empty = test_from_results_without_dimensions()
+    
     # Summary
     print("\n" + "=" * 60)
     print("TEST SUMMARY")
     print("=" * 60)
     print(f"Multi-mode: {'✅ PASS' if success_multi else '❌ FAIL'}")
+    print(f"From-results (empty): {'✅ PASS' if success_empty else '❌ FAIL'}")
     for mode, success in results.items():
         print(f"{mode}: {'✅ PASS' if success else '❌ FAIL'}")